@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Actualizador:
+    """
+    Hilo en segundo plano que ejecuta actualizar() cada intervalo segundos, o solo cuando se lo
+    despierta (por ejemplo desde un webhook) si el intervalo es 0. Las ejecuciones nunca se
+    solapan y un error en una de ellas queda registrado sin detener el hilo.
+    """
+
+    def __init__(self, actualizar, intervalo=120):
+        self.actualizar = actualizar
+        self.intervalo = intervalo
+        self._evento = threading.Event()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.ejecuciones = 0
+        self.errores = 0
+        self.ultima_ejecucion = None
+        self.ultima_duracion = None
+        self.ultimo_resultado = None
+
+    def iniciar(self):
+        """Inicia el hilo si no está corriendo en este proceso (tras un fork el hilo del padre no existe)"""
+        with self._lock:
+            if self.activo():
+                return
+            self._hilo = threading.Thread(target=self._ciclo, name="actualizador", daemon=True)
+            self._hilo.start()
+        if self.intervalo:
+            logger.info(f"Actualizador iniciado, revisión cada {self.intervalo} s")
+        else:
+            logger.info("Actualizador iniciado, solo se ejecuta al despertarlo")
+
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def despertar(self):
+        """Adelanta la próxima ejecución"""
+        self._evento.set()
+
+    def _ciclo(self):
+        while True:
+            inicio = time.monotonic()
+            try:
+                self.ultimo_resultado = self.actualizar()
+            except Exception as e:
+                self.errores += 1
+                logger.error(f"Error en la actualización en segundo plano: {str(e)}", exc_info=True)
+            self.ejecuciones += 1
+            self.ultima_ejecucion = time.time()
+            self.ultima_duracion = time.monotonic() - inicio
+            self._evento.wait(self.intervalo or None)
+            self._evento.clear()
+
+    def estadisticas(self):
+        return {
+            "activo": self.activo(),
+            "intervalo": self.intervalo,
+            "ejecuciones": self.ejecuciones,
+            "errores": self.errores,
+            "ultima_ejecucion": self.ultima_ejecucion,
+            "ultima_duracion": self.ultima_duracion,
+            "ultimo_resultado": self.ultimo_resultado,
+        }
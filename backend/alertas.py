@@ -0,0 +1,130 @@
+import logging
+
+import numpy as np
+
+from grilla import indices_cercanos, lista_sin_nan
+from ensamble import probabilidad_miembros
+
+logger = logging.getLogger(__name__)
+
+# Coeficientes de la aproximación de erf de Abramowitz y Stegun 7.1.26 (error < 1.5e-7)
+_P = 0.3275911
+_A = (0.254829592, -0.284496736, 1.421413741, -1.453152027, 1.061405429)
+
+
+def cdf_normal(z):
+    """Función de distribución normal estándar evaluada de forma vectorizada"""
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + _P * x)
+    polinomio = t * (_A[0] + t * (_A[1] + t * (_A[2] + t * (_A[3] + t * _A[4]))))
+    erf = 1.0 - polinomio * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+
+def umbrales_en_grilla(cubo_umbrales, latitudes, longitudes):
+    """Lleva el cubo de umbrales (return_period, lat, lon) a la grilla del pronóstico"""
+    longitudes = np.where(longitudes > 180, longitudes - 360, longitudes)
+    i = indices_cercanos(cubo_umbrales.lat, latitudes)
+    j = indices_cercanos(cubo_umbrales.lon, longitudes)
+    return cubo_umbrales.valores[:, i[:, None], j[None, :]]
+
+
+class RasterAlertas:
+    """
+    Probabilidad de excedencia de cada periodo de retorno y periodo de retorno excedido,
+    precalculados para toda la grilla y todos los plazos de una corrida.
+
+    Si se entregan los miembros del ensamble (forecast_period, number, lat, lon) la probabilidad
+    es la fracción de miembros que supera el umbral. Con solo media y desviación se supone una
+    distribución normal del caudal: P(Q > umbral) = 1 - Φ((umbral - media) / desviación).
+    """
+
+    def __init__(self, dataset, cubo_umbrales, horas, miembros=None):
+        media = self._grilla(dataset["mean_dis24"])
+        desviacion = self._grilla(dataset["std_dis24"])
+
+        self.horas = list(horas)
+        self.latitude = dataset["latitude"].values
+        self.longitude = dataset["longitude"].values
+        self.periodos = cubo_umbrales.periodos
+        umbrales = umbrales_en_grilla(cubo_umbrales, self.latitude, self.longitude)
+
+        # Dimensiones (forecast_period, return_period, latitude, longitude)
+        media = media[:, None]
+        desviacion = desviacion[:, None]
+        self.por_miembros = miembros is not None
+        if self.por_miembros:
+            probabilidad = probabilidad_miembros(miembros, umbrales)
+        else:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = (umbrales[None] - media) / desviacion
+                probabilidad = np.where(desviacion > 0, 1.0 - cdf_normal(z), (media > umbrales[None]).astype(float))
+        probabilidad = np.where(np.isnan(umbrales[None]) | np.isnan(media), np.nan, probabilidad)
+        self.probabilidad = probabilidad.astype(np.float32)
+
+        # Nivel de alerta: posición (desde 1) del mayor periodo de retorno superado por la media, 0 si ninguno
+        with np.errstate(invalid="ignore"):
+            excedidos = media >= umbrales[None]
+        ultimo = len(self.periodos) - np.argmax(excedidos[:, ::-1], axis=1)
+        self.nivel = np.where(excedidos.any(axis=1), ultimo, 0).astype(np.int8)
+        logger.info(f"Raster de alertas calculado: {self.probabilidad.shape}")
+
+    @staticmethod
+    def _grilla(variable):
+        if "forecast_reference_time" in variable.dims:
+            variable = variable.isel(forecast_reference_time=0)
+        return variable.transpose("forecast_period", "latitude", "longitude").values.astype(np.float64)
+
+    def periodo_excedido(self, nivel):
+        """Convierte niveles de alerta en el mayor periodo de retorno excedido (NaN si no hay)"""
+        periodos = np.concatenate([[np.nan], self.periodos])
+        return periodos[nivel]
+
+    def indices(self, lat, lon):
+        i = indices_cercanos(self.latitude, lat)
+        j = indices_cercanos(self.longitude, (np.asarray(lon, dtype=float) + 360) % 360)
+        return i, j
+
+    def consultar(self, lat, lon):
+        """Devuelve, por hora de pronóstico, la probabilidad de excedencia y el periodo de retorno excedido"""
+        i, j = self.indices(lat, lon)
+        probabilidades = lista_sin_nan(self.probabilidad[:, :, i, j])
+        periodos = lista_sin_nan(self.periodo_excedido(self.nivel[:, i, j]))
+        return {
+            hora: {
+                "probabilidad_excedencia": dict(zip(map(str, self.periodos.tolist()), probabilidad)),
+                "periodo_retorno_excedido": periodo,
+            }
+            for hora, probabilidad, periodo in zip(self.horas, probabilidades, periodos)
+        }
+
+    def columnas(self, lat, lon):
+        """
+        Igual que consultar pero en columnas: una fila por hora de pronóstico y, en la probabilidad,
+        una columna por periodo de retorno
+        """
+        i, j = self.indices(lat, lon)
+        return {
+            "periodos": self.periodos.tolist(),
+            "probabilidad_excedencia": lista_sin_nan(self.probabilidad[:, :, i, j]),
+            "periodo_retorno_excedido": lista_sin_nan(self.periodo_excedido(self.nivel[:, i, j])),
+        }
+
+    def capa(self, hora, periodo=None):
+        """
+        Capa de mapa para una hora de pronóstico: periodo de retorno excedido por celda y,
+        si se indica un periodo, la probabilidad de excederlo.
+        """
+        k = self.horas.index(hora)
+        capa = {
+            "hora": hora,
+            "metodo": "miembros" if self.por_miembros else "normal",
+            "latitude": self.latitude.tolist(),
+            "longitude": np.where(self.longitude > 180, self.longitude - 360, self.longitude).tolist(),
+            "periodo_retorno_excedido": lista_sin_nan(self.periodo_excedido(self.nivel[k])),
+        }
+        if periodo is not None:
+            r = int(np.flatnonzero(np.isclose(self.periodos, periodo))[0])
+            capa["periodo"] = float(self.periodos[r])
+            capa["probabilidad_excedencia"] = lista_sin_nan(self.probabilidad[k, r])
+        return capa
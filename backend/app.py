@@ -1,15 +1,75 @@
 import xarray as xr
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-from flask import Flask, request, jsonify
+import hmac
+import time
+import hashlib
+import tempfile
+import threading
+from flask import Flask, Response, g, request, jsonify
 import logging
 from flask_cors import CORS
 import numpy as np
 
+from cache_datasets import CacheDatasets
+from umbrales import CuboUmbrales
+from grilla import horas_pronostico, indices_cercanos, lista_sin_nan, normalizar_longitud
+from alertas import RasterAlertas
+from ensamble import PERCENTILES_DEFECTO, miembros_en_grilla, percentiles_punto
+from historico import NOMBRE_HISTORICO, ArchivoHistorico
+from tabla_zonas import TablaZonas
+from teselas import RAMPAS, CacheTeselas, CapaRaster, version_capa
+from indice_regiones import IndiceRegiones, cargar_regiones
+from actualizador import Actualizador
+from rios import IndiceRios
+from metricas import metricas
+from respuestas import codificacion_aceptada, comprimir, fecha_corrida, no_modificado, versionar
+
 # Configuración
 GITHUB_REPO = "alimunozq/InundacionNetCDF"
 GITHUB_TOKEN = os.getenv("MY_GITHUB_PAT")
-CARPETAS = {"download": "download", "FloodThreshold": "FloodThreshold"}
+CARPETAS = {
+    "download": "download",
+    "FloodThreshold": "FloodThreshold",
+    "miembros": "miembros",
+    "historico": "historico",
+    "meteo": "frontend/public/coquimbo_meteo",
+    "zonas": "zonas",
+}
+# Rama de las carpetas que no se publican en la rama principal: el histórico se reescribe completo
+# en cada corrida y se publica en una rama propia que se reemplaza (ver downloadGLOFAS.py)
+RAMAS = {"historico": os.getenv("RAMA_HISTORICO", "historico")}
+# Extensión de los archivos de cada carpeta (por defecto NetCDF)
+EXTENSIONES = {"meteo": ".tif"}
+# Carpetas comunes a todas las regiones (los umbrales se distinguen por el sufijo _<región>.nc)
+CARPETAS_COMPARTIDAS = {"FloodThreshold"}
+# Regiones atendidas; los puntos fuera de todas se consultan en la primera
+REGIONES = cargar_regiones()
+REGION_DEFECTO = next(iter(REGIONES))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "inundacion_cache"))
+CACHE_MAX_MEMORIA = int(os.getenv("CACHE_MAX_MEMORIA", "16"))
+CACHE_MAX_DISCO = int(os.getenv("CACHE_MAX_DISCO", "64"))
+LISTADO_TTL = int(os.getenv("LISTADO_TTL", "300"))  # Segundos que se reutiliza un listado de GitHub
+UMBRALES_DIR = os.getenv("UMBRALES_DIR")  # Carpeta local opcional con los NetCDF de umbrales
+PRECARGAR = os.getenv("PRECARGAR", "1") == "1"
+HISTORICO_MAX_CORRIDAS = int(os.getenv("HISTORICO_MAX_CORRIDAS", "365"))
+LOTE_MAX_PUNTOS = int(os.getenv("LOTE_MAX_PUNTOS", "1000"))
+TESELAS_DIR = os.getenv("TESELAS_DIR", os.path.join(tempfile.gettempdir(), "inundacion_teselas"))
+TESELAS_MAX_MEMORIA = int(os.getenv("TESELAS_MAX_MEMORIA", "2048"))
+TESELAS_ZOOM_MAX = int(os.getenv("TESELAS_ZOOM_MAX", "14"))
+HTTP_CONEXIONES = int(os.getenv("HTTP_CONEXIONES", "16"))  # Conexiones reutilizables por host
+# Segundos entre revisiones de nuevas corridas en segundo plano (0: solo al recibir el webhook)
+ACTUALIZAR_INTERVALO = int(os.getenv("ACTUALIZAR_INTERVALO", "120"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Secreto del webhook de GitHub (opcional)
+# Ajuste de los puntos consultados al río cercano más relevante, según el umbral de RIO_PERIODO años.
+# Desactivado por defecto: cada consulta lo pide con ?ajustar_rio=1 y la respuesta trae en
+# ajuste_rio las coordenadas de la celda consultada
+AJUSTAR_RIO = os.getenv("AJUSTAR_RIO", "0") == "1"
+RIO_RADIO_KM = float(os.getenv("RIO_RADIO_KM", "8"))
+RIO_CAUDAL_MINIMO = float(os.getenv("RIO_CAUDAL_MINIMO", "1"))  # m3/s para considerar una celda como río
+RIO_PERIODO = float(os.getenv("RIO_PERIODO", "2"))
 
 app = Flask(__name__)
 
@@ -33,56 +93,109 @@ CORS(app, resources={
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def obtener_archivos(carpeta, obtener_todos=False):
+# Sesión HTTP compartida por todos los hilos: reutiliza las conexiones TLS con GitHub y
+# reintenta los errores transitorios del servidor
+sesion_http = requests.Session()
+sesion_http.mount("https://", HTTPAdapter(
+    pool_connections=HTTP_CONEXIONES,
+    pool_maxsize=HTTP_CONEXIONES,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"]),
+))
+
+# Listados de GitHub recientes: ruta de la carpeta -> (instante, archivos .nc ordenados)
+_listados = {}
+_listados_lock = threading.Lock()
+# Carpetas cuyo listado se está actualizando: mientras tanto los demás hilos usan el anterior
+_actualizando = set()
+
+indice_regiones = IndiceRegiones(REGIONES)
+
+def region_de_punto(lat, lon):
+    """Región del registro que contiene el punto (la región por defecto si ninguna lo contiene)"""
+    return indice_regiones.region(lat, lon) or REGION_DEFECTO
+
+def ruta_carpeta(carpeta, region=REGION_DEFECTO):
+    """Ruta en el repositorio de una carpeta de datos de la región"""
+    prefijo = REGIONES[region]["prefijo"].strip("/")
+    if not prefijo or carpeta in CARPETAS_COMPARTIDAS:
+        return CARPETAS[carpeta]
+    return f"{prefijo}/{CARPETAS[carpeta]}"
+
+def listar_carpeta(carpeta, ruta):
+    """Archivos de la carpeta en GitHub con la extensión que corresponde, del más reciente al más antiguo"""
+    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{ruta}"
+    headers = {
+        "Authorization": f"token {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github.v3+json",
+    }
+
+    logger.info(f"Solicitando archivos de: {url}")
+    with metricas.etapa("listado_github"):
+        response = sesion_http.get(url, headers=headers, params={"ref": RAMAS[carpeta]} if carpeta in RAMAS else None, timeout=10)
+    if response.status_code == 404:
+        # La carpeta no existe (por ejemplo, miembros/ con GUARDAR_MIEMBROS=0): listado vacío
+        return []
+    response.raise_for_status()
+
+    archivos = response.json()
+    extension = EXTENSIONES.get(carpeta, ".nc")
+    archivos_nc = [archivo for archivo in archivos if isinstance(archivo, dict) and archivo.get("name", "").endswith(extension)]
+    archivos_nc.sort(key=lambda x: x.get("name", ""), reverse=True)
+    return archivos_nc
+
+def obtener_archivos(carpeta, obtener_todos=False, region=REGION_DEFECTO):
+    ruta = None
+    actualizando = False
     try:
         if carpeta not in CARPETAS:
             logger.error(f"Carpeta inválida: {carpeta}")
             return []
+        ruta = ruta_carpeta(carpeta, region)
 
-        url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{CARPETAS[carpeta]}"
-        headers = {
-            "Authorization": f"token {GITHUB_TOKEN}",
-            "Accept": "application/vnd.github.v3+json",
-        }
-        
-        logger.info(f"Solicitando archivos de: {url}")
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        archivos = response.json()
-        archivos_nc = [archivo for archivo in archivos if isinstance(archivo, dict) and archivo.get("name", "").endswith(".nc")]
+        with _listados_lock:
+            listado = _listados.get(ruta)
+            # Con el actualizador en marcha los listados los renueva él, junto con los datasets
+            vigente = listado and (
+                (ACTUALIZAR_INTERVALO > 0 and actualizador.activo())
+                or time.monotonic() - listado[0] < LISTADO_TTL
+            )
+            if listado and (vigente or ruta in _actualizando):
+                archivos_nc = listado[1]
+                return archivos_nc if obtener_todos else archivos_nc[:1]
+            _actualizando.add(ruta)
+            actualizando = True
 
+        archivos_nc = listar_carpeta(carpeta, ruta)
+        # También se guarda el listado vacío, para no volver a consultar GitHub hasta que venza
+        with _listados_lock:
+            _listados[ruta] = (time.monotonic(), archivos_nc)
         if not archivos_nc:
-            logger.warning(f"No se encontraron archivos .nc en {carpeta}")
+            extension = EXTENSIONES.get(carpeta, ".nc")
+            logger.warning(f"No se encontraron archivos {extension} en {carpeta}")
             return []
-
-        archivos_nc.sort(key=lambda x: x.get("name", ""), reverse=True)
         return archivos_nc if obtener_todos else [archivos_nc[0]]
 
     except Exception as e:
         logger.error(f"Error al obtener archivos de {carpeta}: {str(e)}")
+        # Si GitHub no responde se reutiliza el último listado conocido
+        with _listados_lock:
+            listado = _listados.get(ruta)
+        if listado:
+            return listado[1] if obtener_todos else listado[1][:1]
         return []
+    finally:
+        if actualizando:
+            with _listados_lock:
+                _actualizando.discard(ruta)
     
-def convert_numpy_types(obj):
-    """Convierte tipos numpy a tipos nativos de Python para serialización JSON"""
-    if isinstance(obj, (np.int32, np.int64)):
-        return int(obj)
-    elif isinstance(obj, (np.float32, np.float64)):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {str(k) if isinstance(k, (np.int32, np.int64)) else k: convert_numpy_types(v) for k, v in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [convert_numpy_types(x) for x in obj]
-    return obj
-
 def descargar_archivo(url, ruta_local):
     try:
         logger.info(f"Descargando archivo desde: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        with open(ruta_local, "wb") as file:
-            file.write(response.content)
+        with metricas.etapa("descarga"), sesion_http.get(url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            with open(ruta_local, "wb") as file:
+                for bloque in response.iter_content(chunk_size=1 << 20):
+                    file.write(bloque)
             
         logger.info(f"Archivo descargado: {ruta_local}")
         return True
@@ -90,6 +203,123 @@ def descargar_archivo(url, ruta_local):
         logger.error(f"Error al descargar {url}: {str(e)}")
         return False
 
+cache_datasets = CacheDatasets(
+    CACHE_DIR,
+    descargar_archivo,
+    max_memoria=CACHE_MAX_MEMORIA,
+    max_disco=CACHE_MAX_DISCO,
+)
+
+# Cubo de umbrales vigente de cada región y la versión de archivos con que se construyó
+_umbrales = {region: {"clave": None, "cubo": None, "rios": None} for region in REGIONES}
+_umbrales_lock = threading.Lock()
+
+def _datasets_umbrales(region=REGION_DEFECTO):
+    """Devuelve (clave de versión, {nombre: dataset}) de los archivos de umbrales de la región"""
+    sufijo = f"_{region}.nc"
+    if UMBRALES_DIR:
+        nombres = sorted(f for f in os.listdir(UMBRALES_DIR) if f.endswith(sufijo))
+        clave = ("local",) + tuple(nombres)
+        if clave == _umbrales[region]["clave"]:
+            return clave, None
+        datasets = {}
+        for nombre in nombres:
+            dataset = leer_nc(os.path.join(UMBRALES_DIR, nombre))
+            if dataset is not None:
+                datasets[nombre] = dataset.load()
+                dataset.close()
+        return clave, datasets
+
+    archivos = [a for a in obtener_archivos("FloodThreshold", obtener_todos=True) if a["name"].endswith(sufijo)]
+    clave = tuple((archivo["name"], archivo["sha"]) for archivo in archivos)
+    if clave == _umbrales[region]["clave"]:
+        return clave, None
+    datasets = {}
+    for archivo in archivos:
+        dataset = cache_datasets.obtener(archivo)
+        if dataset is not None:
+            datasets[archivo["name"]] = dataset
+    return clave, datasets
+
+def obtener_cubo_umbrales(region=REGION_DEFECTO):
+    """
+    Devuelve el cubo de umbrales de la región, reconstruyéndolo solo cuando cambian los archivos.
+    El listado y la construcción se hacen fuera del candado, que solo protege la comparación de
+    versiones y el reemplazo: mientras se renueva un listado los demás hilos siguen respondiendo.
+    """
+    vigente = _umbrales[region]
+    clave, datasets = _datasets_umbrales(region)
+    if datasets is None:
+        return vigente["cubo"]
+    if not datasets:
+        logger.warning(f"No se pudieron cargar archivos de umbrales de {region}")
+        return vigente["cubo"]
+
+    cubo = CuboUmbrales(datasets)
+    rios = construir_indice_rios(cubo)
+    with _umbrales_lock:
+        if vigente["clave"] != clave:
+            vigente["cubo"], vigente["rios"], vigente["clave"] = cubo, rios, clave
+        return vigente["cubo"]
+
+def construir_indice_rios(cubo_umbrales):
+    """
+    Índice de ríos sobre la grilla de umbrales. El umbral de RIO_PERIODO años (o el del menor
+    periodo disponible) sirve como caudal de referencia de cada celda: crece con el área aportante.
+    """
+    coincidencias = np.flatnonzero(np.isclose(cubo_umbrales.periodos, RIO_PERIODO))
+    r = int(coincidencias[0]) if coincidencias.size else int(np.argmin(cubo_umbrales.periodos))
+    return IndiceRios(
+        cubo_umbrales.lat,
+        cubo_umbrales.lon,
+        cubo_umbrales.valores[r],
+        radio_km=RIO_RADIO_KM,
+        minimo=RIO_CAUDAL_MINIMO,
+    )
+
+def ajustar_a_rio(lats, lons, region=REGION_DEFECTO):
+    """
+    Ajusta los puntos al río más relevante dentro de RIO_RADIO_KM. Devuelve (lats, lons, ajustes)
+    con las coordenadas a consultar y, por punto, {"lat", "lon", "caudal_referencia"} o None.
+    """
+    if obtener_cubo_umbrales(region) is None or _umbrales[region]["rios"] is None:
+        return np.asarray(lats, dtype=float), np.asarray(lons, dtype=float), [None] * len(lats)
+    lats_rio, lons_rio, ajustado, relevancia = _umbrales[region]["rios"].ajustar(lats, lons)
+    ajustes = [
+        {"lat": la, "lon": lo, "caudal_referencia": rel} if ok else None
+        for la, lo, ok, rel in zip(lats_rio.tolist(), lons_rio.tolist(), ajustado.tolist(), relevancia.tolist())
+    ]
+    return lats_rio, lons_rio, ajustes
+
+def ajustar_punto(lat, lon, region=REGION_DEFECTO, ajustar=True):
+    """Versión para un punto: devuelve (lat, lon, ajuste) con las coordenadas a consultar"""
+    if not ajustar:
+        return lat, lon, None
+    lats_rio, lons_rio, ajustes = ajustar_a_rio([lat], [lon], region)
+    if ajustes[0] is None:
+        return lat, lon, None
+    return float(lats_rio[0]), float(lons_rio[0]), ajustes[0]
+
+def leer_ajuste_rio():
+    """Indica si se ajustan los puntos al río (?ajustar_rio=0/1, por defecto AJUSTAR_RIO)"""
+    valor = request.args.get('ajustar_rio', '1' if AJUSTAR_RIO else '0')
+    if valor not in ('0', '1'):
+        raise ValueError(f"ajustar_rio inválido: {valor}, opciones: ['0', '1']")
+    return valor == '1'
+
+def leer_coordenada(nombre):
+    """Coordenada ?lat= o ?lon= como número; el error indica qué parámetro falta o no es válido"""
+    valor = request.args.get(nombre)
+    if valor is None:
+        raise ValueError(f"Falta el parámetro {nombre}")
+    try:
+        coordenada = float(valor)
+    except ValueError:
+        coordenada = np.nan
+    if not np.isfinite(coordenada):
+        raise ValueError(f"{nombre} inválida: {valor}")
+    return coordenada
+
 def leer_nc(ruta_archivo):
     try:
         if not os.path.exists(ruta_archivo):
@@ -132,6 +362,27 @@ def getValue(dataset, lat, lon):
         logger.error(f"Error al filtrar el dataset: {e}")
         return None
 
+def serie_pronostico(dataset, lat, lon):
+    """
+    Series de mean_dis24 y std_dis24 de un punto para todos los forecast_periods.
+    Devuelve (horas, medias, desviaciones) como arreglos; lanza KeyError si faltan las variables.
+    """
+    if 'mean_dis24' not in dataset or 'std_dis24' not in dataset:
+        raise KeyError("Dataset no contiene las variables requeridas")
+
+    # El punto más cercano se busca una sola vez y se extraen ambas series completas
+    i = indices_cercanos(dataset['latitude'].values, lat)
+    j = indices_cercanos(dataset['longitude'].values, normalizar_longitud(lon))
+    posicion = {'latitude': i, 'longitude': j, 'forecast_reference_time': 0, 'forecast_period': slice(None)}
+
+    horas = horas_pronostico(dataset['forecast_period'])
+    mean_var, std_var = dataset['mean_dis24'], dataset['std_dis24']
+    return (
+        horas,
+        mean_var.values[tuple(posicion[d] for d in mean_var.dims)],
+        std_var.values[tuple(posicion[d] for d in std_var.dims)],
+    )
+
 def getMeanStdForAllForecasts(dataset, lat, lon):
     """Obtiene los valores de mean_dis24 y std_dis24 para todos los forecast_periods"""
     try:
@@ -139,54 +390,416 @@ def getMeanStdForAllForecasts(dataset, lat, lon):
             logger.error("Dataset es None")
             return None, None
 
-        # Verificar variables requeridas
-        if 'mean_dis24' not in dataset or 'std_dis24' not in dataset:
+        horas, medias, desviaciones = serie_pronostico(dataset, lat, lon)
+        horas = horas.tolist()
+        return dict(zip(horas, medias.tolist())), dict(zip(horas, desviaciones.tolist()))
+
+    except Exception as e:
+        logger.error(f"Error en getMeanStdForAllForecasts: {str(e)}")
+        return None, None
+
+def getMeanStdForPoints(dataset, lats, lons):
+    """
+    Obtiene las series de mean_dis24 y std_dis24 de varios puntos con un solo isel vectorizado.
+    Devuelve (horas, medias, desviaciones) con arreglos de forma (puntos, forecast_period).
+    """
+    try:
+        if dataset is None or 'mean_dis24' not in dataset or 'std_dis24' not in dataset:
             logger.error("Dataset no contiene las variables requeridas")
-            return None, None
+            return None, None, None
 
-        # Obtener periodos de pronóstico
-        forecast_periods = dataset['forecast_period'].values
-        
-        # Convertir a horas (asumiendo que forecast_period está en nanosegundos)
-        forecast_hours = (forecast_periods / (1e9 * 60 * 60)).astype(int)
-        forecast_hours = [int(h) for h in forecast_hours]
+        i = indices_cercanos(dataset['latitude'].values, lats)
+        j = indices_cercanos(dataset['longitude'].values, normalizar_longitud(lons))
+        posicion = {
+            'latitude': xr.DataArray(i, dims='punto'),
+            'longitude': xr.DataArray(j, dims='punto'),
+        }
+        if 'forecast_reference_time' in dataset.dims:
+            posicion['forecast_reference_time'] = 0
 
-        mean_results = {}
-        std_results = {}
+        puntos = dataset[['mean_dis24', 'std_dis24']].isel(posicion).transpose('punto', 'forecast_period')
+        horas = horas_pronostico(dataset['forecast_period']).tolist()
+        return horas, puntos['mean_dis24'].values, puntos['std_dis24'].values
 
-        for fp, hours in zip(forecast_periods, forecast_hours):
-            try:
-                # Ajustar longitud
-                adjusted_lon = (lon + 360) % 360
-
-                # Obtener valores para mean_dis24
-                mean_val = dataset['mean_dis24'].sel(
-                    latitude=lat,
-                    longitude=adjusted_lon,
-                    forecast_period=fp,
-                    method="nearest"
-                ).values.item()
-
-                # Obtener valores para std_dis24
-                std_val = dataset['std_dis24'].sel(
-                    latitude=lat,
-                    longitude=adjusted_lon,
-                    forecast_period=fp,
-                    method="nearest"
-                ).values.item()
-
-                mean_results[hours] = float(mean_val)
-                std_results[hours] = float(std_val)
+    except Exception as e:
+        logger.error(f"Error en getMeanStdForPoints: {str(e)}")
+        return None, None, None
 
-            except Exception as e:
-                logger.error(f"Error procesando forecast_period {fp}: {str(e)}")
-                continue
+def obtener_dataset_pronostico(region=REGION_DEFECTO):
+    """Devuelve el dataset del pronóstico más reciente de la región desde el cache"""
+    archivo_download = obtener_archivos("download", region=region)
+    if not archivo_download:
+        return None
+    return cache_datasets.obtener(archivo_download[0])
+
+# Archivo histórico consolidado vigente de cada región y su SHA
+_historico = {region: {"sha": None, "archivo": None} for region in REGIONES}
+_historico_lock = threading.Lock()
+
+def obtener_historico(region=REGION_DEFECTO):
+    """Devuelve el archivo histórico consolidado de la región, abierto de forma perezosa desde el cache"""
+    archivos = [a for a in obtener_archivos("historico", obtener_todos=True, region=region) if a["name"] == NOMBRE_HISTORICO]
+    if not archivos:
+        return None
+    with _historico_lock:
+        vigente = _historico[region]
+        if archivos[0]["sha"] == vigente["sha"]:
+            return vigente["archivo"]
+        dataset = cache_datasets.obtener(archivos[0], en_memoria=False)
+        if dataset is None:
+            return vigente["archivo"]
+        vigente["archivo"] = ArchivoHistorico(dataset)
+        vigente["sha"] = archivos[0]["sha"]
+        return vigente["archivo"]
+
+# Tablas de estadísticas por zona vigentes: (región, capa) -> {"sha", "tabla"}
+_zonas = {}
+_zonas_lock = threading.Lock()
+
+def capas_zonas(region=REGION_DEFECTO):
+    """Archivos de las capas de zonas publicadas para la región: {capa: archivo}"""
+    return {a["name"][:-3]: a for a in obtener_archivos("zonas", obtener_todos=True, region=region)}
+
+def obtener_tabla_zonas(capa, region=REGION_DEFECTO):
+    """Tabla de estadísticas de una capa de zonas, cargada una vez por versión del archivo"""
+    archivo = capas_zonas(region).get(capa)
+    if archivo is None:
+        return None
+    with _zonas_lock:
+        vigente = _zonas.setdefault((region, capa), {"sha": None, "tabla": None})
+        if archivo["sha"] == vigente["sha"]:
+            return vigente["tabla"]
+        dataset = cache_datasets.obtener(archivo)
+        if dataset is None:
+            return vigente["tabla"]
+        vigente["tabla"] = TablaZonas(dataset)
+        vigente["sha"] = archivo["sha"]
+        return vigente["tabla"]
+
+def obtener_dataset_fecha(fecha, region=REGION_DEFECTO):
+    """
+    Devuelve la corrida de una fecha (YYYYMMDD). Se prefiere el archivo diario de download/,
+    pequeño y ya en cache; el histórico, fragmentado para series por punto, queda como respaldo.
+    """
+    for archivo in obtener_archivos("download", obtener_todos=True, region=region):
+        if archivo["name"] == f"{fecha}.nc":
+            return cache_datasets.obtener(archivo)
+    archivo_historico = obtener_historico(region)
+    return archivo_historico.por_fecha(fecha) if archivo_historico is not None else None
+
+def obtener_archivo_miembros(archivo_download, region=REGION_DEFECTO):
+    """Busca en miembros/ el archivo de la misma corrida que el pronóstico indicado"""
+    for archivo in obtener_archivos("miembros", obtener_todos=True, region=region):
+        if archivo["name"] == archivo_download["name"]:
+            return archivo
+    return None
+
+def obtener_dataset_miembros(region=REGION_DEFECTO):
+    """Devuelve el dataset con todos los miembros de la corrida más reciente, si se guardó"""
+    archivo_download = obtener_archivos("download", region=region)
+    if not archivo_download:
+        return None
+    archivo_miembros = obtener_archivo_miembros(archivo_download[0], region)
+    if archivo_miembros is None:
+        return None
+    return cache_datasets.obtener(archivo_miembros)
+
+# Raster de alertas de la corrida vigente de cada región y la versión de datos con que se calculó
+_alertas = {region: {"clave": None, "raster": None} for region in REGIONES}
+_alertas_lock = threading.Lock()
+
+def obtener_raster_alertas(region=REGION_DEFECTO):
+    """Devuelve el raster de alertas de la corrida más reciente, calculándolo una vez por corrida"""
+    archivo_download = obtener_archivos("download", region=region)
+    cubo_umbrales = obtener_cubo_umbrales(region)
+    if not archivo_download or cubo_umbrales is None:
+        return None
+
+    archivo_miembros = obtener_archivo_miembros(archivo_download[0], region)
+    clave = (
+        archivo_download[0]["name"],
+        archivo_download[0]["sha"],
+        archivo_miembros["sha"] if archivo_miembros else None,
+        _umbrales[region]["clave"],
+    )
+    with _alertas_lock:
+        vigente = _alertas[region]
+        if clave == vigente["clave"]:
+            return vigente["raster"]
+        dataset = cache_datasets.obtener(archivo_download[0])
+        if dataset is None:
+            return vigente["raster"]
+
+        # Con los miembros disponibles la probabilidad se calcula contando miembros
+        miembros = None
+        if archivo_miembros is not None:
+            dataset_miembros = cache_datasets.obtener(archivo_miembros)
+            if dataset_miembros is not None:
+                miembros = miembros_en_grilla(dataset_miembros)
+                forma = (dataset.sizes['forecast_period'], dataset.sizes['latitude'], dataset.sizes['longitude'])
+                if (miembros.shape[0],) + miembros.shape[2:] != forma:
+                    logger.warning("La grilla de miembros no coincide con la del pronóstico")
+                    miembros = None
+
+        horas = horas_pronostico(dataset['forecast_period']).tolist()
+        vigente["raster"] = RasterAlertas(dataset, cubo_umbrales, horas, miembros=miembros)
+        vigente["clave"] = clave
+        return vigente["raster"]
+
+cache_teselas = CacheTeselas(TESELAS_DIR, max_memoria=TESELAS_MAX_MEMORIA)
+
+# Capas de teselas vigentes: nombre -> (versión, CapaRaster)
+_capas = {}
+_capas_lock = threading.Lock()
+
+def obtener_capa(nombre, clave, construir):
+    """
+    Devuelve (nombre, versión, capa) reconstruyendo la capa solo cuando cambia la versión
+    de sus datos (corrida y SHA de los archivos de origen)
+    """
+    version = version_capa(clave)
+    with _capas_lock:
+        vigente = _capas.get(nombre)
+        if vigente is not None and vigente[0] == version:
+            return nombre, version, vigente[1]
+    capa = construir()
+    if capa is None:
+        return None
+    with _capas_lock:
+        _capas[nombre] = (version, capa)
+    return nombre, version, capa
+
+def capa_caudal(hora, region=REGION_DEFECTO):
+    """Caudal medio de la corrida más reciente para una hora de pronóstico"""
+    archivo_download = obtener_archivos("download", region=region)
+    if not archivo_download:
+        return None
+
+    def construir():
+        dataset = cache_datasets.obtener(archivo_download[0])
+        if dataset is None:
+            return None
+        horas = horas_pronostico(dataset['forecast_period']).tolist()
+        if hora not in horas:
+            raise ValueError(f"Hora no disponible, opciones: {horas}")
+        media = RasterAlertas._grilla(dataset['mean_dis24'])[horas.index(hora)]
+        return CapaRaster(dataset['latitude'].values, dataset['longitude'].values, media, RAMPAS["caudal"])
 
-        return mean_results, std_results
+    return obtener_capa(f"{region}_caudal_{hora}", (archivo_download[0]["name"], archivo_download[0]["sha"], hora), construir)
 
+def capa_umbral(periodo, region=REGION_DEFECTO):
+    """Caudal umbral de un periodo de retorno"""
+    cubo_umbrales = obtener_cubo_umbrales(region)
+    if cubo_umbrales is None:
+        return None
+    coincidencias = np.flatnonzero(np.isclose(cubo_umbrales.periodos, periodo))
+    if not coincidencias.size:
+        raise ValueError(f"Periodo no disponible, opciones: {cubo_umbrales.periodos.tolist()}")
+    r = int(coincidencias[0])
+
+    def construir():
+        return CapaRaster(cubo_umbrales.lat, cubo_umbrales.lon, cubo_umbrales.valores[r], RAMPAS["umbral"])
+
+    return obtener_capa(f"{region}_umbral_{periodo:g}", (_umbrales[region]["clave"], periodo), construir)
+
+def capa_alerta(hora, region=REGION_DEFECTO):
+    """Nivel de alerta (mayor periodo de retorno excedido) de la corrida más reciente"""
+    raster_alertas = obtener_raster_alertas(region)
+    if raster_alertas is None:
+        return None
+    if hora not in raster_alertas.horas:
+        raise ValueError(f"Hora no disponible, opciones: {raster_alertas.horas}")
+
+    def construir():
+        nivel = raster_alertas.nivel[raster_alertas.horas.index(hora)]
+        return CapaRaster(raster_alertas.latitude, raster_alertas.longitude, nivel, niveles=len(raster_alertas.periodos))
+
+    return obtener_capa(f"{region}_alerta_{hora}", (_alertas[region]["clave"], hora), construir)
+
+def capa_meteo(variable, plazo, region=REGION_DEFECTO):
+    """Precipitación (P<plazo>) o temperatura (T<plazo>) publicadas por descarga_meteorologico.py"""
+    letra = 'P' if variable == 'precipitacion' else 'T'
+    publicados = obtener_archivos("meteo", obtener_todos=True, region=region)
+    archivos = [a for a in publicados if a["name"] == f"{letra}{plazo}.tif"]
+    if not archivos:
+        # Los plazos dependen de PASOS_METEO en descarga_meteorologico.py
+        plazos = sorted(int(a["name"][1:-4]) for a in publicados if a["name"][0] == letra and a["name"][1:-4].isdigit())
+        if plazos:
+            raise ValueError(f"Plazo no disponible, opciones: {plazos}")
+        return None
+
+    def construir():
+        dataset = cache_datasets.obtener(archivos[0])
+        if dataset is None:
+            return None
+        banda = dataset['band_data'].isel(band=0)
+        return CapaRaster(banda['y'].values, banda['x'].values, banda.values, RAMPAS[variable])
+
+    return obtener_capa(f"{region}_{variable}_{plazo}", (archivos[0]["sha"],), construir)
+
+# Último commit del repositorio de datos revisado por el actualizador y su ETag
+_commit = {"sha": None, "etag": None}
+
+def commit_repositorio():
+    """
+    SHA del último commit del repositorio de datos, o None si no se pudo consultar. La consulta es
+    condicional (ETag), así que mientras no haya commits nuevos GitHub responde 304 sin descontarla
+    del límite de solicitudes.
+    """
+    headers = {
+        "Authorization": f"token {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github.sha",
+    }
+    if _commit["etag"]:
+        headers["If-None-Match"] = _commit["etag"]
+    try:
+        response = sesion_http.get(f"https://api.github.com/repos/{GITHUB_REPO}/commits/HEAD", headers=headers, timeout=10)
+        if response.status_code == 304:
+            return _commit["sha"]
+        response.raise_for_status()
+        _commit["etag"] = response.headers.get("ETag")
+        return response.text.strip()
     except Exception as e:
-        logger.error(f"Error en getMeanStdForAllForecasts: {str(e)}")
-        return None, None
+        logger.warning(f"No se pudo consultar el último commit: {str(e)}")
+        return None
+
+def precalentar(carpeta, archivos):
+    """Descarga y abre en el cache los archivos de la carpeta que usarán las consultas"""
+    if carpeta == "historico":
+        for archivo in archivos:
+            if archivo["name"] == NOMBRE_HISTORICO:
+                cache_datasets.obtener(archivo, en_memoria=False)
+    elif carpeta in ("download", "miembros"):
+        cache_datasets.obtener(archivos[0])
+    elif carpeta == "meteo":
+        # Solo las capas vigentes P<plazo>/T<plazo> que sirve capa_meteo, no los archivos antiguos
+        # de la carpeta, que desplazarían al pronóstico del cache en memoria
+        for archivo in archivos:
+            nombre = archivo["name"]
+            if nombre[0] in "PT" and nombre[1:-4].isdigit():
+                cache_datasets.obtener(archivo)
+    else:
+        # Umbrales de todas las regiones y tablas de zonas
+        for archivo in archivos:
+            cache_datasets.obtener(archivo)
+
+def actualizar_datos():
+    """
+    Revisa si hay corridas nuevas y, si las hay, deja listo todo lo que usarán las consultas antes
+    de que las vean: primero descarga y abre los archivos nuevos, luego reemplaza de una vez los
+    listados vigentes y por último reconstruye umbrales, alertas, histórico y zonas de cada región. Mientras
+    tanto las consultas siguen respondiendo con los datos anteriores.
+    """
+    commit = commit_repositorio()
+    if commit is not None and commit == _commit["sha"]:
+        return {"commit": commit, "carpetas_actualizadas": []}
+
+    nuevos = {}
+    for region in REGIONES:
+        for carpeta in CARPETAS:
+            ruta = ruta_carpeta(carpeta, region)
+            if ruta in nuevos:
+                continue
+            try:
+                nuevos[ruta] = (carpeta, listar_carpeta(carpeta, ruta))
+            except Exception as e:
+                logger.warning(f"No se pudo listar {ruta}: {str(e)}")
+
+    def firma(archivos):
+        return [(archivo["name"], archivo["sha"]) for archivo in archivos]
+
+    with _listados_lock:
+        anteriores = {ruta: listado[1] for ruta, listado in _listados.items()}
+    cambiados = [
+        ruta for ruta, (carpeta, archivos) in nuevos.items()
+        if archivos and firma(archivos) != firma(anteriores.get(ruta, []))
+    ]
+
+    if cambiados:
+        logger.info(f"Archivos nuevos en {cambiados}, precalentando datasets")
+        for ruta in cambiados:
+            carpeta, archivos = nuevos[ruta]
+            precalentar(carpeta, archivos)
+
+    # Los listados se reemplazan juntos para que ninguna consulta mezcle corridas (los vacíos
+    # también, así las carpetas que no existen no se vuelven a listar en cada consulta)
+    with _listados_lock:
+        for ruta, (carpeta, archivos) in nuevos.items():
+            _listados[ruta] = (time.monotonic(), archivos)
+
+    if cambiados:
+        for region in REGIONES:
+            obtener_cubo_umbrales(region)
+            obtener_raster_alertas(region)
+            obtener_historico(region)
+            for capa in capas_zonas(region):
+                obtener_tabla_zonas(capa, region)
+        logger.info("Datasets de la nueva corrida listos")
+
+    if len(nuevos) == len({ruta_carpeta(c, r) for r in REGIONES for c in CARPETAS}):
+        _commit["sha"] = commit
+    return {"commit": commit, "carpetas_actualizadas": cambiados}
+
+actualizador = Actualizador(actualizar_datos, intervalo=ACTUALIZAR_INTERVALO)
+
+def version_consulta(region, fecha=None):
+    """
+    Devuelve (versión, fecha de la corrida) de los datos con que se responde /consultar en la región:
+    los archivos de la corrida, sus miembros y los umbrales. Cambia solo cuando se publica algo nuevo.
+    """
+    if fecha is None:
+        corrida = obtener_archivos("download", region=region)
+        miembros = obtener_archivo_miembros(corrida[0], region) if corrida else None
+        archivos = corrida + ([miembros] if miembros else [])
+    else:
+        archivos = [a for a in obtener_archivos("download", obtener_todos=True, region=region) if a["name"] == f"{fecha}.nc"]
+        corrida = archivos or [{"name": f"{fecha}.nc"}]
+        if not archivos:
+            archivos = [a for a in obtener_archivos("historico", obtener_todos=True, region=region) if a["name"] == NOMBRE_HISTORICO]
+
+    if UMBRALES_DIR:
+        umbrales = [("local", nombre) for nombre in sorted(os.listdir(UMBRALES_DIR)) if nombre.endswith(f"_{region}.nc")]
+    else:
+        umbrales = [
+            (a["name"], a["sha"]) for a in obtener_archivos("FloodThreshold", obtener_todos=True)
+            if a["name"].endswith(f"_{region}.nc")
+        ]
+    version = (region, fecha, tuple((a["name"], a["sha"]) for a in archivos), tuple(umbrales))
+    return version, fecha_corrida(corrida[0]["name"]) if corrida else None
+
+def leer_region():
+    """Región indicada con ?region= (la región por defecto si no se indica)"""
+    region = request.args.get('region', REGION_DEFECTO)
+    if region not in REGIONES:
+        raise ValueError(f"Región no disponible, opciones: {list(REGIONES)}")
+    return region
+
+def leer_puntos(datos):
+    """
+    Extrae (lats, lons, ids) de una lista de coordenadas ({"lat", "lon"}), de {"puntos": [...]}
+    o de un FeatureCollection GeoJSON de puntos. Lanza ValueError si el formato no es válido.
+    """
+    if isinstance(datos, dict) and datos.get("type") == "FeatureCollection":
+        lats, lons, ids = [], [], []
+        for feature in datos.get("features", []):
+            geometria = feature.get("geometry") or {}
+            if geometria.get("type") != "Point":
+                raise ValueError("Solo se admiten geometrías de tipo Point")
+            lon, lat = geometria["coordinates"][:2]
+            lats.append(float(lat))
+            lons.append(float(lon))
+            ids.append(feature.get("id", (feature.get("properties") or {}).get("id")))
+        return lats, lons, ids
+
+    if isinstance(datos, dict):
+        datos = datos.get("puntos")
+    if not isinstance(datos, list):
+        raise ValueError("Se esperaba una lista de puntos o un FeatureCollection")
+
+    lats = [float(punto["lat"]) for punto in datos]
+    lons = [float(punto["lon"]) for punto in datos]
+    ids = [punto.get("id") for punto in datos]
+    return lats, lons, ids
 
 @app.route('/consultar', methods=['GET', 'OPTIONS'])
 def consultar():
@@ -201,59 +814,422 @@ def consultar():
         logger.info("Iniciando consulta")
         
         # Validar parámetros
+        try:
+            lat = leer_coordenada('lat')
+            lon = leer_coordenada('lon')
+            fecha = request.args.get('fecha')
+            if fecha is not None and not (len(fecha) == 8 and fecha.isdigit()):
+                raise ValueError(f"Fecha inválida: {fecha}, se espera YYYYMMDD")
+            formato = request.args.get('formato', 'diccionario')
+            if formato not in ('diccionario', 'columnas'):
+                raise ValueError(f"Formato inválido: {formato}, opciones: ['diccionario', 'columnas']")
+            ajustar = leer_ajuste_rio()
+            logger.info(f"Coordenadas recibidas: lat={lat}, lon={lon}")
+        except ValueError as e:
+            logger.error(f"Error en parámetros: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        # Los datos se buscan en la región que contiene el punto
+        region = region_de_punto(lat, lon)
+
+        # Si el cliente ya tiene la respuesta para esta versión de los datos no se recalcula
+        codificacion = codificacion_aceptada(request)
+        version, ultima_modificacion = version_consulta(region, fecha)
+        etag = version_capa((version, lat, lon, formato, ajustar, codificacion))
+        if no_modificado(request, etag, ultima_modificacion):
+            return versionar(Response(status=304), etag, ultima_modificacion, LISTADO_TTL)
+
+        # Un clic junto al río se consulta en la celda de río más relevante cercana
+        lat_datos, lon_datos, ajuste_rio = ajustar_punto(lat, lon, region, ajustar)
+
+        # Procesar archivo de pronóstico (el más reciente o, con fecha=YYYYMMDD, una corrida del histórico)
+        if fecha is None:
+            dataset = obtener_dataset_pronostico(region)
+        else:
+            dataset = obtener_dataset_fecha(fecha, region)
+            if dataset is None:
+                return jsonify({"error": f"No hay corrida para la fecha {fecha}"}), 404
+        cubo_umbrales = obtener_cubo_umbrales(region)
+        raster_alertas = obtener_raster_alertas(region) if fecha is None else None
+
+        inicio_seleccion = time.perf_counter()
+        if formato == "columnas":
+            # Arreglos paralelos en lugar de diccionarios indexados por hora o por archivo
+            response = {
+                "lat": lat, "lon": lon, "region": region, "ajuste_rio": ajuste_rio,
+                "horas": None, "dis24_mean": None, "dis24_std": None,
+            }
+            if dataset is not None:
+                try:
+                    horas, medias, desviaciones = serie_pronostico(dataset, lat_datos, lon_datos)
+                    response.update(horas=horas.tolist(), dis24_mean=lista_sin_nan(medias), dis24_std=lista_sin_nan(desviaciones))
+                except KeyError as e:
+                    logger.error(str(e))
+            if cubo_umbrales is not None:
+                response["periodos"] = cubo_umbrales.periodos.tolist()
+                response["return_threshold"] = cubo_umbrales.columnas(lat_datos, lon_datos)
+            response["alerta"] = raster_alertas.columnas(lat_datos, lon_datos) if raster_alertas is not None else None
+        else:
+            dis24_mean = None
+            dis24_std = None
+            if dataset is not None:
+                dis24_mean, dis24_std = getMeanStdForAllForecasts(dataset, lat_datos, lon_datos)
+
+            # Umbrales de todos los periodos de retorno en una sola indexación
+            resultados_return = {}
+            if cubo_umbrales is not None:
+                resultados_return = cubo_umbrales.consultar(lat_datos, lon_datos)
+
+            alerta = raster_alertas.consultar(lat_datos, lon_datos) if raster_alertas is not None else None
+
+            response = {
+                "lat": lat,
+                "lon": lon,
+                "region": region,
+                "ajuste_rio": ajuste_rio,
+                "dis24_mean": dis24_mean,
+                "dis24_std": dis24_std,
+                "return_threshold": resultados_return,
+                "alerta": alerta
+            }
+
+        metricas.observar("etapa_segundos", time.perf_counter() - inicio_seleccion, etapa="seleccion")
+
+        logger.info(f"Respuesta preparada para lat={lat}, lon={lon} ({formato})")
+        with metricas.etapa("serializacion"):
+            return comprimir(versionar(jsonify(response), etag, ultima_modificacion, LISTADO_TTL), codificacion)
+
+    except Exception as e:
+        logger.error(f"Error en endpoint /consultar: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/consultar_lote', methods=['POST'])
+def consultar_lote():
+    try:
+        try:
+            lats, lons, ids = leer_puntos(request.get_json(force=True, silent=True))
+            ajustar = leer_ajuste_rio()
+        except (TypeError, ValueError, KeyError, IndexError) as e:
+            logger.error(f"Error en parámetros: {str(e)}")
+            return jsonify({"error": "Puntos inválidos"}), 400
+
+        if not lats:
+            return jsonify({"error": "No se recibieron puntos"}), 400
+        if len(lats) > LOTE_MAX_PUNTOS:
+            return jsonify({"error": f"Se admiten como máximo {LOTE_MAX_PUNTOS} puntos"}), 400
+        logger.info(f"Consulta por lote de {len(lats)} puntos")
+
+        # Los puntos se agrupan por región con el índice espacial y cada grupo se consulta de una vez
+        indices_region = indice_regiones.buscar(lats, lons)
+        indices_region[indices_region < 0] = indice_regiones.nombres.index(REGION_DEFECTO)
+
+        puntos = [None] * len(lats)
+        for r in np.unique(indices_region):
+            region = indice_regiones.nombres[r]
+            grupo = np.flatnonzero(indices_region == r)
+            lats_grupo = [lats[k] for k in grupo]
+            lons_grupo = [lons[k] for k in grupo]
+            ajustes = [None] * len(grupo)
+            if ajustar:
+                lats_grupo, lons_grupo, ajustes = ajustar_a_rio(lats_grupo, lons_grupo, region)
+
+            horas, medias, desviaciones = None, None, None
+            dataset = obtener_dataset_pronostico(region)
+            if dataset is not None:
+                horas, medias, desviaciones = getMeanStdForPoints(dataset, lats_grupo, lons_grupo)
+
+            cubo_umbrales = obtener_cubo_umbrales(region)
+            umbrales = cubo_umbrales.consultar_lote(lats_grupo, lons_grupo) if cubo_umbrales is not None else [{}] * len(grupo)
+
+            medias = medias.tolist() if medias is not None else [None] * len(grupo)
+            desviaciones = desviaciones.tolist() if desviaciones is not None else [None] * len(grupo)
+
+            for posicion, k in enumerate(grupo):
+                punto = {
+                    "lat": lats[k],
+                    "lon": lons[k],
+                    "region": region,
+                    "ajuste_rio": ajustes[posicion],
+                    "dis24_mean": dict(zip(horas, medias[posicion])) if medias[posicion] is not None else None,
+                    "dis24_std": dict(zip(horas, desviaciones[posicion])) if desviaciones[posicion] is not None else None,
+                    "return_threshold": umbrales[posicion]
+                }
+                if ids[k] is not None:
+                    punto["id"] = ids[k]
+                puntos[k] = punto
+
+        return comprimir(jsonify({"puntos": puntos}), codificacion_aceptada(request))
+
+    except Exception as e:
+        logger.error(f"Error en endpoint /consultar_lote: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/alertas', methods=['GET'])
+def alertas():
+    try:
+        try:
+            hora = int(request.args.get('hora', 24))
+            periodo = request.args.get('periodo')
+            periodo = float(periodo) if periodo is not None else None
+            region = leer_region()
+        except ValueError as e:
+            logger.error(f"Error en parámetros: {str(e)}")
+            return jsonify({"error": "Parámetros inválidos"}), 400
+
+        raster_alertas = obtener_raster_alertas(region)
+        if raster_alertas is None:
+            return jsonify({"error": "No hay datos de pronóstico disponibles"}), 503
+        if hora not in raster_alertas.horas:
+            return jsonify({"error": f"Hora no disponible, opciones: {raster_alertas.horas}"}), 400
+        if periodo is not None and not np.isclose(raster_alertas.periodos, periodo).any():
+            return jsonify({"error": f"Periodo no disponible, opciones: {raster_alertas.periodos.tolist()}"}), 400
+
+        return jsonify(raster_alertas.capa(hora, periodo))
+
+    except Exception as e:
+        logger.error(f"Error en endpoint /alertas: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/historico', methods=['GET'])
+def historico():
+    try:
+        try:
+            lat = leer_coordenada('lat')
+            lon = leer_coordenada('lon')
+            n = request.args.get('n', '90')
+            if not n.isdigit() or not 1 <= int(n) <= HISTORICO_MAX_CORRIDAS:
+                raise ValueError(f"n inválido: {n}, debe estar entre 1 y {HISTORICO_MAX_CORRIDAS}")
+            n = int(n)
+            ajustar = leer_ajuste_rio()
+        except ValueError as e:
+            logger.error(f"Error en parámetros: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        region = region_de_punto(lat, lon)
+        archivo_historico = obtener_historico(region)
+        if archivo_historico is None:
+            return jsonify({"error": "No hay archivo histórico disponible"}), 503
+
+        lat_datos, lon_datos, ajuste_rio = ajustar_punto(lat, lon, region, ajustar)
+
+        fechas, horas, medias, desviaciones = archivo_historico.serie_punto(lat_datos, lon_datos, ultimas=n)
+
+        # Se omiten los plazos que ninguna de las corridas pedidas tiene
+        plazos = ~np.all(np.isnan(medias), axis=0)
+        return jsonify({
+            "lat": lat,
+            "lon": lon,
+            "ajuste_rio": ajuste_rio,
+            "fechas": np.datetime_as_string(fechas, unit="D").tolist(),
+            "horas": horas[plazos].tolist(),
+            "dis24_mean": lista_sin_nan(medias[:, plazos]),
+            "dis24_std": lista_sin_nan(desviaciones[:, plazos])
+        })
+
+    except Exception as e:
+        logger.error(f"Error en endpoint /historico: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/zonas', methods=['GET'])
+def zonas():
+    """
+    Estadísticas precalculadas por zona (comuna, cuenca, ...): sin capa lista las capas publicadas;
+    con capa devuelve todas las zonas en un plazo (hora, 24 por defecto) y con zona la serie de esa
+    zona (o solo el plazo indicado).
+    """
+    try:
+        try:
+            region = leer_region()
+            capa = request.args.get('capa')
+            zona = request.args.get('zona')
+            hora = request.args.get('hora')
+            hora = int(hora) if hora is not None else None
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error en parámetros: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        archivos = capas_zonas(region)
+        if capa is None:
+            return jsonify({"region": region, "capas": sorted(archivos)})
+        if capa not in archivos:
+            return jsonify({"error": f"Capa de zonas no disponible, opciones: {sorted(archivos)}"}), 404
+
+        etag = version_capa((region, capa, archivos[capa]["sha"], zona, hora))
+        if no_modificado(request, etag):
+            return versionar(Response(status=304), etag, max_age=LISTADO_TTL)
+
+        tabla = obtener_tabla_zonas(capa, region)
+        if tabla is None:
+            return jsonify({"error": f"No hay estadísticas disponibles para {capa}"}), 503
+
+        try:
+            if zona is None:
+                hora = 24 if hora is None else hora
+                datos = {"hora": hora, "zonas": tabla.resumen(hora)}
+            else:
+                datos = tabla.zona(zona, hora)
+                if datos is None:
+                    return jsonify({"error": f"Zona no encontrada: {zona}"}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        response = jsonify({
+            "region": region,
+            "capa": capa,
+            "fecha": tabla.fecha,
+            "periodos": tabla.periodos,
+            **datos,
+        })
+        return versionar(response, etag, max_age=LISTADO_TTL)
+
+    except Exception as e:
+        logger.error(f"Error en endpoint /zonas: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/percentiles', methods=['GET'])
+def percentiles():
+    try:
         try:
             lat = float(request.args.get('lat'))
             lon = float(request.args.get('lon'))
-            logger.info(f"Coordenadas recibidas: lat={lat}, lon={lon}")
+            valores_p = request.args.get('p')
+            valores_p = [float(p) for p in valores_p.split(',')] if valores_p else list(PERCENTILES_DEFECTO)
+            if not all(0 <= p <= 100 for p in valores_p):
+                raise ValueError("Percentil fuera de rango")
+            ajustar = leer_ajuste_rio()
         except (TypeError, ValueError) as e:
             logger.error(f"Error en parámetros: {str(e)}")
-            return jsonify({"error": "Coordenadas inválidas"}), 400
+            return jsonify({"error": "Parámetros inválidos"}), 400
 
-        # Procesar archivo de pronóstico
-        dis24_mean = None
-        dis24_std = None
-        archivo_download = obtener_archivos("download")
-        
-        if archivo_download:
-            ruta_local = "temp_download.nc"
-            if descargar_archivo(archivo_download[0]["download_url"], ruta_local):
-                dataset = leer_nc(ruta_local)
-                if dataset:
-                    dis24_mean, dis24_std = getMeanStdForAllForecasts(dataset, lat, lon)
-                if os.path.exists(ruta_local):
-                    os.remove(ruta_local)
-
-        # Procesar archivos de umbrales
-        resultados_return = {}
-        archivos_return = obtener_archivos("FloodThreshold", obtener_todos=True)
-        
-        for archivo in archivos_return:
-            ruta_local = f"temp_{archivo['name']}"
-            if descargar_archivo(archivo["download_url"], ruta_local):
-                dataset = leer_nc(ruta_local)
-                if dataset:
-                    resultados_return[archivo["name"]] = getValue(dataset, lat, lon)
-                if os.path.exists(ruta_local):
-                    os.remove(ruta_local)
-
-        response = {
+        region = region_de_punto(lat, lon)
+        dataset = obtener_dataset_miembros(region)
+        if dataset is None:
+            return jsonify({"error": "No hay miembros del ensamble para la corrida actual"}), 404
+
+        lat_datos, lon_datos, ajuste_rio = ajustar_punto(lat, lon, region, ajustar)
+        horas = horas_pronostico(dataset['forecast_period']).tolist()
+        valores = lista_sin_nan(percentiles_punto(dataset, lat_datos, lon_datos, valores_p))
+        return jsonify({
             "lat": lat,
             "lon": lon,
-            "dis24_mean": dis24_mean,
-            "dis24_std": dis24_std,
-            "return_threshold": resultados_return
-        }
-        
-        # Convertir tipos numpy antes de serializar
-        response = convert_numpy_types(response)
-        
-        logger.info(f"Respuesta preparada: {response}")
-        return jsonify(response)
+            "ajuste_rio": ajuste_rio,
+            "percentiles": {f"p{p:g}": dict(zip(horas, fila)) for p, fila in zip(valores_p, valores)}
+        })
 
     except Exception as e:
-        logger.error(f"Error en endpoint /consultar: {str(e)}", exc_info=True)
+        logger.error(f"Error en endpoint /percentiles: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/tiles/<capa>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def teselas(capa, z, x, y):
+    try:
+        try:
+            if not (0 <= z <= TESELAS_ZOOM_MAX and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                raise ValueError(f"Tesela fuera de rango: {z}/{x}/{y}")
+            region = leer_region()
+            if capa == "caudal":
+                resultado = capa_caudal(int(request.args.get('hora', 24)), region)
+            elif capa == "umbral":
+                if request.args.get('periodo') is None:
+                    raise ValueError("Falta el parámetro periodo")
+                resultado = capa_umbral(float(request.args['periodo']), region)
+            elif capa == "alerta":
+                resultado = capa_alerta(int(request.args.get('hora', 24)), region)
+            elif capa in ("precipitacion", "temperatura"):
+                resultado = capa_meteo(capa, int(request.args.get('plazo', 24)), region)
+            else:
+                return jsonify({"error": f"Capa desconocida: {capa}"}), 404
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error en parámetros: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        if resultado is None:
+            return jsonify({"error": f"No hay datos disponibles para la capa {capa}"}), 503
+        nombre, version, capa_raster = resultado
+        def renderizar():
+            with metricas.etapa("renderizado_tesela"):
+                return capa_raster.renderizar(z, x, y)
+
+        png = cache_teselas.obtener(nombre, version, z, x, y, renderizar)
+        response = Response(png, mimetype="image/png")
+        response.headers["Cache-Control"] = f"public, max-age={LISTADO_TTL}"
+        return response
+
+    except Exception as e:
+        logger.error(f"Error en endpoint /tiles: {str(e)}", exc_info=True)
         return jsonify({"error": "Error interno del servidor"}), 500
 
+@app.route('/regiones', methods=['GET'])
+def regiones():
+    return jsonify({nombre: {"bbox": region["bbox"]} for nombre, region in REGIONES.items()})
+
+@app.route('/cache', methods=['GET'])
+def estado_cache():
+    estadisticas = cache_datasets.estadisticas()
+    estadisticas["teselas"] = cache_teselas.estadisticas()
+    estadisticas["actualizador"] = actualizador.estadisticas()
+    return jsonify(estadisticas)
+
+@app.route('/actualizar', methods=['POST'])
+def webhook_actualizar():
+    """Webhook (por ejemplo el push de GitHub) que adelanta la revisión de nuevas corridas"""
+    if WEBHOOK_SECRET:
+        firma = "sha256=" + hmac.new(WEBHOOK_SECRET.encode("utf-8"), request.get_data(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(firma, request.headers.get("X-Hub-Signature-256", "")):
+            logger.warning("Webhook con firma inválida")
+            return jsonify({"error": "Firma inválida"}), 403
+    actualizador.iniciar()
+    actualizador.despertar()
+    return jsonify({"status": "Actualización programada"}), 202
+
+metricas.describir("solicitud_segundos", "Latencia de las solicitudes HTTP por ruta")
+metricas.describir("solicitudes_total", "Solicitudes HTTP atendidas por ruta y código de estado")
+metricas.describir("etapa_segundos", "Duración de las etapas internas (listado, descarga, apertura, selección, serialización)")
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_solicitud = time.perf_counter()
+
+@app.after_request
+def registrar_medicion(response):
+    inicio = g.pop("inicio_solicitud", None)
+    if inicio is not None:
+        # Se etiqueta con la regla de la ruta y no con la URL, para acotar la cantidad de series
+        ruta = request.url_rule.rule if request.url_rule is not None else "sin_ruta"
+        metricas.observar("solicitud_segundos", time.perf_counter() - inicio, ruta=ruta)
+        metricas.incrementar("solicitudes_total", ruta=ruta, codigo=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    datasets = cache_datasets.estadisticas()
+    teselas = cache_teselas.estadisticas()
+    consultas_teselas = teselas["aciertos_memoria"] + teselas["aciertos_disco"] + teselas["generadas"]
+    medidas = {
+        "cache_datasets_total": ("counter", "Accesos al cache de datasets por resultado", [
+            ({"resultado": "memoria"}, datasets["aciertos_memoria"]),
+            ({"resultado": "disco"}, datasets["aciertos_disco"]),
+            ({"resultado": "descarga"}, datasets["fallos"]),
+        ]),
+        "cache_datasets_tasa_aciertos": ("gauge", "Fracción de accesos a datasets resueltos sin descargar", [
+            ({}, datasets["tasa_aciertos"]),
+        ]),
+        "cache_teselas_total": ("counter", "Accesos al cache de teselas por resultado", [
+            ({"resultado": "memoria"}, teselas["aciertos_memoria"]),
+            ({"resultado": "disco"}, teselas["aciertos_disco"]),
+            ({"resultado": "generada"}, teselas["generadas"]),
+        ]),
+        "cache_teselas_tasa_aciertos": ("gauge", "Fracción de teselas servidas desde el cache", [
+            ({}, (teselas["aciertos_memoria"] + teselas["aciertos_disco"]) / consultas_teselas if consultas_teselas else 0.0),
+        ]),
+        "actualizaciones_total": ("counter", "Ejecuciones del actualizador en segundo plano por resultado", [
+            ({"resultado": "ok"}, actualizador.ejecuciones - actualizador.errores),
+            ({"resultado": "error"}, actualizador.errores),
+        ]),
+    }
+    return Response(metricas.exportar(medidas), mimetype="text/plain; version=0.0.4")
+
 @app.route('/test', methods=['GET'])
 def test():
     logger.info("Prueba de servicio")
@@ -261,10 +1237,35 @@ def test():
         "status": "ok",
         "message": "Servicio funcionando",
         "endpoints": {
-            "/consultar": "Consulta datos de inundación",
+            "/consultar": "Consulta datos de inundación (formato=columnas para arreglos por hora)",
+            "/consultar_lote": "Consulta datos de inundación para varios puntos (POST)",
+            "/alertas": "Capa de alertas por periodo de retorno para una hora de pronóstico",
+            "/percentiles": "Percentiles del ensamble completo para un punto",
+            "/historico": "Matriz corridas x plazos de pronóstico de las últimas N corridas para un punto",
+            "/zonas": "Caudal máximo y medio y periodo de retorno excedido por comuna o cuenca",
+            "/tiles/<capa>/<z>/<x>/<y>.png": "Teselas XYZ de caudal, umbral, alerta, precipitacion o temperatura",
+            "/regiones": "Regiones atendidas y sus límites",
+            "/cache": "Estadísticas del cache de datasets y del actualizador",
+            "/metrics": "Latencias por ruta y etapa y aciertos de los caches en formato Prometheus",
+            "/actualizar": "Webhook que adelanta la revisión de nuevas corridas (POST)",
             "/test": "Prueba de servicio"
         }
     })
 
+def precargar():
+    """Carga los datos estáticos al iniciar el servicio para que la primera consulta no pague su lectura"""
+    try:
+        for region in REGIONES:
+            obtener_cubo_umbrales(region)
+    except Exception as e:
+        logger.error(f"Error al precargar umbrales: {str(e)}")
+
+if PRECARGAR:
+    precargar()
+
 if __name__ == '__main__':
+    # Importar el módulo no inicia el actualizador: con gunicorn lo inicia cada worker en post_fork
+    # (gunicorn.conf.py) y aquí solo el proceso que atiende, no el que vigila los cambios del recargador
+    if PRECARGAR and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        actualizador.iniciar()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
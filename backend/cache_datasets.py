@@ -0,0 +1,157 @@
+import os
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+import xarray as xr
+
+from metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class CacheDatasets:
+    """
+    Cache LRU de datasets NetCDF en memoria y en disco.
+
+    Cada entrada se identifica por el nombre del archivo y el SHA del blob en GitHub,
+    de modo que un archivo solo se vuelve a descargar cuando su contenido cambia.
+    Es seguro entre hilos: si varias solicitudes piden a la vez un archivo ausente, solo una
+    lo descarga y las demás esperan y reciben el mismo dataset, que se comparte en solo lectura.
+    """
+
+    def __init__(self, directorio, descargar, max_memoria=16, max_disco=64):
+        self.directorio = directorio
+        self.descargar = descargar
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._cargando = {}  # clave -> lock de la carga en curso
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, nombre, sha):
+        return os.path.join(self.directorio, f"{sha}_{nombre}")
+
+    def obtener(self, archivo, en_memoria=True):
+        """
+        Devuelve el dataset de un archivo listado por la API de GitHub (name, path, sha, download_url).
+        Con en_memoria=False el dataset queda abierto de forma perezosa sobre la copia en disco,
+        para archivos grandes de los que solo se leen fragmentos.
+        """
+        # Se usa la ruta en el repositorio: el mismo nombre puede existir en varias carpetas
+        nombre = archivo.get("path", archivo["name"]).replace("/", "__")
+        sha = archivo["sha"]
+        clave = (nombre, sha)
+
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return self._memoria[clave]
+            carga = self._cargando.setdefault(clave, threading.Lock())
+
+        with carga:
+            try:
+                return self._obtener_sin_memoria(archivo, nombre, sha, en_memoria)
+            finally:
+                with self._lock:
+                    self._cargando.pop(clave, None)
+
+    def _obtener_sin_memoria(self, archivo, nombre, sha, en_memoria):
+        clave = (nombre, sha)
+        with self._lock:
+            # Otro hilo pudo cargarlo mientras se esperaba
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return self._memoria[clave]
+
+        ruta = self._ruta(nombre, sha)
+        if os.path.exists(ruta):
+            os.utime(ruta)
+            with self._lock:
+                self.aciertos_disco += 1
+        else:
+            with self._lock:
+                self.fallos += 1
+            if not self._descargar_atomico(archivo["download_url"], ruta):
+                return None
+            self._limpiar_disco(nombre, sha)
+
+        dataset = self._cargar(ruta, en_memoria)
+        if dataset is None:
+            return None
+
+        with self._lock:
+            self._memoria[clave] = dataset
+            self._memoria.move_to_end(clave)
+            # Una versión nueva reemplaza a las anteriores del mismo archivo
+            for otra in [c for c in self._memoria if c[0] == nombre and c != clave]:
+                del self._memoria[otra]
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+        return dataset
+
+    def _descargar_atomico(self, url, ruta):
+        """Descarga a un archivo temporal y lo mueve a su ruta final de forma atómica"""
+        fd, ruta_tmp = tempfile.mkstemp(dir=self.directorio, suffix=".part")
+        os.close(fd)
+        try:
+            if not self.descargar(url, ruta_tmp):
+                return False
+            os.replace(ruta_tmp, ruta)
+            return True
+        finally:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+
+    def _cargar(self, ruta, en_memoria=True):
+        try:
+            logger.info(f"Leyendo archivo NetCDF: {ruta}")
+            with metricas.etapa("apertura_netcdf"):
+                if not en_memoria:
+                    return xr.open_dataset(ruta)
+                with xr.open_dataset(ruta) as dataset:
+                    return dataset.load()
+        except Exception as e:
+            logger.error(f"Error al leer {ruta}: {str(e)}")
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            return None
+
+    def _limpiar_disco(self, nombre, sha):
+        """Elimina versiones antiguas del archivo y aplica el límite LRU en disco"""
+        try:
+            archivos = [
+                os.path.join(self.directorio, f)
+                for f in os.listdir(self.directorio)
+                if not f.endswith(".part")
+            ]
+            actual = self._ruta(nombre, sha)
+            for ruta in list(archivos):
+                if ruta != actual and os.path.basename(ruta).split("_", 1)[-1] == nombre:
+                    os.remove(ruta)
+                    archivos.remove(ruta)
+            archivos.sort(key=os.path.getmtime)
+            for ruta in archivos[:max(0, len(archivos) - self.max_disco)]:
+                os.remove(ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo limpiar el cache en disco: {str(e)}")
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos_memoria + self.aciertos_disco + self.fallos
+            return {
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_aciertos": (self.aciertos_memoria + self.aciertos_disco) / consultas if consultas else 0.0,
+                "entradas_memoria": len(self._memoria),
+                "max_memoria": self.max_memoria,
+                "max_disco": self.max_disco,
+            }
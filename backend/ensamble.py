@@ -0,0 +1,47 @@
+import logging
+
+import numpy as np
+
+from grilla import indices_cercanos, normalizar_longitud
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES_DEFECTO = (10, 25, 50, 75, 90)
+
+
+def miembros_en_grilla(dataset):
+    """Devuelve dis24 con dimensiones (forecast_period, number, latitude, longitude)"""
+    dis24 = dataset["dis24"]
+    if "forecast_reference_time" in dis24.dims:
+        dis24 = dis24.isel(forecast_reference_time=0)
+    return dis24.transpose("forecast_period", "number", "latitude", "longitude").values
+
+
+def serie_miembros(dataset, lat, lon):
+    """Serie (forecast_period, number) de todos los miembros del ensamble en el punto más cercano"""
+    i = indices_cercanos(dataset["latitude"].values, lat)
+    j = indices_cercanos(dataset["longitude"].values, normalizar_longitud(lon))
+    return miembros_en_grilla(dataset)[:, :, i, j]
+
+
+def percentiles_punto(dataset, lat, lon, percentiles=PERCENTILES_DEFECTO):
+    """Percentiles del ensamble por forecast_period, con forma (percentiles, forecast_period)"""
+    serie = serie_miembros(dataset, lat, lon)
+    with np.errstate(invalid="ignore"):
+        return np.nanpercentile(serie, percentiles, axis=1)
+
+
+def probabilidad_miembros(miembros, umbrales):
+    """
+    Fracción de miembros que superan cada umbral.
+    miembros: (forecast_period, number, lat, lon); umbrales: (return_period, lat, lon).
+    Devuelve (forecast_period, return_period, lat, lon).
+    """
+    validos = (~np.isnan(miembros)).sum(axis=1)
+    probabilidad = np.empty((miembros.shape[0], umbrales.shape[0]) + miembros.shape[2:], dtype=np.float32)
+    # Un periodo de retorno a la vez acota la memoria a (forecast_period, number, lat, lon)
+    for r in range(umbrales.shape[0]):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            superan = (miembros > umbrales[r][None, None]).sum(axis=1)
+            probabilidad[:, r] = np.where(validos > 0, superan / validos, np.nan)
+    return probabilidad
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def normalizar_longitud(lon):
+    """Convierte longitudes en [-180, 180] al rango [0, 360) usado por GloFAS"""
+    return (np.asarray(lon, dtype=float) + 360) % 360
+
+
+def horas_pronostico(forecast_period):
+    """Convierte forecast_period a horas enteras, venga decodificado como timedelta o en horas"""
+    valores = np.asarray(forecast_period.values)
+    if np.issubdtype(valores.dtype, np.timedelta64):
+        return (valores // np.timedelta64(1, "h")).astype(int)
+    return valores.astype(int)
+
+
+def indices_cercanos(eje, valores):
+    """
+    Índice del elemento más cercano de un eje monótono para cada valor.
+    Equivale a .sel(method="nearest") pero resuelve todos los valores en una sola operación.
+    """
+    eje = np.asarray(eje, dtype=float)
+    valores = np.asarray(valores, dtype=float)
+    if eje.size == 1:
+        return np.zeros(valores.shape, dtype=np.intp)
+
+    descendente = eje[0] > eje[-1]
+    ordenado = eje[::-1] if descendente else eje
+
+    derecha = np.clip(np.searchsorted(ordenado, valores), 1, ordenado.size - 1)
+    izquierda = derecha - 1
+    usar_izquierda = (valores - ordenado[izquierda]) < (ordenado[derecha] - valores)
+    indices = np.where(usar_izquierda, izquierda, derecha)
+
+    if descendente:
+        indices = eje.size - 1 - indices
+    return indices
+
+
+def lista_sin_nan(arreglo):
+    """Convierte un arreglo a listas de Python reemplazando NaN por None (null en JSON)"""
+    arreglo = np.asarray(arreglo, dtype=float)
+    return np.where(np.isnan(arreglo), None, arreglo).tolist()
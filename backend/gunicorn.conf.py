@@ -0,0 +1,23 @@
+import os
+
+# Uso: gunicorn -c gunicorn.conf.py app:app
+# Cada proceso atiende varias solicitudes a la vez con hilos; los datasets en memoria se
+# comparten en solo lectura entre los hilos y el cache en disco es común a todos los procesos.
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+keepalive = 5
+# La aplicación se importa (y precarga los umbrales) una vez antes de crear los procesos
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Las conexiones HTTP abiertas durante la precarga no deben compartirse entre procesos
+    import app
+    app.sesion_http.close()
+    # Cada worker revisa por su cuenta las nuevas corridas y precalienta sus propios datasets;
+    # el hilo se inicia aquí y no al importar la aplicación, que ocurre en el proceso maestro
+    if app.PRECARGAR:
+        app.actualizador.iniciar()
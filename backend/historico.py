@@ -0,0 +1,60 @@
+import logging
+
+import numpy as np
+
+from grilla import horas_pronostico, indices_cercanos, normalizar_longitud
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_HISTORICO = "glofas_historico.nc"
+VARIABLES = ["mean_dis24", "std_dis24"]
+
+
+class ArchivoHistorico:
+    """
+    Consultas sobre el archivo consolidado de corridas diarias (ver consolidar_historico.py),
+    con dimensiones (forecast_reference_time, forecast_period, latitude, longitude).
+    El dataset se mantiene abierto de forma perezosa: cada consulta lee solo sus fragmentos.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.fechas = dataset["forecast_reference_time"].values
+        self.orden = np.argsort(self.fechas)
+        self.horas = horas_pronostico(dataset["forecast_period"])
+
+    def corrida(self, indice):
+        """Devuelve una corrida con la misma forma que los archivos diarios de download/"""
+        corrida = self.dataset[VARIABLES].isel(forecast_reference_time=[indice]).load()
+        # Los plazos que la corrida no tiene quedan en NaN en el histórico
+        return corrida.dropna("forecast_period", how="all")
+
+    def mas_reciente(self):
+        if not len(self.fechas):
+            return None
+        return self.corrida(int(self.orden[-1]))
+
+    def por_fecha(self, fecha):
+        """Corrida emitida el día indicado (YYYYMMDD o datetime64), o None si no existe"""
+        if isinstance(fecha, str) and len(fecha) == 8:
+            fecha = f"{fecha[:4]}-{fecha[4:6]}-{fecha[6:]}"
+        dia = np.datetime64(fecha, "D")
+        indices = np.flatnonzero(self.fechas.astype("datetime64[D]") == dia)
+        if not indices.size:
+            return None
+        return self.corrida(int(indices[-1]))
+
+    def serie_punto(self, lat, lon, ultimas=None):
+        """
+        Pronósticos de todas las corridas (o de las últimas N) en el punto más cercano.
+        Devuelve (fechas, horas, medias, desviaciones) con matrices de forma (corridas, forecast_period).
+        """
+        i = indices_cercanos(self.dataset["latitude"].values, lat)
+        j = indices_cercanos(self.dataset["longitude"].values, normalizar_longitud(lon))
+        orden = self.orden[-ultimas:] if ultimas else self.orden
+
+        punto = self.dataset[VARIABLES].isel(latitude=i, longitude=j)
+        punto = punto.transpose("forecast_reference_time", "forecast_period").load()
+        medias = punto["mean_dis24"].values[orden]
+        desviaciones = punto["std_dis24"].values[orden]
+        return self.fechas[orden], self.horas, medias, desviaciones
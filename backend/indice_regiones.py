@@ -0,0 +1,92 @@
+import os
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Registro de regiones compartido con los procesos de descarga (regiones.json en la raíz del repositorio)
+REGIONES_ARCHIVO = os.getenv(
+    "REGIONES_ARCHIVO",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "regiones.json"),
+)
+# Registro mínimo si el backend se despliega sin el archivo
+REGIONES_DEFECTO = {
+    "Coquimbo": {
+        "bbox": {"north": -29.0366, "south": -32.28247, "west": -71.71782, "east": -69.809361},
+        "prefijo": "",
+    }
+}
+
+
+def cargar_regiones(ruta=REGIONES_ARCHIVO):
+    """Devuelve el registro de regiones: nombre -> {"bbox", "prefijo", ...}"""
+    try:
+        with open(ruta) as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError) as e:
+        logger.warning(f"No se pudo leer el registro de regiones {ruta}: {str(e)}")
+        return REGIONES_DEFECTO
+
+
+class IndiceRegiones:
+    """
+    Índice espacial de las regiones sobre una grilla gruesa de celdas. Cada celda guarda la única
+    región cuyos límites la cubren por completo, -1 si ninguna la toca o -2 si hay que comparar con
+    los límites (bordes o regiones superpuestas). Así la mayoría de los puntos se resuelve con una
+    sola indexación y solo los de celdas de borde se comparan contra cada región, prefiriendo la
+    región más pequeña que contiene al punto.
+    """
+
+    def __init__(self, regiones, resolucion=0.5):
+        self.nombres = list(regiones)
+        bbox = [regiones[nombre]["bbox"] for nombre in self.nombres]
+        self.norte = np.array([b["north"] for b in bbox], dtype=float)
+        self.sur = np.array([b["south"] for b in bbox], dtype=float)
+        self.oeste = np.array([b["west"] for b in bbox], dtype=float)
+        self.este = np.array([b["east"] for b in bbox], dtype=float)
+        self.area = (self.norte - self.sur) * (self.este - self.oeste)
+
+        self.resolucion = resolucion
+        self.lat0 = self.sur.min()
+        self.lon0 = self.oeste.min()
+        filas = max(1, int(np.ceil((self.norte.max() - self.lat0) / resolucion)))
+        columnas = max(1, int(np.ceil((self.este.max() - self.lon0) / resolucion)))
+
+        # Límites de cada celda (filas, columnas, 1) frente a los de cada región (1, 1, regiones)
+        sur_celda = (self.lat0 + np.arange(filas) * resolucion)[:, None, None]
+        oeste_celda = (self.lon0 + np.arange(columnas) * resolucion)[None, :, None]
+        norte_celda = sur_celda + resolucion
+        este_celda = oeste_celda + resolucion
+        toca = (self.sur < norte_celda) & (self.norte > sur_celda) & (self.oeste < este_celda) & (self.este > oeste_celda)
+        cubre = (self.sur <= sur_celda) & (self.norte >= norte_celda) & (self.oeste <= oeste_celda) & (self.este >= este_celda)
+
+        cantidad = toca.sum(axis=2)
+        self.celdas = np.where(cantidad == 0, -1, -2).astype(np.int16)
+        unica = (cantidad == 1) & cubre.any(axis=2)
+        self.celdas[unica] = np.argmax(cubre, axis=2)[unica]
+        logger.info(f"Índice de regiones: {len(self.nombres)} regiones en {filas}x{columnas} celdas")
+
+    def buscar(self, lats, lons):
+        """Índice de la región de cada punto (-1 si ningún registro lo contiene)"""
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = (np.atleast_1d(np.asarray(lons, dtype=float)) + 180) % 360 - 180
+        i = np.floor((lats - self.lat0) / self.resolucion).astype(np.intp)
+        j = np.floor((lons - self.lon0) / self.resolucion).astype(np.intp)
+        dentro = (i >= 0) & (i < self.celdas.shape[0]) & (j >= 0) & (j < self.celdas.shape[1])
+        resultado = np.full(lats.shape, -1, dtype=np.intp)
+        resultado[dentro] = self.celdas[i[dentro], j[dentro]]
+
+        pendientes = np.flatnonzero(resultado == -2)
+        if pendientes.size:
+            la, lo = lats[pendientes, None], lons[pendientes, None]
+            contiene = (la <= self.norte) & (la >= self.sur) & (lo >= self.oeste) & (lo <= self.este)
+            areas = np.where(contiene, self.area, np.inf)
+            resultado[pendientes] = np.where(contiene.any(axis=1), np.argmin(areas, axis=1), -1)
+        return resultado
+
+    def region(self, lat, lon):
+        """Nombre de la región que contiene el punto, o None"""
+        indice = int(self.buscar(lat, lon)[0])
+        return self.nombres[indice] if indice >= 0 else None
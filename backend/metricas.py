@@ -0,0 +1,108 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Límites superiores (segundos) de los intervalos de los histogramas de latencia
+LIMITES_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas):
+    """Etiquetas en formato Prometheus a partir de una tupla de pares (clave, valor)"""
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas) + "}"
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metricas:
+    """
+    Registro mínimo de contadores e histogramas de latencia, exportado en el formato de texto de
+    Prometheus. Los valores son del proceso: con varios workers cada uno expone los suyos.
+    """
+
+    def __init__(self, prefijo="inundacion"):
+        self.prefijo = prefijo
+        self._lock = threading.Lock()
+        self._histogramas = {}  # nombre -> {etiquetas: [conteos por intervalo, suma, total]}
+        self._contadores = {}  # nombre -> {etiquetas: valor}
+        self._ayuda = {}
+
+    def describir(self, nombre, ayuda):
+        self._ayuda[nombre] = ayuda
+
+    def observar(self, nombre, valor, **etiquetas):
+        """Registra una duración (segundos) en el histograma nombre"""
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._histogramas.setdefault(nombre, {}).get(clave)
+            if serie is None:
+                serie = self._histogramas[nombre][clave] = [[0] * len(LIMITES_SEGUNDOS), 0.0, 0]
+            for k, limite in enumerate(LIMITES_SEGUNDOS):
+                if valor <= limite:
+                    serie[0][k] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._contadores.setdefault(nombre, {})
+            serie[clave] = serie.get(clave, 0) + valor
+
+    @contextmanager
+    def etapa(self, nombre):
+        """Mide la duración de una etapa (listado, descarga, apertura, selección, ...)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar("etapa_segundos", time.perf_counter() - inicio, etapa=nombre)
+
+    def exportar(self, medidas=None):
+        """
+        Texto en formato Prometheus. medidas agrega valores calculados al momento de exportar:
+        {nombre: (tipo, ayuda, [(etiquetas, valor), ...])}
+        """
+        lineas = []
+        with self._lock:
+            for nombre, series in sorted(self._contadores.items()):
+                completo = f"{self.prefijo}_{nombre}"
+                lineas.append(f"# HELP {completo} {self._ayuda.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {completo} counter")
+                for clave, valor in sorted(series.items()):
+                    lineas.append(f"{completo}{_etiquetas(clave)} {_numero(valor)}")
+
+            for nombre, series in sorted(self._histogramas.items()):
+                completo = f"{self.prefijo}_{nombre}"
+                lineas.append(f"# HELP {completo} {self._ayuda.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {completo} histogram")
+                for clave, (conteos, suma, total) in sorted(series.items()):
+                    acumulado = 0
+                    for limite, conteo in zip(LIMITES_SEGUNDOS, conteos):
+                        acumulado += conteo
+                        lineas.append(f"{completo}_bucket{_etiquetas(clave + (('le', _numero(limite)),))} {acumulado}")
+                    lineas.append(f"{completo}_bucket{_etiquetas(clave + (('le', '+Inf'),))} {total}")
+                    lineas.append(f"{completo}_sum{_etiquetas(clave)} {_numero(suma)}")
+                    lineas.append(f"{completo}_count{_etiquetas(clave)} {total}")
+
+        for nombre, (tipo, ayuda, valores) in sorted((medidas or {}).items()):
+            completo = f"{self.prefijo}_{nombre}"
+            lineas.append(f"# HELP {completo} {ayuda}")
+            lineas.append(f"# TYPE {completo} {tipo}")
+            for etiquetas, valor in valores:
+                lineas.append(f"{completo}{_etiquetas(tuple(sorted(etiquetas.items())))} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+
+# Registro compartido por todo el backend
+metricas = Metricas()
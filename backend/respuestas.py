@@ -0,0 +1,62 @@
+import gzip
+from datetime import datetime, timezone
+
+try:
+    import brotli  # Opcional: si no está instalado solo se ofrece gzip
+except ImportError:
+    brotli = None
+
+COMPRESION_MINIMA = 1024  # Bytes bajo los que no vale la pena comprimir
+
+
+def codificacion_aceptada(request):
+    """Codificación de contenido a usar según Accept-Encoding: "br", "gzip" o None"""
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def fecha_corrida(nombre):
+    """Fecha UTC de la corrida a partir del nombre YYYYMMDD.nc (None si no tiene ese formato)"""
+    try:
+        return datetime.strptime(nombre[:8], "%Y%m%d").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def no_modificado(request, etag, ultima_modificacion=None):
+    """
+    Indica si la copia del cliente sigue vigente. If-None-Match tiene prioridad sobre
+    If-Modified-Since, como indica la RFC 9110.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if ultima_modificacion is not None and request.if_modified_since is not None:
+        return ultima_modificacion <= request.if_modified_since
+    return False
+
+
+def versionar(response, etag, ultima_modificacion=None, max_age=300):
+    """Agrega los encabezados de validación y cache a una respuesta (200 o 304)"""
+    response.set_etag(etag)
+    if ultima_modificacion is not None:
+        response.last_modified = ultima_modificacion
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def comprimir(response, codificacion, minimo=COMPRESION_MINIMA):
+    """Comprime el cuerpo de la respuesta con la codificación negociada si supera el mínimo"""
+    cuerpo = response.get_data()
+    if codificacion is None or len(cuerpo) < minimo:
+        return response
+    if codificacion == "br":
+        response.set_data(brotli.compress(cuerpo, quality=5))
+    else:
+        response.set_data(gzip.compress(cuerpo, compresslevel=6))
+    response.headers["Content-Encoding"] = codificacion
+    response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,80 @@
+import logging
+
+import numpy as np
+
+from grilla import indices_cercanos
+
+logger = logging.getLogger(__name__)
+
+KM_POR_GRADO = 111.2
+
+
+class IndiceRios:
+    """
+    Ajuste de puntos al río más relevante cercano. Para cada celda de la grilla se precalcula, una
+    sola vez, la celda de río de mayor relevancia (caudal de referencia) dentro del radio; así cada
+    consulta se resuelve con una búsqueda binaria por eje y una indexación, también por lotes.
+
+    Las celdas con relevancia menor que minimo (o NaN) no se consideran río. Entre celdas de igual
+    relevancia se prefiere la más cercana.
+    """
+
+    def __init__(self, latitudes, longitudes, relevancia, radio_km=8.0, minimo=1.0):
+        self.latitude = np.asarray(latitudes, dtype=float)
+        self.longitude = (np.asarray(longitudes, dtype=float) + 180) % 360 - 180
+        relevancia = np.asarray(relevancia, dtype=float)
+        with np.errstate(invalid="ignore"):
+            rio = np.isfinite(relevancia) & (relevancia >= minimo)
+        relevancia = np.where(rio, relevancia, -np.inf)
+
+        # Desplazamientos (en celdas) dentro del radio, del más cercano al más lejano
+        paso_lat = abs(self.latitude[1] - self.latitude[0]) * KM_POR_GRADO if self.latitude.size > 1 else np.inf
+        paso_lon = (
+            abs(self.longitude[1] - self.longitude[0]) * KM_POR_GRADO * np.cos(np.radians(self.latitude.mean()))
+            if self.longitude.size > 1 else np.inf
+        )
+        n_lat = int(radio_km // paso_lat) if np.isfinite(paso_lat) else 0
+        n_lon = int(radio_km // paso_lon) if np.isfinite(paso_lon) else 0
+        desplazamientos = sorted(
+            (np.hypot(di * paso_lat, dj * paso_lon), di, dj)
+            for di in range(-n_lat, n_lat + 1) for dj in range(-n_lon, n_lon + 1)
+            if np.hypot(di * paso_lat, dj * paso_lon) <= radio_km
+        )
+
+        filas, columnas = relevancia.shape
+        base_i = np.arange(filas)[:, None]
+        base_j = np.arange(columnas)[None, :]
+        ampliada = np.pad(relevancia, ((n_lat, n_lat), (n_lon, n_lon)), constant_values=-np.inf)
+        mejor = np.full(relevancia.shape, -np.inf)
+        self.fila = np.broadcast_to(base_i, relevancia.shape).copy()
+        self.columna = np.broadcast_to(base_j, relevancia.shape).copy()
+        for _, di, dj in desplazamientos:
+            candidato = ampliada[n_lat + di:n_lat + di + filas, n_lon + dj:n_lon + dj + columnas]
+            # Comparación estricta: ante empates se conserva el desplazamiento más cercano, ya visto
+            reemplazar = candidato > mejor
+            mejor = np.where(reemplazar, candidato, mejor)
+            self.fila = np.where(reemplazar, base_i + di, self.fila)
+            self.columna = np.where(reemplazar, base_j + dj, self.columna)
+        self.con_rio = np.isfinite(mejor)
+        self.relevancia = np.where(self.con_rio, mejor, np.nan)
+        logger.info(
+            f"Índice de ríos: {int(rio.sum())} celdas de río, {int(self.con_rio.sum())} de {rio.size} celdas con río a menos de {radio_km:g} km"
+        )
+
+    def ajustar(self, lats, lons):
+        """
+        Devuelve (lats, lons, ajustado, relevancia) de cada punto: las coordenadas del centro de la
+        celda de río elegida o las originales si no hay río dentro del radio.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        i = indices_cercanos(self.latitude, lats)
+        j = indices_cercanos(self.longitude, (lons + 180) % 360 - 180)
+        ajustado = self.con_rio[i, j]
+        fila, columna = self.fila[i, j], self.columna[i, j]
+        return (
+            np.where(ajustado, self.latitude[fila], lats),
+            np.where(ajustado, self.longitude[columna], lons),
+            ajustado,
+            self.relevancia[i, j],
+        )
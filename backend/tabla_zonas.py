@@ -0,0 +1,70 @@
+import logging
+import unicodedata
+
+import numpy as np
+
+from grilla import horas_pronostico, lista_sin_nan
+
+logger = logging.getLogger(__name__)
+
+VARIABLES = ["caudal_maximo", "caudal_medio", "periodo_excedido", "fraccion_excedida"]
+
+
+def normalizar_nombre(nombre):
+    """Clave de búsqueda de una zona: sin tildes, sin mayúsculas y sin espacios sobrantes"""
+    sin_tildes = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sin_tildes.lower().split())
+
+
+class TablaZonas:
+    """
+    Estadísticas precalculadas por zona y plazo (zonas/<capa>.nc, ver estadisticas_zonales.py).
+    La tabla es pequeña, así que se carga completa en memoria y cada zona se encuentra con un
+    diccionario por nombre normalizado.
+    """
+
+    def __init__(self, dataset):
+        tabla = dataset[VARIABLES + ["celdas"]].transpose("zona", "forecast_period").load()
+        self.capa = dataset.attrs.get("capa")
+        self.fecha = dataset.attrs.get("fecha")
+        self.periodos = np.atleast_1d(dataset.attrs.get("periodos_retorno", [])).astype(float).tolist()
+        self.nombres = [str(nombre) for nombre in tabla["zona"].values]
+        self.horas = horas_pronostico(tabla["forecast_period"]).tolist()
+        self.valores = {variable: tabla[variable].values for variable in VARIABLES}
+        self.celdas = tabla["celdas"].values.tolist()
+        self.indice = {normalizar_nombre(nombre): k for k, nombre in enumerate(self.nombres)}
+        logger.info(f"Tabla de zonas {self.capa} cargada: {len(self.nombres)} zonas, {len(self.horas)} plazos")
+
+    def columna_hora(self, hora):
+        if hora not in self.horas:
+            raise ValueError(f"Hora no disponible, opciones: {self.horas}")
+        return self.horas.index(hora)
+
+    def zona(self, nombre, hora=None):
+        """Serie de una zona (todas las horas o solo la indicada); None si la zona no existe"""
+        k = self.indice.get(normalizar_nombre(nombre))
+        if k is None:
+            return None
+        columnas = slice(None) if hora is None else [self.columna_hora(hora)]
+        return {
+            "zona": self.nombres[k],
+            "celdas": self.celdas[k],
+            "horas": self.horas if hora is None else [hora],
+            **{variable: lista_sin_nan(self.valores[variable][k, columnas]) for variable in VARIABLES},
+        }
+
+    def resumen(self, hora):
+        """Todas las zonas en un plazo, ordenadas de mayor a menor periodo excedido y caudal máximo"""
+        c = self.columna_hora(hora)
+        orden = np.lexsort((
+            -np.nan_to_num(self.valores["caudal_maximo"][:, c], nan=-np.inf),
+            -np.nan_to_num(self.valores["periodo_excedido"][:, c], nan=-np.inf),
+        ))
+        return [
+            {
+                "zona": self.nombres[k],
+                "celdas": self.celdas[k],
+                **{variable: lista_sin_nan(self.valores[variable][k, c]) for variable in VARIABLES},
+            }
+            for k in orden
+        ]
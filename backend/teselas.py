@@ -0,0 +1,277 @@
+import os
+import zlib
+import shutil
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from grilla import indices_cercanos
+
+logger = logging.getLogger(__name__)
+
+TAMANO_TESELA = 256
+
+# Rampas de color (valor mínimo, valor máximo), las mismas que usaba el frontend al colorear en el navegador
+RAMPAS = {
+    "caudal": ((173, 216, 230), (0, 0, 139)),
+    "umbral": ((173, 216, 230), (0, 0, 139)),
+    "precipitacion": ((0, 0, 0), (127, 178, 255)),
+    "temperatura": ((255, 255, 0), (255, 0, 0)),
+}
+# Colores de los niveles de alerta, de amarillo (periodo de retorno menor) a morado (mayor)
+COLORES_ALERTA = np.array([(255, 235, 59), (255, 152, 0), (244, 67, 54), (156, 39, 176)], dtype=float)
+
+
+def version_capa(clave):
+    """Identificador corto de la versión de datos con que se dibuja una capa"""
+    return hashlib.sha1(repr(clave).encode("utf-8")).hexdigest()[:16]
+
+
+def coordenadas_tesela(z, x, y, tamano=TAMANO_TESELA):
+    """
+    Latitudes (por fila) y longitudes (por columna) de los centros de píxel de una tesela XYZ
+    en Web Mercator. La proyección es separable, así que basta con dos vectores.
+    """
+    n = 2 ** z
+    columnas = (x + (np.arange(tamano) + 0.5) / tamano) / n
+    filas = (y + (np.arange(tamano) + 0.5) / tamano) / n
+    lons = columnas * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * filas))))
+    return lats, lons
+
+
+def limites_tesela(z, x, y):
+    """Devuelve (oeste, sur, este, norte) en grados de una tesela XYZ"""
+    n = 2 ** z
+    oeste = x / n * 360.0 - 180.0
+    este = (x + 1) / n * 360.0 - 180.0
+    norte = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    sur = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))
+    return oeste, sur, este, norte
+
+
+def _muestrear_eje(eje, valores):
+    """Índice de la celda más cercana y si el valor cae dentro de la grilla (media celda de margen)"""
+    indices = indices_cercanos(eje, valores)
+    paso = abs(eje[1] - eje[0]) if eje.size > 1 else np.inf
+    dentro = np.abs(eje[indices] - valores) <= paso / 2 + 1e-9
+    return indices, dentro
+
+
+def codificar_png(rgba):
+    """Codifica una imagen RGBA uint8 (alto, ancho, 4) como PNG, sin filtros por fila"""
+    alto, ancho, _ = rgba.shape
+    filas = np.concatenate([np.zeros((alto, 1), dtype=np.uint8), rgba.reshape(alto, ancho * 4)], axis=1)
+
+    def bloque(tipo, datos):
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos) & 0xFFFFFFFF)
+
+    cabecera = struct.pack(">IIBBBBB", ancho, alto, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + bloque(b"IHDR", cabecera)
+        + bloque(b"IDAT", zlib.compress(filas.tobytes(), 6))
+        + bloque(b"IEND", b"")
+    )
+
+
+TESELA_VACIA = codificar_png(np.zeros((TAMANO_TESELA, TAMANO_TESELA, 4), dtype=np.uint8))
+
+
+class CapaRaster:
+    """
+    Raster en grilla regular lat/lon listo para dibujarse en teselas: la reproyección a
+    Web Mercator y la paleta se aplican de forma vectorizada sobre toda la tesela.
+
+    Con niveles=N los valores son niveles de alerta enteros de 1 a N (0 = sin alerta, transparente)
+    y cada nivel tiene un color fijo, el mismo en todas las corridas; en otro caso se usa la rampa
+    continua normalizada entre el mínimo y el máximo del raster.
+    """
+
+    def __init__(self, latitudes, longitudes, valores, rampa=None, niveles=None):
+        longitudes = np.where(np.asarray(longitudes, dtype=float) > 180, np.asarray(longitudes, dtype=float) - 360, longitudes)
+        orden = np.argsort(longitudes)
+        self.latitude = np.asarray(latitudes, dtype=float)
+        self.longitude = longitudes[orden]
+        self.valores = np.asarray(valores, dtype=np.float32)[:, orden]
+        self.niveles = niveles
+
+        finitos = self.valores[np.isfinite(self.valores)]
+        self.minimo = float(finitos.min()) if finitos.size else 0.0
+        self.maximo = float(finitos.max()) if finitos.size else 0.0
+        if niveles:
+            # La paleta depende solo de la cantidad de periodos de retorno, no del nivel más alto
+            # alcanzado en la corrida: un mismo nivel se dibuja igual todos los días
+            cantidad = int(niveles)
+            posiciones = np.linspace(0, 1, len(COLORES_ALERTA))
+            t = np.linspace(0, 1, cantidad)
+            colores = np.stack([np.interp(t, posiciones, COLORES_ALERTA[:, c]) for c in range(3)], axis=1)
+            # Fila 0 transparente para las celdas sin alerta
+            self.tabla = np.zeros((cantidad + 1, 4), dtype=np.uint8)
+            self.tabla[1:, :3] = np.round(colores)
+            self.tabla[1:, 3] = 220
+        else:
+            self.rampa = np.array(rampa, dtype=float)
+
+        medio_lat = abs(self.latitude[1] - self.latitude[0]) / 2 if self.latitude.size > 1 else 0
+        medio_lon = abs(self.longitude[1] - self.longitude[0]) / 2 if self.longitude.size > 1 else 0
+        self.limites = (
+            self.longitude.min() - medio_lon,
+            self.latitude.min() - medio_lat,
+            self.longitude.max() + medio_lon,
+            self.latitude.max() + medio_lat,
+        )
+
+    def intersecta(self, z, x, y):
+        oeste, sur, este, norte = limites_tesela(z, x, y)
+        return not (este < self.limites[0] or oeste > self.limites[2] or norte < self.limites[1] or sur > self.limites[3])
+
+    def colorear(self, muestra, validos):
+        """Aplica la paleta a un arreglo de valores; los no válidos quedan transparentes"""
+        if self.niveles:
+            niveles = np.clip(np.where(validos, muestra, 0), 0, len(self.tabla) - 1).astype(np.intp)
+            return self.tabla[niveles]
+
+        rango = self.maximo - self.minimo
+        t = (muestra - self.minimo) / rango if rango > 0 else np.zeros_like(muestra)
+        t = np.clip(np.where(validos, t, 0), 0, 1)[..., None]
+        rgba = np.empty(muestra.shape + (4,), dtype=np.uint8)
+        rgba[..., :3] = np.round(self.rampa[0] + (self.rampa[1] - self.rampa[0]) * t)
+        rgba[..., 3] = np.where(validos, 255, 0)
+        return rgba
+
+    def renderizar(self, z, x, y, tamano=TAMANO_TESELA):
+        """Devuelve el PNG de la tesela z/x/y (una tesela transparente si no toca el raster)"""
+        if not self.intersecta(z, x, y):
+            return TESELA_VACIA
+        lats, lons = coordenadas_tesela(z, x, y, tamano)
+        i, dentro_lat = _muestrear_eje(self.latitude, lats)
+        j, dentro_lon = _muestrear_eje(self.longitude, lons)
+        muestra = self.valores[i[:, None], j[None, :]]
+        validos = dentro_lat[:, None] & dentro_lon[None, :] & np.isfinite(muestra)
+        if not validos.any():
+            return TESELA_VACIA
+        return codificar_png(self.colorear(muestra, validos))
+
+
+class CacheTeselas:
+    """
+    Cache LRU de teselas PNG en memoria y en disco. Cada tesela se identifica por la capa,
+    la versión de los datos (corrida y SHA de los archivos) y z/x/y, y en disco cada versión
+    tiene su propio directorio. El directorio en disco lo comparten los workers, que pueden
+    cambiar de versión en momentos distintos: al cambiar de versión se descartan de memoria
+    las teselas anteriores, pero en disco se conservan las versiones más recientes y solo se
+    borran las más antiguas.
+    """
+
+    def __init__(self, directorio, max_memoria=2048, versiones=2):
+        self.directorio = directorio
+        self.max_memoria = max_memoria
+        # Versiones de cada capa que se conservan en disco (la vigente y las anteriores más recientes)
+        self.versiones = max(int(versiones), 1)
+        self._memoria = OrderedDict()
+        self._versiones = {}
+        self._lock = threading.Lock()
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.generadas = 0
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, capa, version, z, x, y):
+        return os.path.join(self.directorio, capa, version, str(z), str(x), f"{y}.png")
+
+    def _invalidar(self, capa, version):
+        """Descarta de memoria las teselas de otras versiones de la capa y poda las antiguas en disco"""
+        with self._lock:
+            if self._versiones.get(capa) == version:
+                return
+            self._versiones[capa] = version
+            for clave in [c for c in self._memoria if c[0] == capa and c[1] != version]:
+                del self._memoria[clave]
+        directorio_capa = os.path.join(self.directorio, capa)
+        directorio_version = os.path.join(directorio_capa, version)
+        try:
+            os.makedirs(directorio_version, exist_ok=True)
+            # La fecha del directorio marca cuándo un worker pasó a esta versión
+            os.utime(directorio_version)
+            anteriores = [
+                (os.path.getmtime(os.path.join(directorio_capa, nombre)), nombre)
+                for nombre in os.listdir(directorio_capa)
+                if nombre != version
+            ]
+        except OSError as e:
+            logger.warning(f"No se pudieron revisar las teselas en disco de {capa}: {str(e)}")
+            return
+        # Las que empiezan con punto son versiones ya retiradas que no se terminaron de borrar
+        retiradas = [nombre for _, nombre in anteriores if nombre.startswith(".")]
+        anteriores = sorted((anterior for anterior in anteriores if not anterior[1].startswith(".")), reverse=True)
+        for nombre in retiradas:
+            shutil.rmtree(os.path.join(directorio_capa, nombre), ignore_errors=True)
+        for _, nombre in anteriores[self.versiones - 1:]:
+            # Se retira con un rename atómico antes de borrarla: otro worker que aún use esa
+            # versión no encuentra la tesela y la vuelve a generar, en vez de leer un árbol a medio borrar
+            retirado = os.path.join(directorio_capa, f".{nombre}.{os.getpid()}.{threading.get_ident()}")
+            try:
+                os.rename(os.path.join(directorio_capa, nombre), retirado)
+            except OSError:
+                continue
+            shutil.rmtree(retirado, ignore_errors=True)
+        logger.info(f"Teselas de {capa} invalidadas, versión vigente {version}")
+
+    def _guardar_memoria(self, clave, png):
+        with self._lock:
+            self._memoria[clave] = png
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def obtener(self, capa, version, z, x, y, generar):
+        """Devuelve el PNG de la tesela, generándolo con generar() solo si no está en cache"""
+        clave = (capa, version, z, x, y)
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return self._memoria[clave]
+
+        self._invalidar(capa, version)
+        ruta = self._ruta(capa, version, z, x, y)
+        try:
+            with open(ruta, "rb") as archivo:
+                png = archivo.read()
+            with self._lock:
+                self.aciertos_disco += 1
+            self._guardar_memoria(clave, png)
+            return png
+        except FileNotFoundError:
+            pass
+
+        png = generar()
+        with self._lock:
+            self.generadas += 1
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            fd, ruta_tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".part")
+            with os.fdopen(fd, "wb") as archivo:
+                archivo.write(png)
+            os.replace(ruta_tmp, ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la tesela en disco: {str(e)}")
+        self._guardar_memoria(clave, png)
+        return png
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "generadas": self.generadas,
+                "entradas_memoria": len(self._memoria),
+                "max_memoria": self.max_memoria,
+                "capas": dict(self._versiones),
+            }
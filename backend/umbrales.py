@@ -0,0 +1,88 @@
+import re
+import logging
+
+import numpy as np
+import xarray as xr
+
+from grilla import indices_cercanos, lista_sin_nan
+
+logger = logging.getLogger(__name__)
+
+PATRON_PERIODO = re.compile(r"rl_(\d+\.?\d*)")
+
+
+def periodo_retorno(nombre):
+    """Extrae el periodo de retorno del nombre de un archivo de umbrales (rl_2.0 -> 2.0)"""
+    coincidencia = PATRON_PERIODO.search(nombre)
+    return float(coincidencia.group(1)) if coincidencia else None
+
+
+class CuboUmbrales:
+    """
+    Umbrales de todos los periodos de retorno apilados en un arreglo (return_period, lat, lon).
+
+    Los archivos de umbrales son estáticos, por lo que se leen una sola vez y cada consulta
+    obtiene todos los periodos de retorno con una única indexación vectorizada.
+    """
+
+    def __init__(self, datasets):
+        """datasets: diccionario nombre de archivo -> dataset de umbrales con dimensiones (lat, lon)"""
+        entradas = [(periodo_retorno(nombre), nombre, ds) for nombre, ds in datasets.items()]
+        entradas = sorted(e for e in entradas if e[0] is not None)
+        if not entradas:
+            raise ValueError("No hay archivos de umbrales válidos")
+
+        # Algunos archivos tienen una fila/columna extra; todos se llevan a la grilla unión.
+        # Rellenar con el vecino más cercano conserva el resultado de sel(method="nearest") por archivo.
+        grillas = xr.align(*[ds[list(ds.data_vars)[0]] for _, _, ds in entradas], join="outer")
+        self.lat = np.sort(grillas[0]["lat"].values)[::-1]
+        self.lon = np.sort(grillas[0]["lon"].values)
+
+        capas = []
+        self.nombres = []
+        self.variables = []
+        for _, nombre, ds in entradas:
+            variable = list(ds.data_vars.keys())[0]
+            capa = ds[variable].transpose("lat", "lon").reindex(lat=self.lat, lon=self.lon, method="nearest")
+            capas.append(capa.values.astype(np.float64))
+            self.nombres.append(nombre)
+            self.variables.append(variable)
+
+        self.periodos = np.array([e[0] for e in entradas])
+        self.valores = np.stack(capas)
+        logger.info(f"Cubo de umbrales cargado: {self.valores.shape} (periodos {self.periodos.tolist()})")
+
+    @property
+    def cubo(self):
+        return xr.DataArray(
+            self.valores,
+            dims=("return_period", "lat", "lon"),
+            coords={"return_period": self.periodos, "lat": self.lat, "lon": self.lon},
+            name="return_threshold",
+        )
+
+    def indices(self, lat, lon):
+        return indices_cercanos(self.lat, lat), indices_cercanos(self.lon, lon)
+
+    def consultar(self, lat, lon):
+        """Devuelve {nombre_archivo: {variable: umbral}} para un punto, igual que getValue sobre cada archivo"""
+        i, j = self.indices(lat, lon)
+        valores = self.valores[:, i, j].tolist()
+        return {
+            nombre: {variable: valor}
+            for nombre, variable, valor in zip(self.nombres, self.variables, valores)
+        }
+
+    def columnas(self, lat, lon):
+        """Umbrales del punto en el orden de self.periodos, para la respuesta en columnas"""
+        i, j = self.indices(lat, lon)
+        return lista_sin_nan(self.valores[:, i, j])
+
+    def consultar_lote(self, lats, lons):
+        """Devuelve una lista con los umbrales de cada punto, resuelta con una sola indexación"""
+        i, j = self.indices(lats, lons)
+        valores = self.valores[:, i, j].T.tolist()
+        return [
+            {nombre: {variable: valor} for nombre, variable, valor in zip(self.nombres, self.variables, fila)}
+            for fila in valores
+        ]
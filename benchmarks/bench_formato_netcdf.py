@@ -0,0 +1,112 @@
+"""
+Micro-benchmark de los formatos de los archivos diarios de download/ (netcdf_compacto.py):
+tamaño, tiempo de escritura, carga completa (lo que hace la caché del backend), lectura de la
+serie de un punto sin cargar el archivo y errores de ida y vuelta (absoluto en la media,
+relativo en la desviación), con "float" como referencia.
+
+Uso: python benchmarks/bench_formato_netcdf.py [archivo.nc]
+Por defecto usa el archivo diario de los datos sintéticos (benchmarks/fixtures.py).
+"""
+import os
+import sys
+import time
+import tempfile
+import timeit
+
+import numpy as np
+import xarray as xr
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+from netcdf_compacto import FORMATOS, PRECISION_CAUDAL, PRECISION_RELATIVA, celdas_fuera_de_tolerancia, guardar  # noqa: E402
+
+ABSOLUTAS = ["mean_dis24"]
+RELATIVAS = ["std_dis24"]
+VARIABLES = ABSOLUTAS + RELATIVAS
+FIXTURES_DIR = os.path.join(tempfile.gettempdir(), "inundacion_bench")
+
+
+def series_punto(dataset, puntos):
+    """Serie completa de media y desviación en cada punto (índices de grilla), leyendo del archivo"""
+    return [
+        [dataset[nombre].isel(latitude=i, longitude=j).values for nombre in VARIABLES]
+        for i, j in puntos
+    ]
+
+
+def errores(dataset, ruta):
+    """Error absoluto máximo de la media, error relativo máximo de la desviación y si los ceros se conservan"""
+    with xr.open_dataset(ruta) as leido:
+        media, desviacion = (leido[nombre].transpose(*dataset[nombre].dims).values for nombre in VARIABLES)
+    original_media, original_desviacion = (dataset[nombre].values for nombre in VARIABLES)
+    validos = ~np.isnan(original_desviacion) & (original_desviacion != 0)
+    absoluto = float(np.nanmax(np.abs(media.astype(np.float64) - original_media), initial=0.0))
+    relativo = float(np.max(np.abs(desviacion[validos] / original_desviacion[validos] - 1), initial=0.0))
+    ceros = all(
+        np.all(copia[original == 0] == 0)
+        for copia, original in ((media, original_media), (desviacion, original_desviacion))
+    )
+    return absoluto, relativo, ceros
+
+
+def abrir_y_leer_punto(ruta, punto):
+    """Caso en frío: abrir el archivo, leer la serie de un punto y cerrarlo"""
+    with xr.open_dataset(ruta) as ds:
+        return series_punto(ds, [punto])
+
+
+def main():
+    if len(sys.argv) > 1:
+        archivo = sys.argv[1]
+    else:
+        fixtures.generar(FIXTURES_DIR)
+        archivo = os.path.join(FIXTURES_DIR, "repositorio", "download", f"{fixtures.FECHA}.nc")
+    with xr.open_dataset(archivo) as ds:
+        dataset = ds[VARIABLES].load()
+
+    rng = np.random.default_rng(0)
+    puntos = list(zip(rng.integers(0, dataset.sizes["latitude"], 50), rng.integers(0, dataset.sizes["longitude"], 50)))
+    repeticiones = 5
+    resultados = {}
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for formato in FORMATOS:
+            ruta = os.path.join(directorio, f"{formato}.nc")
+            inicio = time.perf_counter()
+            assert guardar(dataset, ruta, ABSOLUTAS, RELATIVAS, formato) == formato, f"El formato {formato} no pasó la ida y vuelta"
+            escritura = time.perf_counter() - inicio
+            assert celdas_fuera_de_tolerancia(dataset, ruta, ABSOLUTAS, RELATIVAS, formato) == 0
+            absoluto, relativo, ceros = errores(dataset, ruta)
+            assert ceros, f"Los ceros no se conservan en {formato}"
+
+            def carga_completa():
+                with xr.open_dataset(ruta) as ds:
+                    ds.load()
+
+            with xr.open_dataset(ruta) as ds:
+                perezoso = min(timeit.repeat(lambda: series_punto(ds, puntos), number=1, repeat=repeticiones)) / len(puntos)
+            resultados[formato] = {
+                "tamano_kb": os.path.getsize(ruta) / 1024,
+                "escritura_ms": escritura * 1e3,
+                "carga_ms": min(timeit.repeat(carga_completa, number=1, repeat=repeticiones)) * 1e3,
+                "punto_ms": perezoso * 1e3,
+                "punto_frio_ms": min(timeit.repeat(lambda: abrir_y_leer_punto(ruta, puntos[0]), number=1, repeat=repeticiones)) * 1e3,
+                "error_media": absoluto,
+                "error_desviacion": relativo,
+            }
+
+    referencia = resultados["float"]
+    print(f"Archivo: {os.path.basename(archivo)} {dict(dataset.sizes)}, precisión {PRECISION_CAUDAL} m3/s "
+          f"en la media y {PRECISION_RELATIVA:.1%} en la desviación")
+    print(f"{'formato':<11} {'tamaño KB':>10} {'relación':>9} {'escritura ms':>13} {'carga ms':>9} "
+          f"{'punto ms':>9} {'punto frío ms':>14} {'err. media':>11} {'err. rel. desv.':>16}")
+    for formato, r in resultados.items():
+        print(f"{formato:<11} {r['tamano_kb']:10.1f} {referencia['tamano_kb'] / r['tamano_kb']:8.1f}x "
+              f"{r['escritura_ms']:13.2f} {r['carga_ms']:9.2f} {r['punto_ms']:9.3f} {r['punto_frio_ms']:14.2f} {r['error_media']:11.2g} {r['error_desviacion']:16.2g}")
+
+
+if __name__ == "__main__":
+    main()
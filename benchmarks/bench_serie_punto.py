@@ -0,0 +1,96 @@
+"""
+Micro-benchmark de getMeanStdForAllForecasts: implementación anterior (un .sel por
+forecast_period y variable) contra la extracción vectorizada actual.
+
+Uso: python benchmarks/bench_serie_punto.py [archivo.nc]
+Por defecto usa el pronóstico más reciente de download/.
+"""
+import os
+import sys
+import glob
+import logging
+import timeit
+
+import numpy as np
+import xarray as xr
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "backend"))
+os.environ.setdefault("PRECARGAR", "0")
+
+import app  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+
+def getMeanStdForAllForecasts_anterior(dataset, lat, lon):
+    """Copia literal de la implementación anterior (commit baseline), usada como referencia"""
+    forecast_periods = dataset['forecast_period'].values
+
+    # Convertir a horas (asumiendo que forecast_period está en nanosegundos)
+    forecast_hours = (forecast_periods / (1e9 * 60 * 60)).astype(int)
+    forecast_hours = [int(h) for h in forecast_hours]
+
+    mean_results = {}
+    std_results = {}
+
+    for fp, hours in zip(forecast_periods, forecast_hours):
+        # Ajustar longitud
+        adjusted_lon = (lon + 360) % 360
+
+        # Obtener valores para mean_dis24
+        mean_val = dataset['mean_dis24'].sel(
+            latitude=lat,
+            longitude=adjusted_lon,
+            forecast_period=fp,
+            method="nearest"
+        ).values.item()
+
+        # Obtener valores para std_dis24
+        std_val = dataset['std_dis24'].sel(
+            latitude=lat,
+            longitude=adjusted_lon,
+            forecast_period=fp,
+            method="nearest"
+        ).values.item()
+
+        mean_results[hours] = float(mean_val)
+        std_results[hours] = float(std_val)
+
+    return mean_results, std_results
+
+
+def main():
+    if len(sys.argv) > 1:
+        archivo = sys.argv[1]
+    else:
+        archivo = sorted(glob.glob(os.path.join(RAIZ, "download", "*.nc")))[-1]
+    with xr.open_dataset(archivo) as ds:
+        dataset = ds.load()
+
+    rng = np.random.default_rng(0)
+    puntos = list(zip(rng.uniform(-32.2, -29.1, 50), rng.uniform(-71.6, -69.9, 50)))
+
+    # Ambas implementaciones deben devolver exactamente las mismas series (NaN incluidos)
+    for lat, lon in puntos:
+        for esperado, obtenido in zip(getMeanStdForAllForecasts_anterior(dataset, lat, lon),
+                                      app.getMeanStdForAllForecasts(dataset, lat, lon)):
+            assert list(esperado) == list(obtenido)
+            np.testing.assert_array_equal(list(esperado.values()), list(obtenido.values()))
+
+    repeticiones = 5
+    anterior = min(timeit.repeat(
+        lambda: [getMeanStdForAllForecasts_anterior(dataset, lat, lon) for lat, lon in puntos],
+        number=1, repeat=repeticiones)) / len(puntos)
+    actual = min(timeit.repeat(
+        lambda: [app.getMeanStdForAllForecasts(dataset, lat, lon) for lat, lon in puntos],
+        number=1, repeat=repeticiones)) / len(puntos)
+
+    print(f"Archivo: {os.path.basename(archivo)} ({dataset.sizes['forecast_period']} forecast_periods)")
+    print(f"Anterior:    {anterior * 1e3:8.3f} ms por punto")
+    print(f"Vectorizado: {actual * 1e3:8.3f} ms por punto")
+    print(f"Aceleración: {anterior / actual:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Prueba de carga del backend: varios clientes concurrentes simulan clics sobre el mapa
+(/consultar en puntos al azar dentro de las regiones) o el desplazamiento por teselas (/tiles)
+y se informa el rendimiento sostenido y la distribución de latencias.
+
+Uso: python benchmarks/carga_backend.py [--url http://localhost:5000] [--clientes 16]
+                                        [--duracion 30] [--endpoint consultar|tiles]
+El backend debe estar corriendo, por ejemplo: cd backend && gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+
+import numpy as np
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_bboxes():
+    with open(os.path.join(RAIZ, "regiones.json")) as archivo:
+        return [region["bbox"] for region in json.load(archivo).values()]
+
+
+def tesela_de_punto(lat, lon, z):
+    """Tesela XYZ que contiene el punto"""
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return x, y
+
+
+def cliente(url, endpoint, bboxes, fin, semilla, latencias, errores):
+    rng = np.random.default_rng(semilla)
+    sesion = requests.Session()
+    while time.monotonic() < fin:
+        bbox = bboxes[rng.integers(len(bboxes))]
+        lat = rng.uniform(bbox["south"], bbox["north"])
+        lon = rng.uniform(bbox["west"], bbox["east"])
+        if endpoint == "tiles":
+            z = int(rng.integers(6, 11))
+            x, y = tesela_de_punto(lat, lon, z)
+            destino, parametros = f"{url}/tiles/caudal/{z}/{x}/{y}.png", {"hora": 24}
+        else:
+            destino, parametros = f"{url}/consultar", {"lat": f"{lat:.4f}", "lon": f"{lon:.4f}"}
+
+        inicio = time.perf_counter()
+        try:
+            respuesta = sesion.get(destino, params=parametros, timeout=60)
+            # 404 es una respuesta válida (punto sin datos), no un error del servidor
+            if respuesta.status_code >= 500:
+                errores.append(respuesta.status_code)
+        except requests.RequestException as e:
+            errores.append(type(e).__name__)
+        latencias.append(time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=30.0, help="segundos")
+    parser.add_argument("--endpoint", choices=["consultar", "tiles"], default="consultar")
+    args = parser.parse_args()
+
+    bboxes = cargar_bboxes()
+    # Una solicitud previa para que la primera descarga de datos no cuente en las latencias
+    requests.get(f"{args.url}/consultar", params={"lat": bboxes[0]["south"] + 0.5, "lon": bboxes[0]["west"] + 0.5}, timeout=120)
+
+    latencias, errores = [], []
+    fin = time.monotonic() + args.duracion
+    hilos = [
+        threading.Thread(target=cliente, args=(args.url, args.endpoint, bboxes, fin, i, latencias, errores))
+        for i in range(args.clientes)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.perf_counter() - inicio
+
+    if not latencias:
+        print("No se completó ninguna solicitud")
+        sys.exit(1)
+    ms = np.array(latencias) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    print(f"Endpoint: /{args.endpoint}, {args.clientes} clientes, {transcurrido:.1f} s")
+    print(f"Solicitudes: {len(ms)} ({len(ms) / transcurrido:.1f} por segundo), errores: {len(errores)}")
+    print(f"Latencia: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, máxima {ms.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
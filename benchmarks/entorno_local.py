@@ -0,0 +1,168 @@
+"""
+Reemplazos locales de los servicios externos, para medir sin conexión y sin la variabilidad de la red:
+
+- AdaptadorGitHub: adaptador de requests que responde la API de contenidos de GitHub y las
+  descargas de raw.githubusercontent.com desde un directorio local (se monta en la sesión HTTP).
+- instalar_cds: módulo cdsapi cuyo Client.retrieve copia un archivo local.
+- ServidorECMWF: servidor HTTP local con solicitudes de rango, con la estructura de rutas de
+  ECMWF open data.
+"""
+import io
+import os
+import sys
+import json
+import types
+import shutil
+import hashlib
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+def sha_blob(ruta):
+    """SHA de git del contenido del archivo, el mismo que informa la API de GitHub"""
+    with open(ruta, "rb") as archivo:
+        datos = archivo.read()
+    return hashlib.sha1(b"blob %d\0" % len(datos) + datos).hexdigest()
+
+
+class AdaptadorGitHub(BaseAdapter):
+    """
+    Atiende /repos/<repo>/contents/<ruta>, /repos/<repo>/commits/HEAD y las descargas desde raiz.
+    Todas las ramas (parámetro ref del listado) comparten el mismo directorio.
+    """
+
+    def __init__(self, raiz, repo, rama="main"):
+        super().__init__()
+        self.raiz = raiz
+        self.repo = repo
+        self.rama = rama
+        self.solicitudes = 0
+
+    def _respuesta(self, request, estado, contenido, tipo="application/json"):
+        respuesta = Response()
+        respuesta.status_code = estado
+        respuesta.raw = io.BytesIO(contenido)
+        respuesta.headers = CaseInsensitiveDict({"Content-Type": tipo, "Content-Length": str(len(contenido))})
+        respuesta.url = request.url
+        respuesta.request = request
+        respuesta.encoding = "utf-8"
+        return respuesta
+
+    def listado(self, ruta, rama=None):
+        directorio = os.path.join(self.raiz, ruta)
+        if not os.path.isdir(directorio):
+            return None
+        return [
+            {
+                "name": nombre,
+                "path": f"{ruta}/{nombre}",
+                "sha": sha_blob(os.path.join(directorio, nombre)),
+                "size": os.path.getsize(os.path.join(directorio, nombre)),
+                "type": "file",
+                "download_url": f"https://raw.githubusercontent.com/{self.repo}/{rama or self.rama}/{ruta}/{nombre}",
+            }
+            for nombre in sorted(os.listdir(directorio))
+            if os.path.isfile(os.path.join(directorio, nombre))
+        ]
+
+    def send(self, request, **kwargs):
+        self.solicitudes += 1
+        url = urlparse(request.url)
+        contenidos = f"/repos/{self.repo}/contents/"
+        if url.netloc == "api.github.com" and url.path.startswith(contenidos):
+            rama = parse_qs(url.query).get("ref", [None])[0]
+            archivos = self.listado(url.path[len(contenidos):].strip("/"), rama)
+            if archivos is not None:
+                return self._respuesta(request, 200, json.dumps(archivos).encode("utf-8"))
+        elif url.netloc == "api.github.com" and url.path == f"/repos/{self.repo}/commits/HEAD":
+            firma = hashlib.sha1()
+            for actual, _, nombres in sorted(os.walk(self.raiz)):
+                for nombre in sorted(nombres):
+                    firma.update(f"{actual}/{nombre}:{os.path.getmtime(os.path.join(actual, nombre))}".encode("utf-8"))
+            return self._respuesta(request, 200, firma.hexdigest().encode("utf-8"), "text/plain")
+        elif url.netloc == "raw.githubusercontent.com":
+            prefijo = f"/{self.repo}/"
+            # /<repo>/<rama>/<ruta>
+            partes = url.path[len(prefijo):].split("/", 1) if url.path.startswith(prefijo) else []
+            ruta = os.path.join(self.raiz, partes[1]) if len(partes) == 2 else None
+            if ruta and os.path.isfile(ruta):
+                with open(ruta, "rb") as archivo:
+                    return self._respuesta(request, 200, archivo.read(), "application/octet-stream")
+        return self._respuesta(request, 404, b'{"message": "Not Found"}')
+
+    def close(self):
+        pass
+
+
+def montar_github(sesion, raiz, repo):
+    """Redirige a raiz las solicitudes de la sesión a GitHub; devuelve el adaptador montado"""
+    adaptador = AdaptadorGitHub(raiz, repo)
+    sesion.mount("https://api.github.com/", adaptador)
+    sesion.mount("https://raw.githubusercontent.com/", adaptador)
+    return adaptador
+
+
+def instalar_cds(archivo):
+    """
+    Registra un módulo cdsapi local: Client.retrieve copia archivo en el destino pedido. Debe
+    llamarse antes de importar downloadGLOFAS, que crea el cliente al importarse.
+    """
+    class Client:
+        def __init__(self, *args, **kwargs):
+            self.solicitudes = []
+
+        def retrieve(self, dataset, request, destino):
+            self.solicitudes.append((dataset, request))
+            shutil.copyfile(archivo, destino)
+
+    modulo = types.ModuleType("cdsapi")
+    modulo.Client = Client
+    sys.modules["cdsapi"] = modulo
+    return modulo
+
+
+class _ManejadorRangos(SimpleHTTPRequestHandler):
+    """Archivos estáticos con soporte de Range: bytes=inicio-fin (respuesta 206)"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        rango = self.headers.get("Range")
+        ruta = self.translate_path(self.path)
+        if not rango or not os.path.isfile(ruta):
+            return super().do_GET()
+        inicio, fin = (int(valor) for valor in rango.split("=", 1)[1].split("-"))
+        with open(ruta, "rb") as archivo:
+            archivo.seek(inicio)
+            datos = archivo.read(fin - inicio + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(datos)))
+        self.send_header("Content-Range", f"bytes {inicio}-{inicio + len(datos) - 1}/{os.path.getsize(ruta)}")
+        self.end_headers()
+        self.wfile.write(datos)
+
+
+class ServidorECMWF:
+    """Servidor local de los GRIB de ECMWF (raiz/<fecha>/<hora>z/...); usar como context manager"""
+
+    def __init__(self, raiz):
+        manejador = lambda *args, **kwargs: _ManejadorRangos(*args, directory=raiz, **kwargs)  # noqa: E731
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), manejador)
+        self.servidor.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
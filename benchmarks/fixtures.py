@@ -0,0 +1,232 @@
+"""
+Datos sintéticos con la forma de los reales, para medir sin conexión:
+
+- glofas_crudo.nc: dis24 del ensamble como lo entrega CDS (corrida x plazo x miembro x lat x lon),
+  sobre la grilla de 0.05° de la región.
+- repositorio/download/<fecha>.nc: medias y desviaciones del ensamble, como las publica el proceso.
+- repositorio/FloodThreshold/flood_threshold_glofas_v4_rl_<periodo>_<región>.nc: un archivo por
+  periodo de retorno, en la grilla de umbrales (una fila y una columna más que la del pronóstico).
+- region.geojson y zonas.geojson: contorno de la región y una capa de zonas que la cubre.
+- ecmwf/: GRIB2 globales de 0.25° por paso con su índice .index, como los de ECMWF open data
+  (requiere eccodes; sin eccodes no se generan y se omiten los casos meteorológicos).
+
+Uso: python benchmarks/fixtures.py [directorio]
+"""
+import os
+import sys
+import json
+import warnings
+
+import numpy as np
+import xarray as xr
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from regiones import cargar_regiones  # noqa: E402
+
+# Versión del formato de los datos sintéticos: si cambia se regeneran
+VERSION = 1
+FECHA = "20261018"
+MIEMBROS = 51
+PLAZOS = 15
+PASO_GRILLA = 0.05
+PERIODOS = (1.5, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0)
+# Parámetros de cada GRIB de ECMWF: los que usa el proceso más otros que la ingesta por rangos omite
+PARAMETROS_ECMWF = (("tp", 228, "accum"), ("2t", 167, "instant"), ("10u", 165, "instant"),
+                    ("10v", 166, "instant"), ("msl", 151, "instant"), ("sp", 134, "instant"))
+
+
+def centros(minimo, maximo, paso=PASO_GRILLA):
+    """Centros de celda ((k + 1/2) * paso) de la grilla de GloFAS comprendidos entre minimo y maximo"""
+    k = np.arange(np.ceil(minimo / paso - 0.5), np.floor(maximo / paso - 0.5) + 1)
+    return np.round((k + 0.5) * paso, 4)
+
+
+def caudal_base(latitudes, longitudes, rng):
+    """Campo de caudal con unas pocas celdas de río de caudal alto y el resto casi seco"""
+    forma = (len(latitudes), len(longitudes))
+    caudal = rng.gamma(0.3, 2.0, forma)
+    for _ in range(6):
+        # Cauces de oeste a este con un caudal que crece aguas abajo
+        fila = rng.integers(forma[0])
+        desvio = np.cumsum(rng.integers(-1, 2, forma[1]))
+        filas = np.clip(fila + desvio, 0, forma[0] - 1)
+        caudal[filas, np.arange(forma[1])] += np.linspace(200, 5, forma[1]) * rng.uniform(0.5, 2)
+    return caudal
+
+
+def generar_glofas(directorio, region, rng):
+    """Archivo crudo de CDS, archivo diario de download/ y umbrales de la región"""
+    b = region["bbox"]
+    latitudes, longitudes = centros(b["south"], b["north"])[::-1], centros(b["west"], b["east"])
+    base = caudal_base(latitudes, longitudes, rng)
+
+    plazos = np.arange(1, PLAZOS + 1)
+    tendencia = 1 + 0.6 * np.sin(plazos / PLAZOS * np.pi)
+    ruido = rng.lognormal(0, 0.35, (1, PLAZOS, MIEMBROS) + base.shape)
+    dis24 = (base * tendencia[None, :, None, None, None] * ruido).astype(np.float32)
+    dis24[..., base < 0.05] = np.nan  # Celdas de mar o sin red de drenaje
+
+    referencia = np.array([np.datetime64(f"{FECHA[:4]}-{FECHA[4:6]}-{FECHA[6:]}", "ns")])
+    periodo = (plazos * 24).astype("timedelta64[h]").astype("timedelta64[ns]")
+    coords = {
+        "forecast_reference_time": referencia,
+        "forecast_period": periodo,
+        "number": np.arange(MIEMBROS),
+        "latitude": latitudes,
+        "longitude": longitudes % 360,
+    }
+    crudo = xr.Dataset(
+        {"dis24": (("forecast_reference_time", "forecast_period", "number", "latitude", "longitude"), dis24)},
+        coords={**coords, "valid_time": ("forecast_period", referencia[0] + periodo)},
+    )
+    crudo.to_netcdf(os.path.join(directorio, "glofas_crudo.nc"))
+
+    carpeta = os.path.join(directorio, "repositorio", "download")
+    os.makedirs(carpeta, exist_ok=True)
+    dims = ("forecast_period", "forecast_reference_time", "latitude", "longitude")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # Celdas sin ningún miembro válido
+        media = np.nanmean(dis24, axis=2).transpose(1, 0, 2, 3)
+        desviacion = np.nanstd(dis24, axis=2).transpose(1, 0, 2, 3)
+    xr.Dataset(
+        {"mean_dis24": (dims, media), "std_dis24": (dims, desviacion)},
+        coords={k: v for k, v in coords.items() if k != "number"},
+    ).to_netcdf(os.path.join(carpeta, f"{FECHA}.nc"))
+
+    # Umbrales: una fila más al norte y una columna más al oeste que el pronóstico, longitudes en -180..180
+    lat_umbral = centros(b["south"], b["north"] + PASO_GRILLA)[::-1]
+    lon_umbral = centros(b["west"] - PASO_GRILLA, b["east"])
+    relleno = np.pad(base, ((1, 0), (1, 0)), mode="edge")
+    carpeta = os.path.join(directorio, "repositorio", "FloodThreshold")
+    os.makedirs(carpeta, exist_ok=True)
+    for periodo_retorno in PERIODOS:
+        nombre = f"rl_{periodo_retorno}"
+        umbral = relleno * (1.1 + 0.35 * np.log(periodo_retorno))
+        xr.Dataset(
+            {nombre: (("lat", "lon"), umbral)},
+            coords={"lat": lat_umbral, "lon": lon_umbral},
+        ).to_netcdf(os.path.join(carpeta, f"flood_threshold_glofas_v4_{nombre}_{region['nombre']}.nc"))
+
+
+def caja(oeste, sur, este, norte):
+    return {"type": "Polygon", "coordinates": [[[oeste, sur], [este, sur], [este, norte], [oeste, norte], [oeste, sur]]]}
+
+
+def generar_geojson(directorio, region, filas=5, columnas=3):
+    """Contorno de la región (un octágono dentro del bbox) y una capa de filas x columnas zonas"""
+    b = region["bbox"]
+    ancho, alto = b["east"] - b["west"], b["north"] - b["south"]
+    contorno = [
+        (b["west"] + ancho * x, b["south"] + alto * y)
+        for x, y in ((0.3, 0), (0.7, 0), (1, 0.3), (1, 0.7), (0.7, 1), (0.3, 1), (0, 0.7), (0, 0.3), (0.3, 0))
+    ]
+    with open(os.path.join(directorio, "region.geojson"), "w") as archivo:
+        json.dump({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"nombre": region["nombre"]},
+             "geometry": {"type": "Polygon", "coordinates": [contorno]}},
+        ]}, archivo)
+
+    zonas = []
+    for i in range(filas):
+        for j in range(columnas):
+            zonas.append({"type": "Feature", "properties": {"Comuna": f"Zona {i * columnas + j + 1:02d}"}, "geometry": caja(
+                b["west"] + ancho * j / columnas, b["north"] - alto * (i + 1) / filas,
+                b["west"] + ancho * (j + 1) / columnas, b["north"] - alto * i / filas,
+            )})
+    with open(os.path.join(directorio, "zonas.geojson"), "w") as archivo:
+        json.dump({"type": "FeatureCollection", "features": zonas}, archivo)
+
+
+def generar_ecmwf(directorio, pasos, fecha=FECHA):
+    """GRIB2 globales de 0.25° por paso y su índice .index, con la estructura de rutas de ECMWF"""
+    import eccodes
+
+    carpeta = os.path.join(directorio, "ecmwf", fecha, "00z", "ifs", "0p25", "oper")
+    os.makedirs(carpeta, exist_ok=True)
+    ni, nj = 1440, 721
+    latitudes = np.linspace(90, -90, nj)
+    longitudes = np.arange(ni) * 0.25 - 180
+    lat, lon = np.meshgrid(np.radians(latitudes), np.radians(longitudes), indexing="ij")
+    campos = {
+        "2t": 288 - 40 * np.abs(np.sin(lat)),
+        "10u": 5 * np.cos(lon),
+        "10v": 5 * np.sin(lon),
+        "msl": 101325 + 500 * np.sin(lat * 3),
+        "sp": 98000 + 2000 * np.cos(lon * 2),
+    }
+    lluvia = np.maximum(0, np.sin(lat * 3) * np.cos(lon * 2)) * 0.001
+
+    for paso in pasos:
+        ruta = os.path.join(carpeta, f"{fecha}000000-{paso}h-oper-fc.grib2")
+        indice = []
+        with open(ruta, "wb") as archivo:
+            for nombre, id_parametro, tipo in PARAMETROS_ECMWF:
+                h = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+                for clave, valor in (("Ni", ni), ("Nj", nj),
+                                     ("latitudeOfFirstGridPointInDegrees", 90), ("longitudeOfFirstGridPointInDegrees", 180),
+                                     ("latitudeOfLastGridPointInDegrees", -90), ("longitudeOfLastGridPointInDegrees", 179.75),
+                                     ("iDirectionIncrementInDegrees", 0.25), ("jDirectionIncrementInDegrees", 0.25),
+                                     ("dataDate", int(fecha)), ("dataTime", 0), ("paramId", id_parametro)):
+                    eccodes.codes_set(h, clave, valor)
+                if tipo == "accum":
+                    eccodes.codes_set(h, "stepType", "accum")
+                    eccodes.codes_set_string(h, "stepRange", f"0-{paso}")
+                    valores = lluvia * paso / 12
+                else:
+                    eccodes.codes_set(h, "step", paso)
+                    valores = campos[nombre] + paso / 12
+                if nombre == "2t":
+                    eccodes.codes_set(h, "typeOfFirstFixedSurface", 103)
+                    eccodes.codes_set(h, "scaleFactorOfFirstFixedSurface", 0)
+                    eccodes.codes_set(h, "scaledValueOfFirstFixedSurface", 2)
+                eccodes.codes_set(h, "bitsPerValue", 16)
+                eccodes.codes_set_values(h, valores.ravel())
+                mensaje = eccodes.codes_get_message(h)
+                indice.append({
+                    "domain": "g", "date": fecha, "time": "0000", "expver": "0001", "class": "od",
+                    "type": "fc", "stream": "oper", "step": str(paso), "levtype": "sfc",
+                    "param": nombre, "_offset": archivo.tell(), "_length": len(mensaje),
+                })
+                archivo.write(mensaje)
+                eccodes.codes_release(h)
+        with open(ruta[:-len(".grib2")] + ".index", "w") as archivo:
+            archivo.writelines(json.dumps(entrada) + "\n" for entrada in indice)
+
+
+def generar(directorio, pasos_meteo=(12, 24)):
+    """
+    Genera (o reutiliza, si ya existen con la misma versión y pasos) los datos sintéticos en
+    directorio. Devuelve la descripción guardada en fixtures.json.
+    """
+    descripcion_ruta = os.path.join(directorio, "fixtures.json")
+    nombre, region = next(iter(cargar_regiones().items()))
+    esperado = {"version": VERSION, "fecha": FECHA, "region": nombre, "pasos_meteo": list(pasos_meteo)}
+    if os.path.exists(descripcion_ruta):
+        with open(descripcion_ruta) as archivo:
+            descripcion = json.load(archivo)
+        if {k: descripcion.get(k) for k in esperado} == esperado:
+            return descripcion
+
+    print(f"Generando datos sintéticos en {directorio}...")
+    os.makedirs(directorio, exist_ok=True)
+    rng = np.random.default_rng(0)
+    region = {**region, "nombre": nombre}
+    generar_glofas(directorio, region, rng)
+    generar_geojson(directorio, region)
+    try:
+        generar_ecmwf(directorio, pasos_meteo)
+        ecmwf = True
+    except ImportError:
+        print("eccodes no está instalado: no se generan los GRIB de ECMWF")
+        ecmwf = False
+
+    descripcion = {**esperado, "ecmwf": ecmwf, "bbox": region["bbox"]}
+    with open(descripcion_ruta, "w") as archivo:
+        json.dump(descripcion, archivo, indent=2)
+    return descripcion
+
+
+if __name__ == "__main__":
+    print(generar(sys.argv[1] if len(sys.argv) > 1 else "fixtures_bench"))
@@ -0,0 +1,375 @@
+"""
+Suite de benchmarks reproducible, sin conexión, de la ruta de consulta y de los procesos diarios.
+
+Usa datos sintéticos con la forma de los reales (benchmarks/fixtures.py) y reemplazos locales de
+GitHub, CDS y ECMWF (benchmarks/entorno_local.py). Para cada caso informa percentiles de latencia,
+rendimiento (operaciones por segundo) y memoria máxima asignada (tracemalloc), y los compara con
+la línea base guardada.
+
+Uso: python benchmarks/suite.py [--casos consultar,serie_punto,...] [--repeticiones N]
+                                [--base benchmarks/linea_base.json] [--guardar-base]
+                                [--tolerancia 0.25] [--memoria-minima 1] [--salida resultados.json]
+Termina con código 1 si algún caso es más lento (p50) o usa más memoria que la línea base por
+más que la tolerancia. Las diferencias de memoria menores que --memoria-minima MB no cuentan.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import warnings
+import tracemalloc
+import subprocess
+import time
+from itertools import cycle
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(RAIZ))
+sys.path.insert(0, os.path.join(os.path.dirname(RAIZ), "backend"))
+
+import fixtures  # noqa: E402
+from entorno_local import ServidorECMWF, instalar_cds, montar_github  # noqa: E402
+
+BASE_DEFECTO = os.path.join(RAIZ, "linea_base.json")
+FIXTURES_DIR = os.path.join(tempfile.gettempdir(), "inundacion_bench")
+GITHUB_REPO = "alimunozq/InundacionNetCDF"
+# Aumento de memoria (MB) por debajo del cual no se aplica la tolerancia relativa: en los casos que
+# asignan pocos KB la variación del asignador basta para superar cualquier proporción
+MEMORIA_MINIMA_MB = 1.0
+
+# Casos registrados: nombre -> (grupo, repeticiones por defecto, función que prepara la operación)
+CASOS = {}
+
+
+def caso(nombre, grupo, repeticiones):
+    def registrar(preparar):
+        CASOS[nombre] = (grupo, repeticiones, preparar)
+        return preparar
+    return registrar
+
+
+def medir(operacion, repeticiones, calentamiento=1):
+    """
+    Latencias de repeticiones llamadas a operacion (tras calentamiento llamadas no medidas) y la
+    memoria máxima de una llamada adicional con tracemalloc, que se mide aparte porque lo ralentiza.
+    """
+    for _ in range(calentamiento):
+        operacion()
+    latencias = []
+    inicio_total = time.perf_counter()
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        operacion()
+        latencias.append(time.perf_counter() - inicio)
+    total = time.perf_counter() - inicio_total
+
+    tracemalloc.start()
+    operacion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencias = np.array(latencias) * 1e3
+    return {
+        "repeticiones": repeticiones,
+        "p50_ms": round(float(np.percentile(latencias, 50)), 4),
+        "p90_ms": round(float(np.percentile(latencias, 90)), 4),
+        "p99_ms": round(float(np.percentile(latencias, 99)), 4),
+        "media_ms": round(float(latencias.mean()), 4),
+        "por_segundo": round(repeticiones / total, 3),
+        "pico_mb": round(pico / 2 ** 20, 3),
+    }
+
+
+class Contexto:
+    """Datos sintéticos, directorio de trabajo y módulos ya preparados, compartidos entre casos"""
+
+    def __init__(self, fixtures_dir, trabajo):
+        self.fixtures_dir = fixtures_dir
+        self.trabajo = trabajo
+        self.descripcion = fixtures.generar(fixtures_dir)
+        self.repositorio = os.path.join(fixtures_dir, "repositorio")
+        self.bbox = self.descripcion["bbox"]
+        rng = np.random.default_rng(1)
+        self.puntos = list(zip(
+            rng.uniform(self.bbox["south"], self.bbox["north"], 256),
+            rng.uniform(self.bbox["west"], self.bbox["east"], 256),
+        ))
+        self._app = None
+        self._glofas = None
+        self._servidor = None
+
+    def app(self):
+        """Backend con GitHub reemplazado por el repositorio sintético y caches en el directorio de trabajo"""
+        if self._app is None:
+            os.environ.update(
+                PRECARGAR="0",
+                CACHE_DIR=os.path.join(self.trabajo, "cache"),
+                TESELAS_DIR=os.path.join(self.trabajo, "teselas"),
+            )
+            directorio = os.getcwd()
+            os.chdir(os.path.join(os.path.dirname(RAIZ), "backend"))
+            try:
+                import app
+            finally:
+                os.chdir(directorio)
+            montar_github(app.sesion_http, self.repositorio, GITHUB_REPO)
+            logging.disable(logging.CRITICAL)
+            self._app = app
+        return self._app
+
+    def glofas(self):
+        """
+        downloadGLOFAS con CDS reemplazado por el archivo crudo sintético. Se trabaja en una copia
+        del repositorio (umbrales locales) y la región usa los GeoJSON sintéticos.
+        """
+        if self._glofas is None:
+            instalar_cds(os.path.join(self.fixtures_dir, "glofas_crudo.nc"))
+            os.environ["MASCARAS_DIR"] = os.path.join(self.trabajo, "mascaras")
+            os.makedirs(self.trabajo, exist_ok=True)
+            os.chdir(self.trabajo)
+            if not os.path.exists("FloodThreshold"):
+                shutil.copytree(os.path.join(self.repositorio, "FloodThreshold"), "FloodThreshold")
+            import downloadGLOFAS
+
+            nombre = self.descripcion["region"]
+            downloadGLOFAS.REGIONES = {nombre: {
+                "bbox": self.bbox,
+                "geojson": os.path.join(self.fixtures_dir, "region.geojson"),
+                "prefijo": "",
+                "zonas": {"comunas": {"geojson": os.path.join(self.fixtures_dir, "zonas.geojson"), "campo": "Comuna"}},
+            }}
+            self._glofas = downloadGLOFAS
+        return self._glofas
+
+    def ecmwf(self):
+        """URL del servidor local de ECMWF (se inicia la primera vez)"""
+        if not self.descripcion.get("ecmwf"):
+            raise ImportError("no hay GRIB sintéticos de ECMWF (falta eccodes)")
+        if self._servidor is None:
+            self._servidor = ServidorECMWF(os.path.join(self.fixtures_dir, "ecmwf")).__enter__()
+        return self._servidor.url
+
+    def cerrar(self):
+        if self._servidor is not None:
+            self._servidor.__exit__(None, None, None)
+
+
+@caso("serie_punto", "consulta", 500)
+def caso_serie_punto(ctx):
+    app = ctx.app()
+    dataset = app.obtener_dataset_pronostico(app.REGION_DEFECTO)
+    puntos = cycle(ctx.puntos)
+    return lambda: app.getMeanStdForAllForecasts(dataset, *next(puntos))
+
+
+@caso("consultar", "consulta", 300)
+def caso_consultar(ctx):
+    cliente = ctx.app().app.test_client()
+    puntos = cycle(ctx.puntos)
+
+    def operacion():
+        lat, lon = next(puntos)
+        respuesta = cliente.get("/consultar", query_string={"lat": f"{lat:.4f}", "lon": f"{lon:.4f}"})
+        assert respuesta.status_code == 200, respuesta.status_code
+    return operacion
+
+
+@caso("consultar_lote", "consulta", 30)
+def caso_consultar_lote(ctx):
+    cliente = ctx.app().app.test_client()
+    puntos = [{"lat": round(lat, 4), "lon": round(lon, 4)} for lat, lon in ctx.puntos[:100]]
+
+    def operacion():
+        respuesta = cliente.post("/consultar_lote", json={"puntos": puntos})
+        assert respuesta.status_code == 200, respuesta.status_code
+    return operacion
+
+
+@caso("medias_y_desviaciones", "glofas", 5)
+def caso_medias_y_desviaciones(ctx):
+    glofas = ctx.glofas()
+
+    def operacion():
+        archivos = glofas.fetch_rlevel(glofas.day, glofas.month, glofas.year)
+        assert archivos, "guardar_medias_y_desviaciones no generó archivos"
+    return operacion
+
+
+@caso("geotiffs_region", "glofas", 5)
+def caso_geotiffs_region(ctx):
+    glofas = ctx.glofas()
+    archivo = os.path.join(ctx.repositorio, "download", f"{fixtures.FECHA}.nc")
+    nombre = ctx.descripcion["region"]
+
+    def operacion():
+        archivos = glofas.clip_y_generar_geotiffs(archivo, nombre)
+        assert archivos, "clip_y_generar_geotiffs no generó archivos"
+    return operacion
+
+
+@caso("ingesta_rangos", "meteo", 3)
+def caso_ingesta_rangos(ctx):
+    url = ctx.ecmwf()
+    import ingesta_grib
+    pasos = ctx.descripcion["pasos_meteo"]
+    directorio = os.path.join(ctx.trabajo, "grib")
+    return lambda: ingesta_grib.ingerir(fixtures.FECHA, 0, pasos, ["tp", "2t"], directorio, url_base=url)
+
+
+@caso("rasters_meteo", "meteo", 10)
+def caso_rasters_meteo(ctx):
+    url = ctx.ecmwf()
+    import ingesta_grib
+    import descarga_meteorologico
+    pasos = ctx.descripcion["pasos_meteo"]
+    ds = ingesta_grib.ingerir(fixtures.FECHA, 0, pasos, ["tp", "2t"], os.path.join(ctx.trabajo, "grib"), url_base=url)
+    region = {"bbox": ctx.bbox}
+    salida = os.path.join(ctx.trabajo, "meteo")
+    return lambda: descarga_meteorologico.generar_region(ds, region, salida)
+
+
+def entorno():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def comparar(resultados, base, tolerancia, memoria_minima=MEMORIA_MINIMA_MB):
+    """
+    Imprime la comparación con la línea base; devuelve los casos con regresión. La memoria solo
+    cuenta como regresión si además de superar la tolerancia crece más de memoria_minima MB.
+    """
+    regresiones = []
+    print(f"\n{'caso':<24}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'op/s':>10}{'pico MB':>10}{'p50 base':>10}{'memoria':>9}")
+    for nombre, r in resultados.items():
+        linea = f"{nombre:<24}{r['p50_ms']:>10.3f}{r['p90_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['por_segundo']:>10.1f}{r['pico_mb']:>10.2f}"
+        b = (base or {}).get("casos", {}).get(nombre)
+        if b is None:
+            print(f"{linea}{'sin base':>10}")
+            continue
+        tiempo = r["p50_ms"] / b["p50_ms"] if b["p50_ms"] else float("inf")
+        memoria = r["pico_mb"] / b["pico_mb"] if b["pico_mb"] else 1.0
+        marca = ""
+        memoria_excedida = memoria > 1 + tolerancia and r["pico_mb"] - b["pico_mb"] > memoria_minima
+        if tiempo > 1 + tolerancia or memoria_excedida:
+            regresiones.append(nombre)
+            marca = "  <- regresión"
+        print(f"{linea}{tiempo:>9.2f}x{memoria:>8.2f}x{marca}")
+    return regresiones
+
+
+def ejecutar_casos(nombres, fixtures_dir, repeticiones=None):
+    """Prepara y mide los casos indicados en este proceso; devuelve sus resultados"""
+    warnings.simplefilter("ignore")
+    trabajo = tempfile.mkdtemp(prefix="inundacion_bench_")
+    directorio = os.getcwd()
+    ctx = Contexto(fixtures_dir, trabajo)
+    resultados = {}
+    try:
+        for nombre in nombres:
+            grupo, por_defecto, preparar = CASOS[nombre]
+            try:
+                operacion = preparar(ctx)
+            except ImportError as e:
+                print(f"{nombre}: omitido ({e})")
+                continue
+            print(f"{nombre} ({grupo}): {repeticiones or por_defecto} repeticiones...")
+            resultados[nombre] = {"grupo": grupo, **medir(operacion, repeticiones or por_defecto)}
+    finally:
+        ctx.cerrar()
+        os.chdir(directorio)
+        shutil.rmtree(trabajo, ignore_errors=True)
+    return resultados
+
+
+def ejecutar_grupo(nombres, args):
+    """
+    Mide los casos de un grupo en un proceso aparte: cada grupo importa módulos distintos (backend,
+    procesos diarios) con estado global propio, y así la memoria de uno no afecta a los demás.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as temporal:
+        salida = temporal.name
+    comando = [sys.executable, os.path.abspath(__file__), "--en-proceso", "--casos", ",".join(nombres),
+               "--fixtures", args.fixtures, "--salida", salida]
+    if args.repeticiones:
+        comando += ["--repeticiones", str(args.repeticiones)]
+    try:
+        subprocess.run(comando, check=False)
+        with open(salida) as archivo:
+            return json.load(archivo)["casos"]
+    except (OSError, ValueError, KeyError):
+        print(f"No se obtuvieron resultados de {', '.join(nombres)}")
+        return {}
+    finally:
+        os.remove(salida)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks sin conexión de la consulta y los procesos diarios")
+    parser.add_argument("--casos", help=f"Casos separados por coma (por defecto todos: {','.join(CASOS)})")
+    parser.add_argument("--repeticiones", type=int, help="Repeticiones de cada caso (por defecto, las de cada uno)")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directorio de los datos sintéticos")
+    parser.add_argument("--base", default=BASE_DEFECTO, help="Línea base con la que se compara")
+    parser.add_argument("--guardar-base", action="store_true", help="Guarda los resultados como nueva línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Aumento relativo tolerado de p50 y memoria")
+    parser.add_argument("--memoria-minima", type=float, default=MEMORIA_MINIMA_MB,
+                        help="Aumento de memoria (MB) que se ignora aunque supere la tolerancia")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--en-proceso", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    nombres = args.casos.split(",") if args.casos else list(CASOS)
+    desconocidos = set(nombres) - set(CASOS)
+    if desconocidos:
+        parser.error(f"Casos desconocidos: {sorted(desconocidos)}")
+
+    descripcion = fixtures.generar(args.fixtures)
+    if args.en_proceso:
+        resultados = ejecutar_casos(nombres, args.fixtures, args.repeticiones)
+        with open(args.salida, "w") as archivo:
+            json.dump({"casos": resultados}, archivo)
+        return 0
+
+    resultados = {}
+    grupos = list(dict.fromkeys(CASOS[nombre][0] for nombre in nombres))
+    for grupo in grupos:
+        resultados.update(ejecutar_grupo([nombre for nombre in nombres if CASOS[nombre][0] == grupo], args))
+
+    base = None
+    if os.path.exists(args.base):
+        with open(args.base) as archivo:
+            base = json.load(archivo)
+    regresiones = comparar(resultados, base, args.tolerancia, args.memoria_minima)
+
+    informe = {"entorno": entorno(), "fixtures": descripcion, "casos": resultados}
+    if args.salida:
+        with open(args.salida, "w") as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    if args.guardar_base:
+        if base:
+            # Se conservan los casos de la base que no se midieron en esta ejecución
+            informe["casos"] = {**base.get("casos", {}), **resultados}
+        with open(args.base, "w") as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.base}")
+        return 0
+
+    if base is None:
+        print(f"\nSin línea base en {args.base}: use --guardar-base para crearla")
+    elif regresiones:
+        print(f"\nRegresiones respecto de la línea base (tolerancia {args.tolerancia:.0%}): {', '.join(regresiones)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import os
+import sys
+import glob
+
+import numpy as np
+import xarray as xr
+import netCDF4
+
+# Las horas de los plazos se decodifican con el mismo código que usa el backend al leer el histórico
+from backend.grilla import horas_pronostico
+
+# Archivo único con todas las corridas diarias, indexado por forecast_reference_time
+ARCHIVO_HISTORICO = "historico/glofas_historico.nc"
+VARIABLES = ("mean_dis24", "std_dis24")
+# Plazos fijos: las corridas antiguas llegan a 720 h y las actuales a 360 h (el resto queda en NaN)
+HORAS_PRONOSTICO = np.arange(24, 721, 24)
+# Fragmentos (corridas, plazos, latitud, longitud): largos en el tiempo y de un píxel en el espacio,
+# así la historia de un punto (hasta 365 corridas x 30 plazos) es un único fragmento contiguo
+FRAGMENTOS = (365, len(HORAS_PRONOSTICO), 1, 1)
+UNIDADES_TIEMPO = "hours since 1970-01-01 00:00:00"
+
+
+def crear_historico(ruta, latitudes, longitudes, fragmentos=FRAGMENTOS):
+    """Crea el archivo histórico vacío con forecast_reference_time como dimensión ilimitada"""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with netCDF4.Dataset(ruta, "w", format="NETCDF4") as nc:
+        nc.createDimension("forecast_reference_time", None)
+        nc.createDimension("forecast_period", len(HORAS_PRONOSTICO))
+        nc.createDimension("latitude", len(latitudes))
+        nc.createDimension("longitude", len(longitudes))
+
+        frt = nc.createVariable("forecast_reference_time", "f8", ("forecast_reference_time",))
+        frt.units = UNIDADES_TIEMPO
+        frt.calendar = "proleptic_gregorian"
+        frt.standard_name = "forecast_reference_time"
+
+        fp = nc.createVariable("forecast_period", "i4", ("forecast_period",))
+        fp.units = "hours"
+        fp.standard_name = "forecast_period"
+        fp[:] = HORAS_PRONOSTICO
+
+        lat = nc.createVariable("latitude", "f8", ("latitude",))
+        lat.units = "degrees_north"
+        lat[:] = latitudes
+        lon = nc.createVariable("longitude", "f8", ("longitude",))
+        lon.units = "degrees_east"
+        lon[:] = longitudes
+
+        dims = ("forecast_reference_time", "forecast_period", "latitude", "longitude")
+        fragmentos = (
+            fragmentos[0],
+            min(fragmentos[1], len(HORAS_PRONOSTICO)),
+            min(fragmentos[2], len(latitudes)),
+            min(fragmentos[3], len(longitudes)),
+        )
+        for nombre in VARIABLES:
+            variable = nc.createVariable(
+                nombre, "f4", dims,
+                zlib=True, complevel=4, shuffle=True,
+                chunksizes=fragmentos,
+                fill_value=np.float32(np.nan),
+            )
+            variable.units = "m3 s-1"
+    print(f"Archivo histórico creado: {ruta} (fragmentos {fragmentos})")
+
+
+def leer_corrida(archivo_nc):
+    """
+    Lee una corrida diaria y la lleva al eje fijo de plazos del histórico.
+    Devuelve (referencia en horas desde 1970, latitudes, longitudes, {variable: arreglo}) o None.
+    """
+    with xr.open_dataset(archivo_nc) as ds:
+        if not all(nombre in ds for nombre in VARIABLES):
+            print(f"Omitido {archivo_nc}: no contiene {VARIABLES}")
+            return None
+
+        horas = horas_pronostico(ds["forecast_period"])
+        posiciones = np.searchsorted(HORAS_PRONOSTICO, horas)
+        if np.any(posiciones >= len(HORAS_PRONOSTICO)) or np.any(HORAS_PRONOSTICO[np.minimum(posiciones, len(HORAS_PRONOSTICO) - 1)] != horas):
+            print(f"Omitido {archivo_nc}: plazos de pronóstico no soportados")
+            return None
+
+        referencia = ds["forecast_reference_time"].values.reshape(-1)[0]
+        referencia = (referencia - np.datetime64("1970-01-01T00:00:00")) / np.timedelta64(1, "h")
+
+        datos = {}
+        for nombre in VARIABLES:
+            variable = ds[nombre]
+            if "forecast_reference_time" in variable.dims:
+                variable = variable.isel(forecast_reference_time=0)
+            completo = np.full((len(HORAS_PRONOSTICO), ds.sizes["latitude"], ds.sizes["longitude"]), np.nan, dtype=np.float32)
+            completo[posiciones] = variable.transpose("forecast_period", "latitude", "longitude").values
+            datos[nombre] = completo
+
+        return referencia, ds["latitude"].values, ds["longitude"].values, datos
+
+
+def escribir_corridas(corridas, ruta=ARCHIVO_HISTORICO, reemplazar=True):
+    """
+    Escribe corridas leídas con leer_corrida en el histórico. Las fechas existentes se reemplazan
+    (u omiten con reemplazar=False) y las nuevas se agregan al final en una sola escritura contigua,
+    que con fragmentos largos en el tiempo reescribe cada fragmento una vez por lote y no por corrida.
+    Devuelve la cantidad de corridas escritas.
+    """
+    if not corridas:
+        return 0
+    _, latitudes, longitudes, _ = corridas[0]
+    if not os.path.exists(ruta):
+        crear_historico(ruta, latitudes, longitudes)
+
+    with netCDF4.Dataset(ruta, "a") as nc:
+        fechas = np.ma.filled(nc["forecast_reference_time"][:], np.nan)
+        nuevas = []
+        escritas = 0
+        for referencia, lat, lon, datos in corridas:
+            if not (np.allclose(nc["latitude"][:], lat) and np.allclose(nc["longitude"][:], lon)):
+                print("Omitida una corrida: la grilla no coincide con la del histórico")
+                continue
+            existentes = np.flatnonzero(np.isclose(fechas, referencia))
+            if existentes.size:
+                if reemplazar:
+                    for nombre in VARIABLES:
+                        nc[nombre][int(existentes[0])] = datos[nombre]
+                    escritas += 1
+            elif not any(np.isclose(referencia, r) for r, _ in nuevas):
+                nuevas.append((referencia, datos))
+
+        if nuevas:
+            inicio = len(fechas)
+            fin = inicio + len(nuevas)
+            nc["forecast_reference_time"][inicio:fin] = np.array([r for r, _ in nuevas])
+            for nombre in VARIABLES:
+                nc[nombre][inicio:fin] = np.stack([datos[nombre] for _, datos in nuevas])
+            escritas += len(nuevas)
+
+    return escritas
+
+
+def agregar_corrida(archivo_nc, ruta=ARCHIVO_HISTORICO, reemplazar=True):
+    """
+    Agrega una corrida diaria al archivo histórico. Si su fecha ya existe se reemplaza,
+    o se omite con reemplazar=False. Devuelve True si la corrida quedó escrita.
+    """
+    corrida = leer_corrida(archivo_nc)
+    if corrida is None:
+        return False
+    escrita = escribir_corridas([corrida], ruta, reemplazar) > 0
+    if escrita:
+        print(f"Corrida {os.path.basename(archivo_nc)} consolidada en {ruta}")
+    return escrita
+
+
+def corridas_pendientes(archivos, ruta=ARCHIVO_HISTORICO):
+    """Archivos diarios (YYYYMMDD.nc) cuya fecha todavía no está en el histórico"""
+    if not os.path.exists(ruta):
+        return list(archivos)
+    with netCDF4.Dataset(ruta) as nc:
+        horas = np.ma.filled(nc["forecast_reference_time"][:], np.nan)
+    dias = (np.datetime64("1970-01-01T00", "h") + horas[~np.isnan(horas)].astype("int64")).astype("datetime64[D]")
+    fechas = {str(dia).replace("-", "") for dia in dias}
+    return [archivo for archivo in archivos if os.path.basename(archivo)[:8] not in fechas]
+
+
+def agregar_corridas(archivos, ruta=ARCHIVO_HISTORICO, reemplazar=False, lote=FRAGMENTOS[0]):
+    """Consolida muchas corridas escribiéndolas por lotes; devuelve la cantidad escrita"""
+    escritas = 0
+    for inicio in range(0, len(archivos), lote):
+        corridas = [c for c in map(leer_corrida, archivos[inicio:inicio + lote]) if c is not None]
+        escritas += escribir_corridas(corridas, ruta, reemplazar)
+    return escritas
+
+
+def reorganizar_historico(ruta=ARCHIVO_HISTORICO, fragmentos=FRAGMENTOS):
+    """Reescribe el histórico con otra fragmentación (por ejemplo, uno creado con una versión anterior)"""
+    ruta_tmp = f"{ruta}.tmp"
+    with netCDF4.Dataset(ruta) as origen:
+        crear_historico(ruta_tmp, origen["latitude"][:], origen["longitude"][:], fragmentos)
+        with netCDF4.Dataset(ruta_tmp, "a") as destino:
+            total = len(origen["forecast_reference_time"])
+            destino["forecast_reference_time"][:total] = origen["forecast_reference_time"][:]
+            for nombre in VARIABLES:
+                for inicio in range(0, total, fragmentos[0]):
+                    fin = min(inicio + fragmentos[0], total)
+                    destino[nombre][inicio:fin] = origen[nombre][inicio:fin]
+    os.replace(ruta_tmp, ruta)
+    print(f"Histórico reorganizado con fragmentos {fragmentos}: {ruta}")
+
+
+if __name__ == "__main__":
+    # Uso: python consolidar_historico.py [archivos.nc ...]  (por defecto, todo download/)
+    #      python consolidar_historico.py --reorganizar  (aplica la fragmentación actual)
+    # Solo se agregan las corridas que aún no están en el histórico
+    if sys.argv[1:] == ["--reorganizar"]:
+        reorganizar_historico()
+        sys.exit(0)
+    archivos = sys.argv[1:] or sorted(glob.glob("download/*.nc"))
+    nuevas = agregar_corridas(archivos)
+    print(f"{nuevas} corridas nuevas de {len(archivos)} consolidadas en {ARCHIVO_HISTORICO}")
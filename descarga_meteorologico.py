@@ -1,13 +1,21 @@
 from ecmwf.opendata import Client
 import xarray as xr
 import rioxarray
+import rasterio
 from datetime import datetime
 import os
 import sys
 import warnings  
-import requests
-import base64
 import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from publicador_github import PublicadorGitHub
+from tiempos import Cronometro
+from ingesta_grib import ingerir
+from raster_cog import FORMATO_RASTER, opciones_raster, verificar_archivos
+from mascara_region import ventana_bbox
+from regiones import cargar_regiones, ruta_region
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Token de GitHub
 GITHUB_REPO = "alimunozq/InundacionNetCDF"
@@ -28,147 +36,182 @@ def escribir_log(files_list, output_dir="coquimbo_meteo"):
     print(f"Log generado: {log_path}")
     return log_path
 
-def subir_archivo_a_github(folder, file_path):
-    """Sube un archivo a GitHub"""
-    print(f"Subiendo archivo: {file_path}")
-    file_name = os.path.basename(file_path)
-    github_url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{folder}/{file_name}"
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-
-    # Verificar si el archivo ya existe en GitHub
-    response = requests.get(github_url, headers=headers)
-    if response.status_code == 200:
-        file_sha = response.json().get("sha")
-    else:
-        file_sha = None
-
-    with open(file_path, "rb") as file:
-        file_content = file.read()
-
-    data = {
-        "message": f"Actualizando {file_name}",
-        "content": base64.b64encode(file_content).decode("utf-8"),
-        "branch": GITHUB_BRANCH,
+# Regiones a procesar (regiones.json): la descarga es global y se recorta una vez por región
+REGIONES = cargar_regiones()
+# Tiempos por etapa y reporte JSON que se guarda al terminar
+cronometro = Cronometro()
+REPORTE_TIEMPOS = os.getenv("REPORTE_TIEMPOS", "tiempos_meteo.json")
+# "completa": un solo GRIB con ecmwf-opendata; "rangos": solo los mensajes necesarios, leyendo el
+# índice .index de cada paso y pidiéndolos con solicitudes de rango concurrentes (ingesta_grib.py)
+INGESTA_METEO = os.getenv("INGESTA_METEO", "completa")
+PASOS_METEO = [int(paso) for paso in os.getenv("PASOS_METEO", "12,24").split(",")]
+PARAMETROS_METEO = os.getenv("PARAMETROS_METEO", "tp,2t").split(",")
+# Parámetros de ECMWF con que se generan los productos (P<h>, T<h> y P_intervalos) y el nombre de
+# su variable al decodificar el GRIB con cfgrib
+VARIABLES_METEO = {"tp": "tp", "2t": "t2m"}
+
+def validar_parametros(parametros):
+    """Falla antes de descargar si a PARAMETROS_METEO le falta alguno de los que usan los productos"""
+    faltantes = [parametro for parametro in VARIABLES_METEO if parametro not in parametros]
+    if faltantes:
+        raise ValueError(
+            f"PARAMETROS_METEO={','.join(parametros)} no incluye {','.join(faltantes)}: "
+            f"los productos necesitan {','.join(VARIABLES_METEO)}"
+        )
+
+def crop_to_region(raster_data, bbox):
+    """Recorta un raster a los límites de una región (la ventana se calcula una vez por grilla)"""
+    filas, columnas = ventana_bbox(raster_data, bbox)
+    return raster_data.isel({raster_data.rio.y_dim: filas, raster_data.rio.x_dim: columnas})
+
+def preparar_region(ds, bbox):
+    """
+    Recorta una sola vez todas las variables y pasos a la región y convierte las unidades sobre el
+    arreglo completo (paso, latitud, longitud). Devuelve (horas, precipitación acumulada,
+    precipitación por intervalo, temperatura en °C, transformación afín del recorte).
+    """
+    faltantes = [variable for variable in VARIABLES_METEO.values() if variable not in ds]
+    if faltantes:
+        raise ValueError(f"El GRIB no contiene las variables {faltantes} (variables: {list(ds.data_vars)})")
+    ds = ds[list(VARIABLES_METEO.values())]
+    if "step" not in ds.dims:
+        ds = ds.expand_dims("step")
+    ds_region = crop_to_region(ds.rio.write_crs("EPSG:4326"), bbox)
+    ejes = ("step", ds_region.rio.y_dim, ds_region.rio.x_dim)
+
+    horas = [int(paso // np.timedelta64(1, "h")) for paso in ds_region.step.values]
+    precip = ds_region.tp.transpose(*ejes).values.astype("float32")
+    temp = ds_region.t2m.transpose(*ejes).values.astype("float32") - np.float32(273.15)  # K a °C
+    # tp es acumulada desde el inicio de la corrida: la de cada intervalo sale de una sola
+    # diferencia entre pasos (el empaquetado GRIB puede dejar diferencias levemente negativas)
+    intervalos = np.maximum(np.diff(precip, axis=0, prepend=0), 0)
+    return horas, precip, intervalos, temp, ds_region.rio.transform(recalc=True)
+
+def escribir_raster(output_dir, file_name, bandas, transform, descripciones=None, unidades=None):
+    """Escribe un GeoTIFF (o COG, según FORMATO_RASTER) con una banda por cada arreglo 2D de bandas"""
+    bandas = np.asarray(bandas, dtype="float32").reshape(-1, *np.shape(bandas)[-2:])
+    perfil = {
+        **opciones_raster(),
+        "dtype": "float32",
+        "count": bandas.shape[0],
+        "height": bandas.shape[1],
+        "width": bandas.shape[2],
+        "crs": "EPSG:4326",
+        "transform": transform,
     }
-
-    if file_sha:
-        data["sha"] = file_sha
-
-    response = requests.put(github_url, headers=headers, json=data)
-    if response.status_code in [200, 201]:
-        print(f"Archivo {file_name} subido correctamente.")
-    else:
-        print(f"Error al subir {file_name}: {response.status_code}")
-        print(response.json())
-
-# Coordenadas de Coquimbo, Chile [north, south, west, east]
-COQUIMBO_BBOX = {
-    "north": -29.0366,
-    "south": -32.28247,
-    "west": -71.71782,
-    "east": -69.809361
-}
-
-def crop_to_coquimbo(raster_data):
-    """Recorta un raster a la región de Coquimbo"""
-    return raster_data.rio.clip_box(
-        minx=COQUIMBO_BBOX["west"],
-        miny=COQUIMBO_BBOX["south"],
-        maxx=COQUIMBO_BBOX["east"],
-        maxy=COQUIMBO_BBOX["north"]
-    )
-
-def process_and_save(data, step, var_name, output_dir):
-    """Procesa y guarda los datos con CRS definido"""
-    # Asignar CRS explícitamente (WGS84)
-    data = data.rio.write_crs("EPSG:4326")
-    
-    if var_name == "temp":
-        data = data - 273.15  # Convertir K a °C
-    
-    # Recortar a Coquimbo
-    data_coquimbo = crop_to_coquimbo(data)
-    
-    # Crear nombre de archivo con formato P/T+(12/24)
-    var_code = "P" if var_name == "precip" else "T"
-    file_name = f"{var_code}{step}.tif"
-    output_path = os.path.join(output_dir, file_name)
-    
-    # Guardar como GeoTIFF
-    data_coquimbo.rio.to_raster(output_path, dtype="float32")
+    with rasterio.open(os.path.join(output_dir, file_name), "w", **perfil) as dst:
+        dst.write(bandas)
+        for banda, descripcion in enumerate(descripciones or [], start=1):
+            dst.set_band_description(banda, descripcion)
+        if unidades:
+            dst.update_tags(units=unidades)
+    return file_name
+
+def generar_region(ds, region, output_dir):
+    """Genera los GeoTIFF y el log de una región; devuelve las rutas de los archivos"""
+    os.makedirs(output_dir, exist_ok=True)
+
+    with cronometro.etapa("recorte y conversión"):
+        horas, precip, intervalos, temp, transform = preparar_region(ds, region["bbox"])
+
+    # Una pasada de escritura con el mismo perfil y transformación para todos los archivos:
+    # P/T+(12/24/...) de una banda, como los lee el frontend, y la precipitación por intervalo
+    # de todos los pasos en un solo raster multibanda
+    with cronometro.etapa("escritura GeoTIFF"):
+        generated_files = []
+        for k, hour in enumerate(horas):
+            generated_files.append(escribir_raster(output_dir, f"P{hour}.tif", precip[k], transform, unidades="m"))
+            generated_files.append(escribir_raster(output_dir, f"T{hour}.tif", temp[k], transform, unidades="°C"))
+        generated_files.append(escribir_raster(
+            output_dir,
+            "P_intervalos.tif",
+            intervalos,
+            transform,
+            descripciones=[f"{inicio}-{fin}h" for inicio, fin in zip([0, *horas[:-1]], horas)],
+            unidades="m",
+        ))
     
-    return output_path, file_name
+    if FORMATO_RASTER == "cog":
+        with cronometro.etapa("verificación COG"):
+            verificar_archivos([os.path.join(output_dir, f) for f in generated_files])
+
+    # Generar archivo log
+    log_path = escribir_log(generated_files, output_dir)
+    return [*[os.path.join(output_dir, f) for f in generated_files], log_path]
 
 def main():
     try:
         # Configuración
+        validar_parametros(PARAMETROS_METEO)
         output_dir = "coquimbo_meteo"
         os.makedirs(output_dir, exist_ok=True)
-        generated_files = []
 
         # 1. Descargar datos
-        client = Client(source="ecmwf")
         request = {
             "date": datetime.now().strftime("%Y%m%d"),
             "time": 0,
             "type": "fc",
-            "step": [12, 24],
-            "param": ["tp", "2t"],
+            "step": PASOS_METEO,
+            "param": PARAMETROS_METEO,
             "levtype": "sfc"
         }
         
         grib_file = os.path.join(output_dir, "data.grib2")
-        client.retrieve(request, grib_file)
+        # El reporte de tiempos se guarda también si la corrida falla, con el error que la detuvo
+        estado = {"estado": "error"}
 
-        # 2. Procesar datos
         try:
-            # Abrir con cfgrib
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=FutureWarning)
-                ds = xr.open_dataset(grib_file, engine="cfgrib")
-            
-            # Procesar cada paso temporal
-            for step_idx, hour in enumerate([12, 24]):
-                # Precipitación (mm)
-                precip_path, precip_name = process_and_save(
-                    ds.tp.isel(step=step_idx),
-                    hour,
-                    "precip",
-                    output_dir
-                )
-                generated_files.append(precip_name)
-                
-                # Temperatura (°C)
-                temp_path, temp_name = process_and_save(
-                    ds.t2m.isel(step=step_idx),
-                    hour,
-                    "temp",
-                    output_dir
-                )
-                generated_files.append(temp_name)
-            
-            # Generar archivo log
-            log_path = escribir_log(generated_files, output_dir)
+            if INGESTA_METEO != "rangos":
+                client = Client(source="ecmwf")
+                with cronometro.etapa("descarga ECMWF"):
+                    client.retrieve(request, grib_file)
+
+            # 2. Procesar datos
+            if INGESTA_METEO == "rangos":
+                # Cada paso se decodifica apenas llega, mientras siguen las descargas de los demás
+                with warnings.catch_warnings(), cronometro.etapa("descarga por rangos y lectura GRIB"):
+                    warnings.simplefilter("ignore", category=FutureWarning)
+                    ds = ingerir(request["date"], request["time"], PASOS_METEO, PARAMETROS_METEO, output_dir)
+            else:
+                # Abrir con cfgrib (sin dejar su índice .idx junto al GRIB)
+                with warnings.catch_warnings(), cronometro.etapa("lectura GRIB"):
+                    warnings.simplefilter("ignore", category=FutureWarning)
+                    # Se carga en memoria una vez: eccodes no admite lecturas desde varios hilos
+                    ds = xr.open_dataset(grib_file, engine="cfgrib", backend_kwargs={"indexpath": ""}).load()
             
-            # Subir archivos a GitHub (incluyendo el log)
-            all_files = [
-                *[os.path.join(output_dir, f) for f in generated_files],
-                log_path
-            ]
+            # Los productos de cada región se generan en paralelo a partir de la misma descarga
+            with ThreadPoolExecutor(max_workers=len(REGIONES)) as ejecutor:
+                archivos_por_region = dict(zip(REGIONES, ejecutor.map(
+                    lambda region: generar_region(ds, region, ruta_region(region, output_dir)),
+                    REGIONES.values()
+                )))
             
-            for file_path in all_files:
-                subir_archivo_a_github("frontend/public/coquimbo_meteo", file_path)
+            # Subir archivos a GitHub (incluyendo los logs)
+            publicador = PublicadorGitHub(GITHUB_REPO, GITHUB_BRANCH, GITHUB_TOKEN)
+            for nombre, all_files in archivos_por_region.items():
+                for file_path in all_files:
+                    publicador.agregar(ruta_region(REGIONES[nombre], "frontend/public/coquimbo_meteo"), file_path)
+            with cronometro.etapa("publicación"):
+                publicador.publicar(f"Actualizando meteorología {datetime.now().strftime('%Y%m%d')}")
+            estado = {"estado": "ok"}
         
         except Exception as e:
+            estado["error"] = f"{type(e).__name__}: {str(e)}"
             print(f"Error procesando los datos GRIB: {str(e)}", file=sys.stderr)
             sys.exit(1)
             
         finally:
             if os.path.exists(grib_file):
                 os.remove(grib_file)
+            cronometro.imprimir()
+            cronometro.guardar(
+                REPORTE_TIEMPOS,
+                proceso="meteorologico",
+                fecha=request["date"],
+                regiones=sorted(REGIONES),
+                formato_raster=FORMATO_RASTER,
+                **estado,
+            )
 
     except ModuleNotFoundError as e:
         print(f"Error: {str(e)}", file=sys.stderr)
@@ -1,15 +1,23 @@
 import cdsapi
 import os
 import json
-import base64
-import requests
+import glob
+import threading
 from datetime import datetime
 import xarray as xr
-import geopandas as gpd
 import rioxarray
 import numpy as np
 import rasterio
 from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from consolidar_historico import ARCHIVO_HISTORICO, agregar_corrida, agregar_corridas, corridas_pendientes
+from publicador_github import PublicadorGitHub
+from tiempos import Cronometro
+from raster_cog import FORMATO_RASTER, opciones_raster, verificar_archivos
+from netcdf_compacto import FORMATO_NETCDF, PRECISION_CAUDAL, empaquetado, fragmentos, guardar as guardar_netcdf
+from mascara_region import MASCARAS_DIR, aplicar_mascara, mascara_region
+from estadisticas_zonales import estadisticas_zonales, etiquetas_zonas, umbrales_en_grilla
+from regiones import cargar_regiones, recortar_bbox, ruta_region, union_bbox
 
 # Obtener las credenciales desde variables de entorno
 CDSAPI_URL = os.getenv("CDSAPI_URL")  # URL de la API de Copernicus
@@ -19,22 +27,53 @@ GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Token de GitHub
 GITHUB_REPO = "alimunozq/InundacionNetCDF"
 GITHUB_BRANCH = "main"
 
+# Guardar además todos los miembros del ensamble (empaquetados en int16) en miembros/
+GUARDAR_MIEMBROS = os.getenv("GUARDAR_MIEMBROS", "0") == "1"
+MIEMBROS_DIR = "miembros"
+# Agregar cada corrida al archivo histórico consolidado (historico/glofas_historico.nc)
+ACTUALIZAR_HISTORICO = os.getenv("ACTUALIZAR_HISTORICO", "0") == "1"
+# El histórico se reescribe completo en cada corrida: se publica en una rama aparte que se reemplaza
+# con un único commit, en lugar de acumular una versión completa por día en la historia de main
+RAMA_HISTORICO = os.getenv("RAMA_HISTORICO", "historico")
+# Miembros del ensamble leídos a la vez al calcular medias y desviaciones (acota la memoria)
+MIEMBROS_POR_BLOQUE = int(os.getenv("MIEMBROS_POR_BLOQUE", "25"))
+# Hilos para escribir los GeoTIFF de cada plazo en paralelo
+HILOS_RASTER = int(os.getenv("HILOS_RASTER", str(min(8, os.cpu_count() or 1))))
+
 # Configurar el cliente de la API de Copernicus
 client = cdsapi.Client(url=CDSAPI_URL, key=CDSAPI_KEY)
 
+# Todos los archivos de la corrida se publican juntos en un solo commit al final
+publicador = PublicadorGitHub(GITHUB_REPO, GITHUB_BRANCH, GITHUB_TOKEN)
+publicador_historico = PublicadorGitHub(GITHUB_REPO, RAMA_HISTORICO, GITHUB_TOKEN)
+# Tiempos por etapa de la corrida y reporte JSON que se guarda al terminar
+cronometro = Cronometro()
+REPORTE_TIEMPOS = os.getenv("REPORTE_TIEMPOS", "tiempos_glofas.json")
+
 # Obtener la fecha actual
 fecha_actual = datetime.now()
 year = str(fecha_actual.year)
 month = str(fecha_actual.month).zfill(2)  
 day = str(fecha_actual.day).zfill(2)
 
-# Ruta del shapefile en formato GeoJSON
-GEOJSON_URL = f"https://github.com/{GITHUB_REPO}/raw/{GITHUB_BRANCH}/frontend/public/shapefiles/RegionCoquimbo.geojson"
+# Regiones a procesar (regiones.json): se descarga la extensión que las cubre a todas una sola vez
+REGIONES = cargar_regiones()
+# Base de los GeoJSON de las regiones cuando no están en el directorio de trabajo
+GEOJSON_BASE_URL = f"https://github.com/{GITHUB_REPO}/raw/{GITHUB_BRANCH}"
+# HDF5 no admite lecturas simultáneas desde varios hilos
+_lock_netcdf = threading.Lock()
+
+def geojson_region(region):
+    """GeoJSON de la región: la copia local si existe o, si no, la publicada en el repositorio"""
+    if os.path.exists(region["geojson"]):
+        return region["geojson"]
+    return f"{GEOJSON_BASE_URL}/{region['geojson']}"
 
 # Función para descargar datos sin guardar el archivo
 def fetch_rlevel(day, month, year):
     print('Descargando datos...')
-    north, south, west, east = -29.0366, -32.28247, -71.71782, -69.809361
+    bbox = union_bbox(REGIONES)
+    north, south, west, east = bbox["north"], bbox["south"], bbox["west"], bbox["east"]
     request = {
         "system_version": ["operational"],
         "hydrological_model": ["lisflood"],
@@ -52,26 +91,76 @@ def fetch_rlevel(day, month, year):
     try:
         dataset = "cems-glofas-forecast"
         with NamedTemporaryFile(delete=True, suffix=".nc") as tmpfile:
-            client.retrieve(dataset, request, tmpfile.name)
+            with cronometro.etapa("descarga CDS"):
+                client.retrieve(dataset, request, tmpfile.name)
             print('Datos descargados, procesando...')
-            return guardar_medias_y_desviaciones(tmpfile.name)
+            with cronometro.etapa("medias y desviaciones"):
+                return guardar_medias_y_desviaciones(tmpfile.name)
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         return None
 
+# Media y desviación del ensamble en una sola pasada por bloques
+def medias_y_desviaciones(dis24, miembros_por_bloque=MIEMBROS_POR_BLOQUE):
+    """
+    Media y desviación estándar de dis24 sobre los miembros ("number"), omitiendo NaN, como
+    dataset.mean/std pero en una sola pasada. Se lee un plazo a la vez y los miembros por bloques,
+    que se combinan con las fórmulas de Welford/Chan (conteo, media y suma de cuadrados de las
+    desviaciones), así la memoria depende del tamaño de un bloque y no de la cantidad de miembros.
+    """
+    plantilla = dis24.isel(number=0, drop=True)
+    eje = dis24.isel(forecast_period=0).dims.index("number")
+    medias, desviaciones = [], []
+
+    for k in range(dis24.sizes["forecast_period"]):
+        plazo = dis24.isel(forecast_period=k)
+        n = media = m2 = None
+        for inicio in range(0, dis24.sizes["number"], miembros_por_bloque):
+            bloque = plazo.isel(number=slice(inicio, inicio + miembros_por_bloque)).values
+            validos = ~np.isnan(bloque)
+            n_bloque = validos.sum(axis=eje)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                media_bloque = np.where(validos, bloque, 0).sum(axis=eje, dtype=np.float64) / n_bloque
+            media_bloque = np.where(n_bloque > 0, media_bloque, 0.0)
+            desvios = np.where(validos, bloque - np.expand_dims(media_bloque, eje), 0.0)
+            m2_bloque = (desvios * desvios).sum(axis=eje)
+
+            if n is None:
+                n, media, m2 = n_bloque, media_bloque, m2_bloque
+                continue
+            total = n + n_bloque
+            with np.errstate(invalid="ignore", divide="ignore"):
+                peso = np.where(total > 0, n_bloque / total, 0.0)
+            delta = media_bloque - media
+            media = media + delta * peso
+            m2 = m2 + m2_bloque + delta ** 2 * n * peso
+            n = total
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            medias.append(np.where(n > 0, media, np.nan).astype(np.float32))
+            desviaciones.append(np.where(n > 0, np.sqrt(m2 / n), np.nan).astype(np.float32))
+
+    eje_plazo = plantilla.dims.index("forecast_period")
+    media = xr.DataArray(np.stack(medias, axis=eje_plazo), coords=plantilla.coords, dims=plantilla.dims)
+    desviacion = xr.DataArray(np.stack(desviaciones, axis=eje_plazo), coords=plantilla.coords, dims=plantilla.dims)
+    return media, desviacion
+
 # Función para guardar medias y desviaciones
 def guardar_medias_y_desviaciones(archivo):
+    """
+    Calcula medias y desviaciones una vez sobre la extensión descargada y guarda el recorte de
+    cada región. Devuelve {región: archivo de download/ de la región}.
+    """
     dataset = xr.open_dataset(archivo)
     
     if "dis24" not in dataset:
         print("Error: La variable 'dis24' no está en el dataset.")
         return None
 
-    mean_ds = dataset.mean(dim="number", skipna=True)
-    std_ds = dataset.std(dim="number", skipna=True)
+    mean_dis24, std_dis24 = medias_y_desviaciones(dataset["dis24"])
 
     combined_ds = xr.Dataset(
-        {"mean_dis24": mean_ds["dis24"], "std_dis24": std_ds["dis24"]},
+        {"mean_dis24": mean_dis24, "std_dis24": std_dis24},
         coords={
             "latitude": dataset["latitude"],
             "longitude": dataset["longitude"],
@@ -80,102 +169,221 @@ def guardar_medias_y_desviaciones(archivo):
         }
     )
 
-    output_file = f"download/{year}{month}{day}.nc"
-    combined_ds.to_netcdf(output_file)
-    print(f"Archivo guardado como: {output_file}")
-
-    subir_archivo_a_github("download", output_file)
-    return output_file
-
-# Función para subir archivo a GitHub
-
-def subir_archivo_a_github(folder, file_path):
-    print(f"Subiendo archivo: {file_path}")
-    file_name = os.path.basename(file_path)
-    github_url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{folder}/{file_name}"
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-
-    # Verificar si el archivo ya existe en GitHub
-    response = requests.get(github_url, headers=headers)
-    if response.status_code == 200:
-        file_sha = response.json().get("sha")  # Obtener el SHA si existe
-    else:
-        file_sha = None  # Si no existe, lo subiremos como nuevo archivo
-
-    with open(file_path, "rb") as file:
-        file_content = file.read()
+    archivos = {}
+    for nombre, region in REGIONES.items():
+        carpeta = ruta_region(region, "download")
+        os.makedirs(carpeta, exist_ok=True)
+        output_file = f"{carpeta}/{year}{month}{day}.nc"
+        formato = guardar_netcdf(recortar_bbox(combined_ds, region["bbox"]), output_file, ["mean_dis24"], ["std_dis24"], FORMATO_NETCDF)
+        print(f"Archivo guardado como: {output_file} ({formato}, {os.path.getsize(output_file) / 1024:.1f} KB)")
+
+        publicador.agregar(carpeta, output_file)
+
+        if GUARDAR_MIEMBROS:
+            archivo_miembros = guardar_miembros(recortar_bbox(dataset, region["bbox"]), ruta_region(region, MIEMBROS_DIR))
+            publicador.agregar(ruta_region(region, MIEMBROS_DIR), archivo_miembros)
+
+        if ACTUALIZAR_HISTORICO:
+            archivo_historico = actualizar_historico(region, output_file)
+            if archivo_historico:
+                publicador_historico.agregar(os.path.dirname(archivo_historico), archivo_historico)
+
+        archivos[nombre] = output_file
+
+    return archivos
+
+# Histórico consolidado de la región, publicado en RAMA_HISTORICO
+def actualizar_historico(region, output_file):
+    """
+    Trae el histórico publicado, le agrega las corridas de download/ que aún no tiene (la primera
+    vez, todas: así se construye el histórico inicial) y reemplaza la del día. Devuelve la ruta del
+    histórico actualizado, o None si no se pudo traer el publicado: en ese caso no se actualiza,
+    para no reemplazarlo con uno que solo tendría las corridas locales.
+    """
+    ruta = ruta_region(region, ARCHIVO_HISTORICO)
+    try:
+        if not publicador_historico.descargar(ruta, ruta) and not os.path.exists(ruta):
+            print(f"No hay histórico publicado en la rama {RAMA_HISTORICO}: se crea a partir de download/")
+    except Exception as e:
+        print(f"No se pudo traer el histórico de la rama {RAMA_HISTORICO}, no se actualiza: {e}")
+        return None
 
-    data = {
-        "message": f"Actualizando {file_name}",
-        "content": base64.b64encode(file_content).decode("utf-8"),
-        "branch": GITHUB_BRANCH,
+    diarios = sorted(glob.glob(os.path.join(ruta_region(region, "download"), "*.nc")))
+    pendientes = [archivo for archivo in corridas_pendientes(diarios, ruta) if archivo != output_file]
+    if pendientes:
+        print(f"Consolidando {agregar_corridas(pendientes, ruta)} corridas pendientes en {ruta}")
+    return ruta if agregar_corrida(output_file, ruta) else None
+
+# Función para guardar todos los miembros del ensamble en formato compacto
+def guardar_miembros(dataset, directorio=MIEMBROS_DIR):
+    """
+    Guarda dis24 con todos los miembros empaquetado en 16 bits (netcdf_compacto.empaquetado, sin
+    add_offset para que el 0 se conserve exacto) y comprimido. Los fragmentos abarcan todos los
+    plazos y miembros de bloques de 4x4 píxeles, de modo que la serie de un punto se lee
+    descomprimiendo un solo fragmento. La resolución es PRECISION_CAUDAL, o la necesaria para que
+    el caudal máximo de la corrida quepa en 16 bits.
+    """
+    dis24 = dataset["dis24"].transpose(..., "forecast_period", "number", "latitude", "longitude")
+    maximo = float(np.nanmax(np.abs(dis24.values), initial=0.0))
+    precision = max(PRECISION_CAUDAL, maximo / 65000)
+    encoding = {
+        "dis24": {
+            **empaquetado(dis24, precision),
+            "zlib": True,
+            "complevel": 4,
+            "shuffle": True,
+            "chunksizes": fragmentos(dis24, 4),
+        }
     }
 
-    # Si el archivo ya existe, agregamos su SHA para sobreescribirlo
-    if file_sha:
-        data["sha"] = file_sha
-
-    response = requests.put(github_url, headers=headers, json=data)
-    if response.status_code in [200, 201]:
-        print(f"Archivo {file_name} subido correctamente.")
-    else:
-        print(f"Error al subir {file_name}: {response.status_code}")
-        print(response.json())
-
+    os.makedirs(directorio, exist_ok=True)
+    output_file = os.path.join(directorio, f"{year}{month}{day}.nc")
+    dis24.to_dataset(name="dis24").to_netcdf(output_file, encoding=encoding)
+    print(f"Miembros del ensamble guardados como: {output_file} ({os.path.getsize(output_file) / 1024:.0f} KB)")
+    return output_file
 
+# Escritura de una banda como GeoTIFF (se ejecuta en paralelo, GDAL libera el GIL)
+def escribir_banda(band_data, output_tif, perfil):
+    with rasterio.open(output_tif, 'w', dtype=band_data.dtype, **perfil) as dst:
+        dst.write(band_data, 1)
+    return output_tif
+
+# Estadísticas por zona (comunas, cuencas, ...) a partir del mismo dataset que los GeoTIFF
+def generar_estadisticas_zonales(ds, nombre_region, region):
+    """
+    Para cada capa de zonas de la región ("zonas" en regiones.json, de la forma
+    {"<capa>": {"geojson": ruta en el repositorio, "campo": atributo con el nombre de la zona}})
+    guarda en zonas/<capa>.nc el caudal máximo y medio, el peor periodo de retorno excedido y la
+    fracción de celdas que excede algún umbral, por zona y plazo. Las etiquetas de cada capa se
+    rasterizan una vez por grilla.
+    Devuelve la lista de archivos escritos.
+    """
+    capas = region.get("zonas", {})
+    if not capas:
+        return []
+
+    latitudes, longitudes = ds["latitude"].values, ds["longitude"].values
+    datos = ds["mean_dis24"].transpose("forecast_period", "forecast_reference_time", ...).values[:, 0]
+    horas = ds["forecast_period"].values
+    periodos, umbrales = umbrales_en_grilla(latitudes, longitudes, nombre_region)
+    if not len(periodos):
+        print(f"Sin umbrales locales para {nombre_region}: las zonas no tendrán periodo excedido")
+
+    carpeta = ruta_region(region, "zonas")
+    os.makedirs(carpeta, exist_ok=True)
+    archivos = []
+    for capa, configuracion in capas.items():
+        try:
+            etiquetas, nombres, etiquetas_nuevas = etiquetas_zonas(
+                latitudes, longitudes, geojson_region(configuracion), configuracion["campo"]
+            )
+            if etiquetas_nuevas:
+                publicador.agregar(MASCARAS_DIR, etiquetas_nuevas)
+            tabla = estadisticas_zonales(datos, horas, etiquetas, nombres, umbrales, periodos)
+            tabla.attrs["fecha"] = f"{year}{month}{day}"
+            tabla.attrs["capa"] = capa
+            output_file = os.path.join(carpeta, f"{capa}.nc")
+            tabla.to_netcdf(output_file)
+            publicador.agregar(carpeta, output_file)
+            archivos.append(output_file)
+            print(f"Estadísticas de {len(nombres)} zonas ({capa}) guardadas en {output_file}")
+        except Exception as e:
+            print(f"Error en las estadísticas zonales de {capa}: {e}")
+    return archivos
 
 # Función para hacer clipping y generar GeoTIFFs
-def clip_y_generar_geotiffs(archivo_nc):
+def clip_y_generar_geotiffs(archivo_nc, nombre_region=None):
+    """
+    Genera un GeoTIFF por plazo de pronóstico para una región (por defecto la primera del
+    registro); devuelve la lista de archivos escritos
+    """
+    nombre_region = nombre_region or next(iter(REGIONES))
+    region = REGIONES[nombre_region]
     print(f"Procesando clip y generación de GeoTIFFs para {archivo_nc}...")
 
     try:
-        ds = xr.open_dataset(archivo_nc, decode_timedelta=False)
-        shapefile = gpd.read_file(GEOJSON_URL)
-
-        ds["longitude"] = ds["longitude"].where(ds["longitude"] <= 180, ds["longitude"] - 360)
-        ds = ds.rio.write_crs("EPSG:4326")
-        shapefile = shapefile.to_crs("EPSG:4326")
-
-        ds_clipped = ds.rio.clip(shapefile.geometry, shapefile.crs, drop=False)
-
-        # Filtrar valores no deseados
-        for var in ds_clipped.data_vars:
-            if ds_clipped[var].dtype in [np.float32, np.float64]:
-                ds_clipped[var] = ds_clipped[var].where(ds_clipped[var] >= 0.1)
-
-        mean_dis24 = ds_clipped['mean_dis24']
-        output_dir = "frontend/public/geotiff/resultados/"
+        with cronometro.etapa("clip"):
+            with _lock_netcdf:
+                ds = xr.open_dataset(archivo_nc, decode_timedelta=False).load()
+
+            ds["longitude"] = ds["longitude"].where(ds["longitude"] <= 180, ds["longitude"] - 360)
+            ds = ds.rio.write_crs("EPSG:4326")
+
+            # La región se rasteriza una vez por grilla; el recorte y el filtro >= 0.1 son un solo np.where
+            mascara, mascara_nueva = mascara_region(ds["latitude"].values, ds["longitude"].values, geojson_region(region))
+            if mascara_nueva:
+                publicador.agregar(MASCARAS_DIR, mascara_nueva)
+            mean_dis24 = ds['mean_dis24']
+            datos = aplicar_mascara(
+                mean_dis24.transpose('forecast_period', 'forecast_reference_time', ...).values,
+                mascara,
+                minimo=0.1,
+            )
+
+        carpeta_salida = ruta_region(region, "frontend/public/geotiff/resultados")
+        output_dir = f"{carpeta_salida}/"
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        for i, forecast_period_value in enumerate(ds_clipped['forecast_period']):
-            for j in range(len(ds_clipped['forecast_reference_time'])):
-                subarray = mean_dis24.isel(forecast_period=i, forecast_reference_time=j)
-                band_data = subarray.values
-                forecast_period_int = int(forecast_period_value.values)
-                band_filename = f"{forecast_period_int}.tif"
-                output_tif = os.path.join(output_dir, band_filename)
+        # Georreferenciación común a todas las bandas, calculada una sola vez
+        perfil = {
+            **opciones_raster(),
+            "count": 1,
+            "height": mean_dis24.rio.height,
+            "width": mean_dis24.rio.width,
+            "crs": mean_dis24.rio.crs,
+            "transform": mean_dis24.rio.transform(),
+        }
+
+        tareas = []
+        for i, forecast_period_value in enumerate(ds['forecast_period'].values):
+            for j in range(len(ds['forecast_reference_time'])):
+                output_tif = os.path.join(output_dir, f"{int(forecast_period_value)}.tif")
+                tareas.append((datos[i, j], output_tif))
+
+        with cronometro.etapa("escritura GeoTIFF"):
+            with ThreadPoolExecutor(max_workers=HILOS_RASTER) as ejecutor:
+                archivos = list(ejecutor.map(lambda tarea: escribir_banda(*tarea, perfil), tareas))
+        print(f"{len(archivos)} archivos GeoTIFF guardados en {output_dir}")
 
-                transform = mean_dis24.rio.transform()
-                crs = mean_dis24.rio.crs
-                height, width = band_data.shape
+        if FORMATO_RASTER == "cog":
+            with cronometro.etapa("verificación COG"):
+                verificar_archivos(archivos)
 
-                with rasterio.open(output_tif, 'w', driver='GTiff', count=1, dtype=band_data.dtype,
-                                   height=height, width=width, crs=crs, transform=transform) as dst:
-                    dst.write(band_data, 1)
+        # La publicación queda separada del renderizado
+        for output_tif in archivos:
+            publicador.agregar(carpeta_salida, output_tif)
 
-                print(f"Archivo GeoTIFF guardado: {output_tif}")
-                subir_archivo_a_github("frontend/public/geotiff/resultados", output_tif)
+        with cronometro.etapa("estadísticas zonales"):
+            generar_estadisticas_zonales(ds, nombre_region, region)
+        return archivos
 
     except Exception as e:
         print(f"Error en clip_y_generar_geotiffs: {e}")
+        return []
 
 # Función principal
 if __name__ == "__main__":
-    archivo_nc = fetch_rlevel(day, month, year)
-    if archivo_nc:
-        clip_y_generar_geotiffs(archivo_nc)
+    archivos_nc = fetch_rlevel(day, month, year)
+    if archivos_nc:
+        # Los GeoTIFF de cada región se generan en paralelo a partir de la misma descarga
+        with ThreadPoolExecutor(max_workers=len(archivos_nc)) as ejecutor:
+            list(ejecutor.map(lambda item: clip_y_generar_geotiffs(item[1], item[0]), archivos_nc.items()))
+        with cronometro.etapa("publicación"):
+            # El histórico va primero: cuando el backend ve el nuevo commit de main ya está publicado
+            if publicador_historico.archivos:
+                try:
+                    publicador_historico.publicar(f"Histórico GloFAS hasta {year}{month}{day}", reemplazar=True)
+                except Exception as e:
+                    print(f"Error al publicar el histórico: {e}")
+            publicador.publicar(f"Actualizando pronóstico GloFAS {year}{month}{day}")
+    cronometro.imprimir()
+    cronometro.guardar(
+        REPORTE_TIEMPOS,
+        proceso="glofas",
+        fecha=f"{year}{month}{day}",
+        regiones=sorted(archivos_nc or {}),
+        formato_raster=FORMATO_RASTER,
+        formato_netcdf=FORMATO_NETCDF,
+    )
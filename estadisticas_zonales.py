@@ -0,0 +1,163 @@
+import io
+import os
+import glob
+import re
+
+import numpy as np
+import xarray as xr
+import geopandas as gpd
+from rasterio.features import rasterize
+
+from mascara_region import MASCARAS_DIR, _plantilla, hash_contenido, hash_grilla, leer_geojson
+
+# Carpeta local con los NetCDF de umbrales (flood_threshold_glofas_v4_rl_<periodo>_<región>.nc)
+UMBRALES_DIR = os.getenv("UMBRALES_DIR", "FloodThreshold")
+PATRON_PERIODO = re.compile(r"rl_(\d+\.?\d*)")
+
+# Etiquetas de zonas ya calculadas en este proceso: clave -> (etiquetas, nombres)
+_etiquetas = {}
+
+
+def rasterizar_zonas(latitudes, longitudes, geojson, campo):
+    """
+    Raster de etiquetas de una capa de polígonos sobre la grilla: 1..N según el orden de nombres y
+    0 fuera de todas las zonas. Cada celda pertenece a la zona que contiene su centro, el mismo
+    criterio que la máscara de la región; las zonas más chicas que una celda se asignan a la celda
+    de su punto representativo para que ninguna quede sin datos.
+    """
+    zonas = gpd.read_file(geojson).to_crs("EPSG:4326")
+    zonas = zonas.dissolve(by=campo).reset_index()
+    nombres = [str(nombre) for nombre in zonas[campo]]
+    plantilla = _plantilla(latitudes, longitudes)
+    etiquetas = rasterize(
+        zip(zonas.geometry, range(1, len(zonas) + 1)),
+        out_shape=plantilla.shape,
+        transform=plantilla.rio.transform(recalc=True),
+        fill=0,
+        dtype="int32",
+    )
+
+    sin_celdas = np.setdiff1d(np.arange(1, len(zonas) + 1), etiquetas)
+    for etiqueta in sin_celdas:
+        punto = zonas.geometry.iloc[etiqueta - 1].representative_point()
+        i = int(np.abs(latitudes - punto.y).argmin())
+        j = int(np.abs(longitudes - punto.x).argmin())
+        if etiquetas[i, j] == 0:
+            etiquetas[i, j] = etiqueta
+    return etiquetas, nombres
+
+
+def etiquetas_zonas(latitudes, longitudes, geojson, campo):
+    """
+    Devuelve (etiquetas, nombres, ruta nueva o None), igual que mascara_region: se busca primero en
+    memoria y luego en MASCARAS_DIR, y solo se rasteriza la capa si no existe para esta grilla y
+    este contenido del GeoJSON.
+    """
+    datos = leer_geojson(geojson)
+    clave = hash_grilla(latitudes, longitudes, hash_contenido(datos), campo)
+    if clave in _etiquetas:
+        return (*_etiquetas[clave], None)
+
+    ruta = os.path.join(MASCARAS_DIR, f"zonas_{clave}.npz")
+    if os.path.exists(ruta):
+        guardado = np.load(ruta)
+        if guardado["etiquetas"].shape == (len(latitudes), len(longitudes)):
+            _etiquetas[clave] = (guardado["etiquetas"], guardado["nombres"].tolist())
+            return (*_etiquetas[clave], None)
+
+    print(f"Rasterizando las zonas de {geojson} para la grilla {clave}...")
+    etiquetas, nombres = rasterizar_zonas(latitudes, longitudes, io.BytesIO(datos), campo)
+    os.makedirs(MASCARAS_DIR, exist_ok=True)
+    np.savez_compressed(ruta, etiquetas=etiquetas, nombres=np.array(nombres))
+    _etiquetas[clave] = (etiquetas, nombres)
+    return etiquetas, nombres, ruta
+
+
+def reducir_por_zona(datos, etiquetas, n_zonas):
+    """
+    Máximo, suma y cantidad de valores finitos de cada zona en cada paso, con arreglos de forma
+    (pasos, n_zonas). Todos los pasos se reducen juntos: el índice paso * n_zonas + zona agrupa las
+    celdas para np.bincount y, ordenado, para np.maximum.reduceat.
+    """
+    pasos = datos.shape[0]
+    etiquetas = etiquetas.ravel()
+    dentro = etiquetas > 0
+    valores = datos.reshape(pasos, -1)[:, dentro]
+    validos = np.isfinite(valores)
+    indice = (np.arange(pasos)[:, None] * n_zonas + (etiquetas[dentro] - 1)[None, :])[validos]
+    valores = valores[validos]
+
+    total = pasos * n_zonas
+    conteo = np.bincount(indice, minlength=total)
+    suma = np.bincount(indice, weights=valores, minlength=total)
+    maximo = np.full(total, np.nan)
+    if indice.size:
+        orden = np.argsort(indice, kind="stable")
+        indice, valores = indice[orden], valores[orden]
+        inicios = np.flatnonzero(np.r_[True, indice[1:] != indice[:-1]])
+        maximo[indice[inicios]] = np.maximum.reduceat(valores, inicios)
+    return maximo.reshape(pasos, n_zonas), suma.reshape(pasos, n_zonas), conteo.reshape(pasos, n_zonas)
+
+
+def umbrales_en_grilla(latitudes, longitudes, nombre_region, directorio=UMBRALES_DIR):
+    """
+    Umbrales de la región llevados a la grilla del pronóstico (vecino más cercano, a lo sumo media
+    celda de distancia). Devuelve (periodos ordenados, arreglo (periodo, lat, lon)); vacío si no hay.
+    """
+    entradas = []
+    for ruta in glob.glob(os.path.join(directorio, f"*_{nombre_region}.nc")):
+        coincidencia = PATRON_PERIODO.search(os.path.basename(ruta))
+        if coincidencia:
+            entradas.append((float(coincidencia.group(1)), ruta))
+    if not entradas:
+        return np.array([]), np.empty((0, len(latitudes), len(longitudes)))
+
+    tolerancia = abs(float(latitudes[1] - latitudes[0])) / 2 if len(latitudes) > 1 else 0.05
+    capas = []
+    for _, ruta in sorted(entradas):
+        with xr.open_dataset(ruta) as ds:
+            umbral = ds[list(ds.data_vars)[0]].transpose("lat", "lon")
+            umbral = umbral.reindex(lat=latitudes, lon=longitudes, method="nearest", tolerance=tolerancia)
+            capas.append(umbral.values.astype(np.float64))
+    return np.array([periodo for periodo, _ in sorted(entradas)]), np.stack(capas)
+
+
+def periodo_excedido(datos, umbrales, periodos):
+    """Mayor periodo de retorno cuyo umbral supera cada celda en cada paso (0 si no supera ninguno)"""
+    if not len(periodos):
+        return np.zeros(datos.shape)
+    with np.errstate(invalid="ignore"):
+        excede = datos[:, None] >= umbrales[None]
+    return np.where(excede, periodos[None, :, None, None], 0.0).max(axis=1)
+
+
+def estadisticas_zonales(datos, horas, etiquetas, nombres, umbrales, periodos):
+    """
+    Tabla (zona, forecast_period) con el caudal máximo y medio de cada zona, el peor periodo de
+    retorno excedido y la fracción de sus celdas que excede el menor periodo disponible.
+    datos: caudal medio del ensamble (forecast_period, lat, lon) en la grilla de las etiquetas.
+    """
+    n_zonas = len(nombres)
+    maximo, suma, conteo = reducir_por_zona(datos, etiquetas, n_zonas)
+    periodos_celda = np.where(np.isfinite(datos), periodo_excedido(datos, umbrales, periodos), np.nan)
+    peor_periodo, _, _ = reducir_por_zona(periodos_celda, etiquetas, n_zonas)
+    # 1 en las celdas que exceden algún umbral (las celdas sin datos siguen en NaN)
+    _, excedidas, _ = reducir_por_zona(np.where(periodos_celda > 0, 1.0, periodos_celda), etiquetas, n_zonas)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = np.where(conteo > 0, suma / conteo, np.nan)
+        fraccion = np.where(conteo > 0, excedidas / conteo, np.nan)
+    celdas = np.bincount(etiquetas.ravel(), minlength=n_zonas + 1)[1:]
+
+    dims = ("zona", "forecast_period")
+    return xr.Dataset(
+        {
+            "caudal_maximo": (dims, maximo.T.astype(np.float32)),
+            "caudal_medio": (dims, media.T.astype(np.float32)),
+            "periodo_excedido": (dims, peor_periodo.T.astype(np.float32)),
+            "fraccion_excedida": (dims, fraccion.T.astype(np.float32)),
+            "celdas": ("zona", celdas.astype(np.int32)),
+        },
+        coords={"zona": np.array(nombres, dtype=object), "forecast_period": np.asarray(horas)},
+        attrs={"periodos_retorno": np.asarray(periodos, dtype=np.float64)},
+    )
@@ -0,0 +1,149 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+import xarray as xr
+from requests.adapters import HTTPAdapter
+
+# Servidor de datos abiertos de ECMWF (o uno local que lo imite, con la misma estructura de rutas)
+URL_BASE_ECMWF = os.getenv("ECMWF_URL_BASE", "https://data.ecmwf.int/forecasts")
+MODELO_ECMWF = os.getenv("ECMWF_MODELO", "ifs")
+RESOLUCION_ECMWF = os.getenv("ECMWF_RESOLUCION", "0p25")
+HILOS_DESCARGA = int(os.getenv("HILOS_DESCARGA", "8"))
+
+
+def url_paso(fecha, hora, paso, url_base=URL_BASE_ECMWF, stream="oper", tipo="fc"):
+    """URL del GRIB de un paso de pronóstico; su índice está en la misma ruta con extensión .index"""
+    return (
+        f"{url_base}/{fecha}/{hora:02d}z/{MODELO_ECMWF}/{RESOLUCION_ECMWF}/{stream}/"
+        f"{fecha}{hora:02d}0000-{paso}h-{stream}-{tipo}.grib2"
+    )
+
+
+def nueva_sesion(conexiones=HILOS_DESCARGA):
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=conexiones, pool_maxsize=conexiones, max_retries=2)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+
+def leer_indice(sesion, url_grib):
+    """Entradas del índice .index (una línea JSON por mensaje, con _offset y _length en bytes)"""
+    url = url_grib.rsplit(".", 1)[0] + ".index"
+    respuesta = sesion.get(url, timeout=60)
+    respuesta.raise_for_status()
+    return [json.loads(linea) for linea in respuesta.text.splitlines() if linea.strip()]
+
+
+def seleccionar(entradas, parametros, levtype="sfc"):
+    """Mensajes de los parámetros pedidos, en el orden en que están en el archivo"""
+    elegidas = [e for e in entradas if e.get("param") in parametros and e.get("levtype", levtype) == levtype]
+    faltantes = set(parametros) - {e["param"] for e in elegidas}
+    if faltantes:
+        raise ValueError(f"Parámetros no disponibles en el índice: {sorted(faltantes)}")
+    return sorted(elegidas, key=lambda e: e["_offset"])
+
+
+def agrupar_rangos(entradas, hueco_maximo=0):
+    """
+    Une los mensajes contiguos (o separados por a lo sumo hueco_maximo bytes) en rangos
+    (inicio, fin inclusive, mensajes), para pedir cada rango en una sola solicitud
+    """
+    rangos = []
+    for entrada in entradas:
+        inicio = entrada["_offset"]
+        fin = inicio + entrada["_length"] - 1
+        if rangos and inicio - rangos[-1][1] - 1 <= hueco_maximo:
+            rangos[-1][1] = max(rangos[-1][1], fin)
+            rangos[-1][2].append(entrada)
+        else:
+            rangos.append([inicio, fin, [entrada]])
+    return [tuple(rango) for rango in rangos]
+
+
+def descargar_rango(sesion, url, rango):
+    """Descarga un rango de bytes y lo separa en los mensajes que contiene"""
+    inicio, fin, entradas = rango
+    respuesta = sesion.get(url, headers={"Range": f"bytes={inicio}-{fin}"}, timeout=120)
+    respuesta.raise_for_status()
+    if respuesta.status_code != 206:
+        raise RuntimeError(f"El servidor no respetó el rango pedido de {url} (HTTP {respuesta.status_code})")
+    datos = respuesta.content
+    if len(datos) != fin - inicio + 1:
+        raise RuntimeError(f"Rango incompleto de {url}: {len(datos)} de {fin - inicio + 1} bytes")
+    return [(e["_offset"], datos[e["_offset"] - inicio:e["_offset"] - inicio + e["_length"]]) for e in entradas]
+
+
+def descargar_pasos(fecha, hora, pasos, parametros, directorio, url_base=URL_BASE_ECMWF, hilos=HILOS_DESCARGA):
+    """
+    Descarga con solicitudes de rango concurrentes solo los mensajes de los parámetros pedidos
+    de cada paso. Es un generador: entrega (paso, ruta del GRIB) apenas se completa cada paso,
+    para decodificarlo mientras siguen las descargas de los demás.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    sesion = nueva_sesion(hilos)
+    urls = {paso: url_paso(fecha, hora, paso, url_base) for paso in pasos}
+    descargados = 0
+    total = 0
+
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        indices = dict(zip(pasos, ejecutor.map(lambda paso: leer_indice(sesion, urls[paso]), pasos)))
+
+        futuros = {}
+        pendientes = {}
+        for paso in pasos:
+            entradas = indices[paso]
+            total += max(e["_offset"] + e["_length"] for e in entradas)
+            rangos = agrupar_rangos(seleccionar(entradas, parametros))
+            pendientes[paso] = [len(rangos), []]
+            for rango in rangos:
+                futuros[ejecutor.submit(descargar_rango, sesion, urls[paso], rango)] = paso
+
+        for futuro in as_completed(futuros):
+            paso = futuros[futuro]
+            mensajes = futuro.result()
+            descargados += sum(len(datos) for _, datos in mensajes)
+            pendientes[paso][0] -= 1
+            pendientes[paso][1].extend(mensajes)
+            if pendientes[paso][0]:
+                continue
+
+            ruta = os.path.join(directorio, f"paso_{paso}.grib2")
+            with open(ruta, "wb") as archivo:
+                for _, datos in sorted(pendientes.pop(paso)[1]):
+                    archivo.write(datos)
+            yield paso, ruta
+
+    print(f"Descargados {descargados / 1e6:.1f} MB de {total / 1e6:.1f} MB ({len(pasos)} pasos, {len(parametros)} parámetros)")
+
+
+def decodificar(ruta):
+    """
+    Lee un GRIB con cfgrib y lo carga en memoria, sin dejar archivos .idx junto a él. Los mensajes
+    con distinto tipo de nivel (tp en superficie, 2t a 2 m) quedan en un solo Dataset.
+    """
+    import cfgrib
+
+    datasets = cfgrib.open_datasets(ruta, backend_kwargs={"indexpath": ""})
+    ds = xr.merge([d.load() for d in datasets], compat="override", join="exact")
+    for d in datasets:
+        d.close()
+    return ds
+
+
+def ingerir(fecha, hora, pasos, parametros, directorio, url_base=URL_BASE_ECMWF, hilos=HILOS_DESCARGA):
+    """
+    Descarga por rangos y decodifica paso a paso (eccodes no admite varios hilos, así que se
+    decodifica en el hilo principal a medida que llegan los pasos). Devuelve un Dataset con la
+    dimensión step ordenada.
+    """
+    por_paso = {}
+    for paso, ruta in descargar_pasos(fecha, hora, pasos, parametros, directorio, url_base, hilos):
+        ds = decodificar(ruta)
+        os.remove(ruta)
+        if "step" not in ds.dims:
+            ds = ds.expand_dims("step")
+        por_paso[paso] = ds
+    return xr.concat([por_paso[paso] for paso in sorted(por_paso)], dim="step")
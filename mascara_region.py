@@ -0,0 +1,127 @@
+import io
+import os
+import hashlib
+
+import numpy as np
+import requests
+import xarray as xr
+import rioxarray
+from rasterio.features import geometry_mask
+
+# Máscaras rasterizadas de la región, una por definición de grilla (se publican para reutilizarlas)
+MASCARAS_DIR = os.getenv("MASCARAS_DIR", "mascaras")
+
+# Máscaras y ventanas ya calculadas en este proceso: clave -> arreglo / (slice, slice)
+_mascaras = {}
+_ventanas = {}
+
+
+def hash_grilla(latitudes, longitudes, *extra):
+    """Identificador de una grilla (coordenadas exactas) y, opcionalmente, de la región aplicada"""
+    h = hashlib.sha1()
+    for eje in (latitudes, longitudes):
+        eje = np.ascontiguousarray(eje, dtype=np.float64)
+        h.update(str(eje.shape).encode("utf-8"))
+        h.update(eje.tobytes())
+    for valor in extra:
+        h.update(str(valor).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def leer_geojson(geojson):
+    """Contenido del GeoJSON, desde una ruta local o una URL"""
+    if os.path.exists(str(geojson)):
+        with open(geojson, "rb") as archivo:
+            return archivo.read()
+    response = requests.get(str(geojson), timeout=60)
+    response.raise_for_status()
+    return response.content
+
+
+def hash_contenido(datos):
+    """Identificador del contenido de un archivo (para que la clave cambie si se edita el GeoJSON)"""
+    return hashlib.sha1(datos).hexdigest()[:16]
+
+
+def _plantilla(latitudes, longitudes):
+    """DataArray vacío con la grilla indicada, para obtener la transformación afín de rioxarray"""
+    plantilla = xr.DataArray(
+        np.zeros((len(latitudes), len(longitudes)), dtype=np.uint8),
+        coords={"latitude": latitudes, "longitude": longitudes},
+        dims=("latitude", "longitude"),
+    )
+    return plantilla.rio.write_crs("EPSG:4326")
+
+
+def rasterizar_region(latitudes, longitudes, geojson):
+    """
+    Rasteriza el polígono de la región sobre la grilla: True en las celdas cuyo centro cae dentro,
+    el mismo criterio que rio.clip (all_touched=False).
+    """
+    # geopandas solo se necesita aquí: el proceso meteorológico usa ventana_bbox sin tenerlo instalado
+    import geopandas as gpd
+
+    region = gpd.read_file(geojson).to_crs("EPSG:4326")
+    plantilla = _plantilla(latitudes, longitudes)
+    return geometry_mask(
+        region.geometry,
+        out_shape=plantilla.shape,
+        transform=plantilla.rio.transform(recalc=True),
+        invert=True,
+    )
+
+
+def mascara_region(latitudes, longitudes, geojson):
+    """
+    Devuelve (máscara booleana (latitud, longitud), ruta nueva o None). La máscara se busca primero
+    en memoria y luego en MASCARAS_DIR; solo si no existe para esta grilla y este contenido del
+    GeoJSON se rasteriza la región, y en ese caso se devuelve la ruta del archivo creado para
+    poder publicarlo.
+    """
+    datos = leer_geojson(geojson)
+    clave = hash_grilla(latitudes, longitudes, hash_contenido(datos))
+    if clave in _mascaras:
+        return _mascaras[clave], None
+
+    ruta = os.path.join(MASCARAS_DIR, f"region_{clave}.npy")
+    if os.path.exists(ruta):
+        mascara = np.load(ruta)
+        if mascara.shape == (len(latitudes), len(longitudes)):
+            _mascaras[clave] = mascara
+            return mascara, None
+
+    print(f"Rasterizando la región {geojson} para la grilla {clave}...")
+    mascara = rasterizar_region(latitudes, longitudes, io.BytesIO(datos))
+    os.makedirs(MASCARAS_DIR, exist_ok=True)
+    np.save(ruta, mascara)
+    _mascaras[clave] = mascara
+    return mascara, ruta
+
+
+def aplicar_mascara(datos, mascara, minimo=None):
+    """
+    Deja en NaN las celdas fuera de la región (y, si se indica, las menores que minimo) con un solo
+    np.where. La máscara se alinea con las dos últimas dimensiones (latitud, longitud) de los datos.
+    """
+    condicion = mascara
+    if minimo is not None:
+        with np.errstate(invalid="ignore"):
+            condicion = condicion & (datos >= minimo)
+    return np.where(condicion, datos, np.nan)
+
+
+def ventana_bbox(data, bbox):
+    """
+    Índices (filas, columnas) del recorte rectangular de bbox sobre la grilla de data. Se calcula una
+    vez por grilla con rio.clip_box sobre una plantilla, así el recorte es idéntico al de rioxarray.
+    """
+    y, x = data[data.rio.y_dim].values, data[data.rio.x_dim].values
+    clave = hash_grilla(y, x, sorted(bbox.items()))
+    if clave not in _ventanas:
+        recorte = _plantilla(y, x).rio.clip_box(
+            minx=bbox["west"], miny=bbox["south"], maxx=bbox["east"], maxy=bbox["north"]
+        )
+        filas = np.flatnonzero(np.isin(y, recorte["latitude"].values))
+        columnas = np.flatnonzero(np.isin(x, recorte["longitude"].values))
+        _ventanas[clave] = (slice(filas[0], filas[-1] + 1), slice(columnas[0], columnas[-1] + 1))
+    return _ventanas[clave]
@@ -0,0 +1,158 @@
+import os
+import sys
+
+import numpy as np
+import xarray as xr
+
+# Codificación de los NetCDF diarios de caudal: "float" (float32 sin comprimir, como hasta ahora),
+# "comprimido" (float32 con zlib y shuffle, sin pérdida) o "cuantizado" (con pérdida acotada,
+# más zlib y shuffle: ver cuantizar)
+FORMATO_NETCDF = os.getenv("FORMATO_NETCDF", "comprimido").lower()
+PRECISION_CAUDAL = float(os.getenv("PRECISION_CAUDAL", "0.01"))  # Resolución absoluta del caudal (m3/s)
+# Error relativo máximo de las variables con precisión relativa (desviaciones estándar)
+PRECISION_RELATIVA = float(os.getenv("PRECISION_RELATIVA", "0.001"))
+# Píxeles por lado de cada fragmento; un fragmento tiene todos los plazos de un bloque de píxeles,
+# así la serie de un punto se lee descomprimiendo un solo fragmento pequeño
+FRAGMENTO_PIXELES = int(os.getenv("FRAGMENTO_PIXELES", "8"))
+FORMATOS = ("float", "comprimido", "cuantizado")
+
+
+def fragmentos(variable, pixeles=FRAGMENTO_PIXELES):
+    """Tamaño de fragmento por dimensión: bloques de pixeles x pixeles, una corrida, todos los plazos"""
+    return tuple(
+        min(pixeles, n) if dim in ("latitude", "longitude") else (1 if dim == "forecast_reference_time" else n)
+        for dim, n in zip(variable.dims, variable.shape)
+    )
+
+
+def empaquetado(variable, precision=PRECISION_CAUDAL):
+    """
+    scale_factor y el tipo entero más chico que cubre la variable con la precisión absoluta
+    indicada (uint16 si no hay negativos, int16 o int32). Sin add_offset, el 0 se conserva exacto;
+    el error de cuantización es precision / 2.
+    """
+    minimo = float(variable.min(skipna=True))
+    maximo = float(variable.max(skipna=True))
+    if not np.isfinite(minimo):
+        minimo = maximo = 0.0
+    if minimo >= 0 and maximo / precision <= 65534:
+        tipo, relleno = "uint16", np.uint16(65535)
+    elif max(-minimo, maximo) / precision <= 32766:
+        tipo, relleno = "int16", np.int16(-32768)
+    else:
+        tipo, relleno = "int32", np.int32(-2147483648)
+    return {"dtype": tipo, "scale_factor": np.float32(precision), "_FillValue": relleno}
+
+
+def bits_mantisa(precision_relativa=PRECISION_RELATIVA):
+    """Bits de mantisa que hay que conservar para que el error relativo no supere precision_relativa"""
+    return int(min(23, max(0, np.ceil(-np.log2(precision_relativa)) - 1)))
+
+
+def redondear_mantisa(valores, precision_relativa=PRECISION_RELATIVA):
+    """
+    Redondea los float32 a los bits de mantisa necesarios y anula el resto, que zlib comprime casi
+    por completo. El error relativo es a lo sumo 2^-(bits + 1) <= precision_relativa; el 0 y los
+    NaN se conservan y el archivo sigue siendo float32 (no hay que decodificar nada al leer).
+    """
+    descartados = 23 - bits_mantisa(precision_relativa)
+    if descartados <= 0:
+        return valores
+    valores = np.ascontiguousarray(valores, dtype=np.float32)
+    enteros = valores.view(np.uint32)
+    mitad = np.uint32(1 << (descartados - 1))
+    mascara = np.uint32((0xFFFFFFFF >> descartados) << descartados)
+    redondeados = ((enteros + mitad) & mascara).view(np.float32)
+    return np.where(np.isfinite(valores), redondeados, valores)
+
+
+def cuantizar(dataset, relativas=(), precision_relativa=PRECISION_RELATIVA):
+    """Copia del dataset con las variables de precisión relativa redondeadas (ver redondear_mantisa)"""
+    dataset = dataset.copy()
+    for nombre in relativas:
+        dataset[nombre] = dataset[nombre].copy(data=redondear_mantisa(dataset[nombre].values, precision_relativa))
+    return dataset
+
+
+def opciones_netcdf(dataset, absolutas, relativas=(), formato=FORMATO_NETCDF, precision=PRECISION_CAUDAL):
+    """
+    encoding de to_netcdf según el formato configurado. En "cuantizado" las variables absolutas
+    se empaquetan en enteros con scale_factor y las relativas quedan en float32 (ya redondeadas).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato NetCDF desconocido: {formato}, opciones: {FORMATOS}")
+    if formato == "float":
+        return {}
+
+    encoding = {}
+    for nombre in list(absolutas) + list(relativas):
+        opciones = {"zlib": True, "complevel": 4, "shuffle": True, "chunksizes": fragmentos(dataset[nombre])}
+        if formato == "cuantizado" and nombre in absolutas:
+            opciones.update(empaquetado(dataset[nombre], precision))
+        else:
+            opciones["dtype"] = "float32"
+        encoding[nombre] = opciones
+    return encoding
+
+
+def tolerancia(valores, relativa, formato=FORMATO_NETCDF, precision=PRECISION_CAUDAL,
+               precision_relativa=PRECISION_RELATIVA):
+    """
+    Error admisible por celda: nulo sin cuantizar; precision_relativa * |valor| en las variables
+    relativas; precision / 2 más el redondeo de float32 al decodificar en las absolutas.
+    """
+    if formato != "cuantizado":
+        return np.zeros_like(valores, dtype=np.float64)
+    magnitud = np.abs(valores.astype(np.float64))
+    if relativa:
+        return precision_relativa * magnitud
+    return precision / 2 + 4 * np.spacing(magnitud.astype(np.float32)).astype(np.float64)
+
+
+def celdas_fuera_de_tolerancia(dataset, ruta, absolutas, relativas=(), formato=FORMATO_NETCDF,
+                               precision=PRECISION_CAUDAL, precision_relativa=PRECISION_RELATIVA):
+    """
+    Relee el archivo y cuenta las celdas cuyo error supera la tolerancia respecto de dataset
+    (las celdas sin datos que no coinciden cuentan como fuera de tolerancia).
+    """
+    fuera = 0
+    with xr.open_dataset(ruta) as leido:
+        for nombre in list(absolutas) + list(relativas):
+            original = dataset[nombre].values
+            copia = leido[nombre].transpose(*dataset[nombre].dims).values
+            validos = ~np.isnan(original)
+            fuera += int(np.count_nonzero(validos != ~np.isnan(copia)))
+            valores = original[validos]
+            error = np.abs(copia[validos].astype(np.float64) - valores)
+            limite = tolerancia(valores, nombre in relativas, formato, precision, precision_relativa)
+            fuera += int(np.count_nonzero(error > limite))
+    return fuera
+
+
+def guardar(dataset, ruta, absolutas, relativas=(), formato=FORMATO_NETCDF, precision=PRECISION_CAUDAL,
+            precision_relativa=PRECISION_RELATIVA):
+    """
+    Guarda el dataset con el formato indicado y verifica la ida y vuelta celda por celda. Si alguna
+    supera la tolerancia (por ejemplo, por una precisión mal declarada) se vuelve a guardar
+    comprimido sin pérdida. Devuelve el formato con que quedó el archivo.
+    """
+    datos = cuantizar(dataset, relativas, precision_relativa) if formato == "cuantizado" else dataset
+    datos.to_netcdf(ruta, encoding=opciones_netcdf(datos, absolutas, relativas, formato, precision))
+    if formato == "float":
+        return formato
+    fuera = celdas_fuera_de_tolerancia(dataset, ruta, absolutas, relativas, formato, precision, precision_relativa)
+    if fuera:
+        print(f"{fuera} celdas fuera de tolerancia en {ruta} con formato {formato}: se guarda comprimido sin pérdida")
+        formato = "comprimido"
+        dataset.to_netcdf(ruta, encoding=opciones_netcdf(dataset, absolutas, relativas, formato))
+    return formato
+
+
+if __name__ == "__main__":
+    # Uso: python netcdf_compacto.py archivo.nc [...]: codificación y tamaño de cada variable
+    for ruta in sys.argv[1:]:
+        with xr.open_dataset(ruta) as ds:
+            print(f"{ruta} ({os.path.getsize(ruta) / 1024:.1f} KB)")
+            for nombre, variable in ds.data_vars.items():
+                codificacion = {k: v for k, v in variable.encoding.items() if k in ("dtype", "zlib", "shuffle", "chunksizes", "scale_factor", "add_offset")}
+                print(f"  {nombre}: {codificacion}")
@@ -0,0 +1,179 @@
+import os
+import time
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+# Códigos que justifican reintentar: límite de tasa y errores transitorios del servidor
+CODIGOS_REINTENTO = {429, 500, 502, 503, 504}
+
+
+def sha_blob(contenido):
+    """SHA que git asigna a un blob, para comparar con el árbol remoto sin subir el archivo"""
+    return hashlib.sha1(b"blob %d\0" % len(contenido) + contenido).hexdigest()
+
+
+class ErrorPublicacion(Exception):
+    def __init__(self, mensaje, codigo=None):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+class PublicadorGitHub:
+    """
+    Reúne los archivos generados en una corrida y los publica en un solo commit mediante la API
+    de git (blobs, tree, commit y actualización de la rama), en lugar de un GET y un PUT por archivo.
+    Los blobs se crean en paralelo, las solicitudes se reintentan con espera exponencial y los
+    archivos cuyo contenido no cambió se omiten.
+    """
+
+    def __init__(self, repo, branch, token, api_url=GITHUB_API_URL, hilos=8, reintentos=5, espera=1.0):
+        self.repo = repo
+        self.branch = branch
+        self.api_url = api_url.rstrip("/")
+        self.hilos = hilos
+        self.reintentos = reintentos
+        self.espera = espera
+        self.archivos = {}
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+        })
+
+    def agregar(self, carpeta, ruta_local):
+        """Agrega un archivo local a la publicación, en carpeta/<nombre> dentro del repositorio"""
+        ruta_repo = f"{carpeta.strip('/')}/{os.path.basename(ruta_local)}"
+        self.archivos[ruta_repo] = ruta_local
+        return ruta_repo
+
+    def _solicitud(self, metodo, ruta, crudo=False, **kwargs):
+        url = f"{self.api_url}/repos/{self.repo}/{ruta}"
+        for intento in range(self.reintentos + 1):
+            try:
+                response = self.session.request(metodo, url, timeout=60, **kwargs)
+            except requests.RequestException as e:
+                if intento == self.reintentos:
+                    raise ErrorPublicacion(f"{metodo} {ruta}: {e}")
+                motivo = str(e)
+            else:
+                limite_agotado = response.status_code == 403 and response.headers.get("X-RateLimit-Remaining") == "0"
+                if response.status_code not in CODIGOS_REINTENTO and not limite_agotado:
+                    if response.status_code >= 400:
+                        raise ErrorPublicacion(f"{metodo} {ruta}: {response.status_code} {response.text[:200]}", response.status_code)
+                    return response if crudo else response.json()
+                if intento == self.reintentos:
+                    raise ErrorPublicacion(f"{metodo} {ruta}: {response.status_code} tras {self.reintentos} reintentos", response.status_code)
+                motivo = f"HTTP {response.status_code}"
+            espera = self.espera * 2 ** intento
+            print(f"Reintentando {metodo} {ruta} en {espera:.1f} s ({motivo})")
+            time.sleep(espera)
+
+    def descargar(self, ruta_repo, destino):
+        """
+        Descarga un archivo de la rama a destino (se escribe completo antes de reemplazarlo).
+        Devuelve False si el archivo o la rama no existen; los demás errores se propagan.
+        """
+        try:
+            response = self._solicitud(
+                "GET", f"contents/{ruta_repo}", crudo=True, stream=True,
+                params={"ref": self.branch}, headers={"Accept": "application/vnd.github.raw"},
+            )
+        except ErrorPublicacion as e:
+            if e.codigo == 404:
+                return False
+            raise
+        os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+        with response, open(f"{destino}.tmp", "wb") as archivo:
+            for bloque in response.iter_content(chunk_size=1 << 20):
+                archivo.write(bloque)
+        os.replace(f"{destino}.tmp", destino)
+        return True
+
+    def _crear_blob(self, contenido):
+        datos = {"content": base64.b64encode(contenido).decode("utf-8"), "encoding": "base64"}
+        return self._solicitud("POST", "git/blobs", json=datos)["sha"]
+
+    def _cabeza(self):
+        """SHA de la cabeza de la rama, o None si la rama todavía no existe"""
+        try:
+            return self._solicitud("GET", f"git/ref/heads/{self.branch}")["object"]["sha"]
+        except ErrorPublicacion as e:
+            if e.codigo == 404:
+                return None
+            raise
+
+    def publicar(self, mensaje, reemplazar=False):
+        """
+        Publica todos los archivos agregados en un solo commit. Devuelve el SHA del commit,
+        o None si no había cambios. Si la rama avanzó mientras tanto, se reintenta sobre la nueva cabeza.
+
+        Con reemplazar=True la rama queda con un único commit sin padres que contiene solo estos
+        archivos (se crea si no existe y se actualiza con force): sirve para archivos que se
+        reescriben completos en cada corrida, cuyas versiones anteriores no deben acumularse en
+        la historia de git.
+        """
+        if not self.archivos:
+            print("No hay archivos para publicar")
+            return None
+
+        contenidos = {}
+        for ruta_repo, ruta_local in self.archivos.items():
+            with open(ruta_local, "rb") as archivo:
+                contenidos[ruta_repo] = archivo.read()
+
+        # Los blobs ya creados siguen siendo válidos si hay que rehacer el commit
+        creados = {}
+        for intento in range(self.reintentos + 1):
+            cabeza = self._cabeza() if reemplazar else self._solicitud("GET", f"git/ref/heads/{self.branch}")["object"]["sha"]
+            remotos = {}
+            if cabeza is not None:
+                arbol_base = self._solicitud("GET", f"git/commits/{cabeza}")["tree"]["sha"]
+                arbol = self._solicitud("GET", f"git/trees/{arbol_base}", params={"recursive": "1"})
+                remotos = {entrada["path"]: entrada["sha"] for entrada in arbol.get("tree", []) if entrada.get("type") == "blob"}
+
+            cambiados = {ruta: c for ruta, c in contenidos.items() if remotos.get(ruta) != sha_blob(c)}
+            omitidos = len(contenidos) - len(cambiados)
+            # Al reemplazar, quitar archivos que ya no se publican también es un cambio
+            sobrantes = reemplazar and set(remotos) != set(contenidos)
+            if not cambiados and not sobrantes:
+                print(f"Sin cambios: {omitidos} archivos idénticos a los publicados")
+                self.archivos.clear()
+                return None
+
+            pendientes = [ruta for ruta in cambiados if ruta not in creados]
+            with ThreadPoolExecutor(max_workers=self.hilos) as ejecutor:
+                creados.update(zip(pendientes, ejecutor.map(self._crear_blob, [cambiados[r] for r in pendientes])))
+
+            if reemplazar:
+                # Árbol completo sin base: los blobs sin cambios ya existen en el repositorio
+                shas = {ruta: creados.get(ruta) or remotos[ruta] for ruta in contenidos}
+                entradas = [{"path": ruta, "mode": "100644", "type": "blob", "sha": sha} for ruta, sha in shas.items()]
+                nuevo_arbol = self._solicitud("POST", "git/trees", json={"tree": entradas})["sha"]
+            else:
+                entradas = [{"path": ruta, "mode": "100644", "type": "blob", "sha": creados[ruta]} for ruta in cambiados]
+                nuevo_arbol = self._solicitud("POST", "git/trees", json={"base_tree": arbol_base, "tree": entradas})["sha"]
+            commit = self._solicitud("POST", "git/commits", json={
+                "message": mensaje,
+                "tree": nuevo_arbol,
+                "parents": [] if reemplazar else [cabeza],
+            })["sha"]
+
+            try:
+                if cabeza is None:
+                    self._solicitud("POST", "git/refs", json={"ref": f"refs/heads/{self.branch}", "sha": commit})
+                else:
+                    self._solicitud("PATCH", f"git/refs/heads/{self.branch}", json={"sha": commit, "force": reemplazar})
+            except ErrorPublicacion as e:
+                # 422: la rama avanzó (no es fast-forward); se rehace el commit sobre la nueva cabeza
+                if e.codigo != 422 or intento == self.reintentos:
+                    raise
+                print("La rama cambió durante la publicación, reintentando")
+                continue
+
+            print(f"Commit {commit[:7]} publicado: {len(cambiados)} archivos ({omitidos} sin cambios)")
+            self.archivos.clear()
+            return commit
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import rasterio
+
+# Formato de los GeoTIFF publicados: "gtiff" (tiras sin comprimir, como hasta ahora) o "cog"
+FORMATO_RASTER = os.getenv("FORMATO_RASTER", "gtiff").lower()
+# Compresión de los COG: "deflate" (sin pérdida, predictor de coma flotante) o "lerc" (con error acotado)
+COMPRESION_RASTER = os.getenv("COMPRESION_RASTER", "deflate").lower()
+MAX_Z_ERROR = float(os.getenv("MAX_Z_ERROR", "0.001"))  # Error máximo de LERC en unidades del dato
+TAMANO_BLOQUE = 256
+
+
+def opciones_raster(formato=FORMATO_RASTER, compresion=COMPRESION_RASTER):
+    """Opciones de creación de rasterio para el formato de salida configurado (datos float32)"""
+    if formato != "cog":
+        return {"driver": "GTiff"}
+
+    opciones = {
+        "driver": "COG",
+        "blocksize": TAMANO_BLOQUE,
+        "overviews": "AUTO",
+        "overview_resampling": "average",
+    }
+    if compresion == "lerc":
+        opciones.update(compress="LERC_DEFLATE", max_z_error=MAX_Z_ERROR)
+    else:
+        opciones.update(compress="DEFLATE", predictor=3)
+    return opciones
+
+
+def verificar_cog(ruta):
+    """
+    Verifica que un GeoTIFF sea Cloud-Optimized: organización COG (cabecera e IFD al inicio),
+    teselas internas, compresión y overviews cuando el raster supera un bloque.
+    Devuelve la lista de problemas encontrados (vacía si el archivo es un COG válido).
+    """
+    problemas = []
+    with rasterio.open(ruta) as src:
+        estructura = src.tags(ns="IMAGE_STRUCTURE")
+        if src.driver != "GTiff":
+            problemas.append(f"driver {src.driver}, se esperaba GTiff")
+        if estructura.get("LAYOUT") != "COG":
+            problemas.append("sin organización COG (LAYOUT=COG)")
+        if not src.profile.get("tiled"):
+            problemas.append("no tiene teselas internas")
+        if not src.compression:
+            problemas.append("sin compresión")
+        bloque = max(src.block_shapes[0])
+        if max(src.width, src.height) > bloque and not src.overviews(1):
+            problemas.append("sin overviews")
+    return problemas
+
+
+def verificar_archivos(rutas):
+    """Verifica una lista de archivos e imprime el resultado; devuelve True si todos son COG válidos"""
+    validos = True
+    for ruta in rutas:
+        problemas = verificar_cog(ruta)
+        tamano = os.path.getsize(ruta) / 1024
+        if problemas:
+            validos = False
+            print(f"COG inválido {ruta} ({tamano:.1f} KB): {', '.join(problemas)}")
+        else:
+            print(f"COG verificado {ruta} ({tamano:.1f} KB)")
+    return validos
+
+
+if __name__ == "__main__":
+    # Uso: python raster_cog.py archivo.tif [...]
+    sys.exit(0 if verificar_archivos(sys.argv[1:]) else 1)
@@ -0,0 +1,46 @@
+import os
+import json
+
+import numpy as np
+
+# Registro de regiones: nombre -> límites (bbox), geometría (GeoJSON en el repositorio) y prefijo
+# de las rutas de salida. La región con prefijo vacío conserva las rutas originales del repositorio.
+ARCHIVO_REGIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regiones.json")
+
+
+def cargar_regiones(ruta=ARCHIVO_REGIONES):
+    """Devuelve las regiones del registro; con REGIONES=Nombre1,Nombre2 se procesan solo esas"""
+    with open(ruta) as archivo:
+        regiones = json.load(archivo)
+    activas = os.getenv("REGIONES")
+    if activas:
+        nombres = [nombre.strip() for nombre in activas.split(",")]
+        regiones = {nombre: regiones[nombre] for nombre in nombres if nombre in regiones}
+    return regiones
+
+
+def union_bbox(regiones):
+    """Extensión que cubre todas las regiones, para descargar los datos una sola vez"""
+    return {
+        "north": max(r["bbox"]["north"] for r in regiones.values()),
+        "south": min(r["bbox"]["south"] for r in regiones.values()),
+        "west": min(r["bbox"]["west"] for r in regiones.values()),
+        "east": max(r["bbox"]["east"] for r in regiones.values()),
+    }
+
+
+def ruta_region(region, ruta):
+    """Ruta de un producto de la región dentro del repositorio (o del directorio de trabajo)"""
+    return f"{region['prefijo'].strip('/')}/{ruta}" if region["prefijo"] else ruta
+
+
+def recortar_bbox(dataset, bbox):
+    """
+    Recorta un dataset de GloFAS (longitudes en 0-360 o en -180-180) a las celdas cuyo centro cae
+    dentro de bbox, el mismo criterio con que CDS recorta el área pedida.
+    """
+    latitudes = dataset["latitude"].values
+    longitudes = (dataset["longitude"].values + 180) % 360 - 180
+    filas = np.flatnonzero((latitudes <= bbox["north"]) & (latitudes >= bbox["south"]))
+    columnas = np.flatnonzero((longitudes >= bbox["west"]) & (longitudes <= bbox["east"]))
+    return dataset.isel(latitude=filas, longitude=columnas)
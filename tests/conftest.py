@@ -0,0 +1,7 @@
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Los procesos diarios son módulos sueltos en la raíz y los servidores locales están en benchmarks/
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
@@ -0,0 +1,124 @@
+"""
+Pruebas de la ingesta por rangos de bytes (ingesta_grib.py) contra un servidor de archivos local
+con la estructura de rutas de ECMWF open data (benchmarks/entorno_local.py).
+"""
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fixtures
+from entorno_local import ServidorECMWF
+from ingesta_grib import agrupar_rangos, descargar_pasos, descargar_rango, leer_indice, nueva_sesion, seleccionar, url_paso
+
+PASO = 12
+
+
+@pytest.fixture(scope="module")
+def raiz_ecmwf(tmp_path_factory):
+    """GRIB sintético de un paso con su índice .index, con la estructura de rutas de ECMWF"""
+    pytest.importorskip("eccodes")
+    directorio = tmp_path_factory.mktemp("ecmwf")
+    fixtures.generar_ecmwf(str(directorio), [PASO])
+    return os.path.join(str(directorio), "ecmwf")
+
+
+@pytest.fixture(scope="module")
+def ecmwf(raiz_ecmwf):
+    """Servidor local de los GRIB con solicitudes de rango"""
+    with ServidorECMWF(raiz_ecmwf) as servidor:
+        yield servidor
+
+
+def test_seleccionar_en_indice_real(ecmwf):
+    url = url_paso(fixtures.FECHA, 0, PASO, ecmwf.url)
+    entradas = leer_indice(nueva_sesion(), url)
+
+    assert [e["param"] for e in entradas] == [nombre for nombre, _, _ in fixtures.PARAMETROS_ECMWF]
+    elegidas = seleccionar(entradas, ["2t", "tp"])
+    # En el orden del archivo, no en el pedido
+    assert [e["param"] for e in elegidas] == ["tp", "2t"]
+    assert [e["_offset"] for e in elegidas] == sorted(e["_offset"] for e in elegidas)
+
+    with pytest.raises(ValueError, match="cape"):
+        seleccionar(entradas, ["tp", "cape"])
+    with pytest.raises(ValueError):
+        seleccionar(entradas, ["tp"], levtype="pl")
+
+
+def test_agrupar_rangos_une_contiguos():
+    entradas = [
+        {"param": "a", "_offset": 0, "_length": 10},
+        {"param": "b", "_offset": 10, "_length": 5},
+        {"param": "c", "_offset": 20, "_length": 5},
+        {"param": "d", "_offset": 25, "_length": 5},
+    ]
+    rangos = agrupar_rangos(entradas)
+    assert [(inicio, fin) for inicio, fin, _ in rangos] == [(0, 14), (20, 29)]
+    assert [[e["param"] for e in mensajes] for _, _, mensajes in rangos] == [["a", "b"], ["c", "d"]]
+
+    # Con un hueco tolerado de 5 bytes los cuatro mensajes van en una sola solicitud
+    rangos = agrupar_rangos(entradas, hueco_maximo=5)
+    assert [(inicio, fin) for inicio, fin, _ in rangos] == [(0, 29)]
+    assert agrupar_rangos([]) == []
+
+
+def test_descargar_rango_separa_mensajes(ecmwf):
+    url = url_paso(fixtures.FECHA, 0, PASO, ecmwf.url)
+    sesion = nueva_sesion()
+    entradas = seleccionar(leer_indice(sesion, url), ["tp", "2t", "10u"])
+    rangos = agrupar_rangos(entradas)
+
+    contenido = sesion.get(url, timeout=60).content
+    for rango in rangos:
+        for offset, datos in descargar_rango(sesion, url, rango):
+            entrada = next(e for e in entradas if e["_offset"] == offset)
+            assert datos == contenido[offset:offset + entrada["_length"]]
+            assert datos[:4] == b"GRIB" and datos[-4:] == b"7777"
+
+
+def test_descargar_rango_rechaza_respuesta_corta(ecmwf):
+    url = url_paso(fixtures.FECHA, 0, PASO, ecmwf.url)
+    sesion = nueva_sesion()
+    ultima = leer_indice(sesion, url)[-1]
+    # Un rango que pasa del final del archivo: el servidor responde 206 con menos bytes
+    inicio = ultima["_offset"]
+    fin = inicio + ultima["_length"] + 99
+    with pytest.raises(RuntimeError, match="incompleto"):
+        descargar_rango(sesion, url, (inicio, fin, [ultima]))
+
+
+class _SinRangos(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def test_descargar_rango_rechaza_respuesta_sin_rango(raiz_ecmwf):
+    # Un servidor que ignora Range responde 200 con el archivo completo
+    manejador = lambda *args, **kwargs: _SinRangos(*args, directory=raiz_ecmwf, **kwargs)  # noqa: E731
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), manejador)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        url = url_paso(fixtures.FECHA, 0, PASO, f"http://127.0.0.1:{servidor.server_address[1]}")
+        sesion = nueva_sesion()
+        entrada = leer_indice(sesion, url)[0]
+        with pytest.raises(RuntimeError, match="HTTP 200"):
+            descargar_rango(sesion, url, (entrada["_offset"], entrada["_offset"] + entrada["_length"] - 1, [entrada]))
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_descargar_pasos_arma_el_grib_con_los_parametros_pedidos(ecmwf, tmp_path):
+    url = url_paso(fixtures.FECHA, 0, PASO, ecmwf.url)
+    sesion = nueva_sesion()
+    entradas = seleccionar(leer_indice(sesion, url), ["tp", "2t"])
+    contenido = sesion.get(url, timeout=60).content
+
+    pasos = list(descargar_pasos(fixtures.FECHA, 0, [PASO], ["tp", "2t"], str(tmp_path), url_base=ecmwf.url))
+
+    assert [paso for paso, _ in pasos] == [PASO]
+    with open(pasos[0][1], "rb") as archivo:
+        assert archivo.read() == b"".join(contenido[e["_offset"]:e["_offset"] + e["_length"]] for e in entradas)
@@ -0,0 +1,327 @@
+"""
+Pruebas de PublicadorGitHub contra un servidor HTTP local que imita la API de datos de git de
+GitHub (refs, commits, trees y blobs) con un repositorio en memoria.
+"""
+import json
+import base64
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from publicador_github import ErrorPublicacion, PublicadorGitHub, sha_blob
+
+REPO = "dueno/datos"
+RAMA = "main"
+
+
+class RepositorioFalso:
+    """Estado de un repositorio en memoria y registro de las solicitudes recibidas"""
+
+    def __init__(self, archivos=None):
+        self.lock = threading.Lock()
+        self.blobs = {}
+        self.arboles = {}
+        self.commits = {}
+        self.solicitudes = []
+        # Respuestas forzadas: (método, prefijo de la ruta) -> lista de códigos a devolver en orden
+        self.fallas = {}
+        # Función que se ejecuta una vez antes de la próxima actualización de la rama
+        self.antes_de_actualizar = None
+        arbol = self.guardar_arbol({ruta: self.guardar_blob(c) for ruta, c in (archivos or {}).items()})
+        # Rama -> SHA de su cabeza
+        self.ramas = {RAMA: self.guardar_commit("inicial", arbol, [])}
+
+    @property
+    def cabeza(self):
+        return self.ramas[RAMA]
+
+    @cabeza.setter
+    def cabeza(self, sha):
+        self.ramas[RAMA] = sha
+
+    def guardar_blob(self, contenido):
+        sha = sha_blob(contenido)
+        self.blobs[sha] = contenido
+        return sha
+
+    def guardar_arbol(self, entradas):
+        sha = hashlib.sha1(json.dumps(sorted(entradas.items())).encode("utf-8")).hexdigest()
+        self.arboles[sha] = dict(entradas)
+        return sha
+
+    def guardar_commit(self, mensaje, arbol, padres):
+        sha = hashlib.sha1(f"{mensaje}{arbol}{padres}{len(self.commits)}".encode("utf-8")).hexdigest()
+        self.commits[sha] = {"mensaje": mensaje, "arbol": arbol, "padres": padres}
+        return sha
+
+    def commit_externo(self, archivos):
+        """Simula otro proceso que publica en la rama"""
+        entradas = dict(self.arboles[self.commits[self.cabeza]["arbol"]])
+        entradas.update({ruta: self.guardar_blob(c) for ruta, c in archivos.items()})
+        self.cabeza = self.guardar_commit("externo", self.guardar_arbol(entradas), [self.cabeza])
+
+    def contenido(self, ruta, commit=None):
+        arbol = self.arboles[self.commits[commit or self.cabeza]["arbol"]]
+        return self.blobs[arbol[ruta]] if ruta in arbol else None
+
+    def archivos(self, rama):
+        return sorted(self.arboles[self.commits[self.ramas[rama]]["arbol"]])
+
+    def contar(self, metodo, ruta):
+        return sum(1 for m, r in self.solicitudes if m == metodo and r.startswith(ruta))
+
+    def atender(self, metodo, ruta, consulta, cuerpo):
+        """Devuelve (código, respuesta JSON o bytes) de una solicitud a /repos/<repo>/<ruta>"""
+        with self.lock:
+            self.solicitudes.append((metodo, ruta))
+            for (m, prefijo), codigos in self.fallas.items():
+                if m == metodo and ruta.startswith(prefijo) and codigos:
+                    return codigos.pop(0), {"message": "falla forzada"}
+
+            if metodo == "GET" and ruta.startswith("git/ref/heads/"):
+                cabeza = self.ramas.get(ruta[len("git/ref/heads/"):])
+                return (200, {"object": {"sha": cabeza}}) if cabeza else (404, {"message": "Not Found"})
+            if metodo == "GET" and ruta.startswith("contents/"):
+                rama = parse_qs(consulta).get("ref", [RAMA])[0]
+                if rama not in self.ramas:
+                    return 404, {"message": "No commit found for the ref"}
+                contenido = self.contenido(ruta[len("contents/"):], self.ramas[rama])
+                return (200, contenido) if contenido is not None else (404, {"message": "Not Found"})
+            if metodo == "GET" and ruta.startswith("git/commits/"):
+                commit = self.commits.get(ruta.rsplit("/", 1)[1])
+                return (200, {"tree": {"sha": commit["arbol"]}}) if commit else (404, {"message": "Not Found"})
+            if metodo == "GET" and ruta.startswith("git/trees/"):
+                arbol = self.arboles.get(ruta.rsplit("/", 1)[1])
+                if arbol is None:
+                    return 404, {"message": "Not Found"}
+                return 200, {"tree": [{"path": p, "sha": s, "type": "blob"} for p, s in sorted(arbol.items())]}
+            if metodo == "POST" and ruta == "git/blobs":
+                return 201, {"sha": self.guardar_blob(base64.b64decode(cuerpo["content"]))}
+            if metodo == "POST" and ruta == "git/trees":
+                entradas = dict(self.arboles[cuerpo["base_tree"]]) if "base_tree" in cuerpo else {}
+                entradas.update({e["path"]: e["sha"] for e in cuerpo["tree"]})
+                return 201, {"sha": self.guardar_arbol(entradas)}
+            if metodo == "POST" and ruta == "git/commits":
+                return 201, {"sha": self.guardar_commit(cuerpo["message"], cuerpo["tree"], cuerpo["parents"])}
+            if metodo == "POST" and ruta == "git/refs":
+                rama = cuerpo["ref"][len("refs/heads/"):]
+                if rama in self.ramas:
+                    return 422, {"message": "Reference already exists"}
+                self.ramas[rama] = cuerpo["sha"]
+                return 201, {"object": {"sha": cuerpo["sha"]}}
+            if metodo == "PATCH" and ruta.startswith("git/refs/heads/"):
+                rama = ruta[len("git/refs/heads/"):]
+                if rama not in self.ramas:
+                    return 422, {"message": "Reference does not exist"}
+                if self.antes_de_actualizar:
+                    accion, self.antes_de_actualizar = self.antes_de_actualizar, None
+                    accion()
+                # Como GitHub: sin force solo se acepta un avance directo de la cabeza
+                if not cuerpo.get("force") and self.commits[cuerpo["sha"]]["padres"] != [self.ramas[rama]]:
+                    return 422, {"message": "Update is not a fast forward"}
+                self.ramas[rama] = cuerpo["sha"]
+                return 200, {"object": {"sha": cuerpo["sha"]}}
+            return 404, {"message": "Not Found"}
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _responder(self):
+        ruta, _, consulta = self.path.partition("?")
+        prefijo = f"/repos/{REPO}/"
+        largo = int(self.headers.get("Content-Length") or 0)
+        cuerpo = json.loads(self.rfile.read(largo)) if largo else None
+        if ruta.startswith(prefijo):
+            codigo, respuesta = self.server.repositorio.atender(self.command, ruta[len(prefijo):], consulta, cuerpo)
+        else:
+            codigo, respuesta = 404, {"message": "Not Found"}
+        crudo = isinstance(respuesta, bytes)
+        datos = respuesta if crudo else json.dumps(respuesta).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/octet-stream" if crudo else "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    do_GET = do_POST = do_PATCH = _responder
+
+
+@pytest.fixture
+def servidor():
+    """Servidor local con un repositorio que ya tiene publicado download/20261017.nc"""
+    http = ThreadingHTTPServer(("127.0.0.1", 0), _Manejador)
+    http.daemon_threads = True
+    http.repositorio = RepositorioFalso({"download/20261017.nc": b"corrida anterior"})
+    hilo = threading.Thread(target=http.serve_forever, daemon=True)
+    hilo.start()
+    yield http
+    http.shutdown()
+    http.server_close()
+
+
+def nuevo_publicador(servidor, rama=RAMA, **kwargs):
+    url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    return PublicadorGitHub(REPO, rama, "token", api_url=url, hilos=4, espera=0, **kwargs)
+
+
+def escribir(directorio, nombre, contenido):
+    ruta = directorio / nombre
+    ruta.write_bytes(contenido)
+    return str(ruta)
+
+
+def test_un_commit_por_corrida(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    anterior = repositorio.cabeza
+    publicador = nuevo_publicador(servidor)
+    publicador.agregar("download", escribir(tmp_path, "20261018.nc", b"corrida nueva"))
+    publicador.agregar("frontend/public/coquimbo_meteo", escribir(tmp_path, "P12.tif", b"precipitacion"))
+    publicador.agregar("frontend/public/coquimbo_meteo", escribir(tmp_path, "T12.tif", b"temperatura"))
+
+    commit = publicador.publicar("Corrida 20261018")
+
+    assert commit == repositorio.cabeza
+    assert repositorio.commits[commit]["padres"] == [anterior]
+    assert repositorio.contar("POST", "git/commits") == 1
+    assert repositorio.contar("PATCH", "git/refs") == 1
+    assert repositorio.contar("POST", "git/blobs") == 3
+    assert repositorio.contenido("download/20261018.nc") == b"corrida nueva"
+    assert repositorio.contenido("frontend/public/coquimbo_meteo/T12.tif") == b"temperatura"
+    # Los archivos que no se publicaron se conservan del árbol base
+    assert repositorio.contenido("download/20261017.nc") == b"corrida anterior"
+    assert publicador.archivos == {}
+
+
+def test_omite_blobs_sin_cambios(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    publicador = nuevo_publicador(servidor)
+    publicador.agregar("download", escribir(tmp_path, "20261017.nc", b"corrida anterior"))
+    publicador.agregar("download", escribir(tmp_path, "20261018.nc", b"corrida nueva"))
+
+    publicador.publicar("Corrida 20261018")
+
+    # Solo se sube el archivo cuyo contenido cambió
+    assert repositorio.contar("POST", "git/blobs") == 1
+    assert repositorio.contar("POST", "git/commits") == 1
+
+    # Sin ningún cambio no se crea commit ni se mueve la rama
+    cabeza = repositorio.cabeza
+    publicador.agregar("download", str(tmp_path / "20261017.nc"))
+    publicador.agregar("download", str(tmp_path / "20261018.nc"))
+    assert publicador.publicar("Corrida 20261018") is None
+    assert repositorio.cabeza == cabeza
+    assert repositorio.contar("POST", "git/blobs") == 1
+    assert repositorio.contar("POST", "git/commits") == 1
+
+
+def test_reintenta_errores_5xx(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    repositorio.fallas = {
+        ("GET", "git/ref/heads"): [503],
+        ("POST", "git/blobs"): [502, 500],
+        ("PATCH", "git/refs"): [504],
+    }
+    publicador = nuevo_publicador(servidor)
+    publicador.agregar("download", escribir(tmp_path, "20261018.nc", b"corrida nueva"))
+
+    commit = publicador.publicar("Corrida 20261018")
+
+    assert commit == repositorio.cabeza
+    assert repositorio.contenido("download/20261018.nc") == b"corrida nueva"
+    assert repositorio.contar("GET", "git/ref/heads") == 2
+    assert repositorio.contar("POST", "git/blobs") == 3
+    assert repositorio.contar("PATCH", "git/refs") == 2
+
+
+def test_agota_reintentos_y_no_reintenta_4xx(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    publicador = nuevo_publicador(servidor, reintentos=2)
+    publicador.agregar("download", escribir(tmp_path, "20261018.nc", b"corrida nueva"))
+
+    repositorio.fallas = {("GET", "git/ref/heads"): [503] * 3}
+    with pytest.raises(ErrorPublicacion) as error:
+        publicador.publicar("Corrida 20261018")
+    assert error.value.codigo == 503
+    assert repositorio.contar("GET", "git/ref/heads") == 3
+
+    repositorio.fallas = {("POST", "git/blobs"): [401]}
+    with pytest.raises(ErrorPublicacion) as error:
+        publicador.publicar("Corrida 20261018")
+    assert error.value.codigo == 401
+    assert repositorio.contar("POST", "git/blobs") == 1
+
+
+def test_rehace_el_commit_si_la_rama_avanzo(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    repositorio.antes_de_actualizar = lambda: repositorio.commit_externo({"FloodThreshold/umbral.nc": b"umbral"})
+    publicador = nuevo_publicador(servidor)
+    publicador.agregar("download", escribir(tmp_path, "20261018.nc", b"corrida nueva"))
+
+    commit = publicador.publicar("Corrida 20261018")
+
+    assert commit == repositorio.cabeza
+    externo = repositorio.commits[commit]["padres"][0]
+    assert repositorio.commits[externo]["mensaje"] == "externo"
+    # El commit rehecho conserva lo publicado por el otro proceso y no vuelve a subir el blob
+    assert repositorio.contenido("FloodThreshold/umbral.nc") == b"umbral"
+    assert repositorio.contenido("download/20261018.nc") == b"corrida nueva"
+    assert repositorio.contar("PATCH", "git/refs") == 2
+    assert repositorio.contar("POST", "git/commits") == 2
+    assert repositorio.contar("POST", "git/blobs") == 1
+
+
+def test_reemplazar_deja_un_unico_commit_en_la_rama(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    principal = repositorio.cabeza
+    publicador = nuevo_publicador(servidor, rama="historico")
+    publicador.agregar("historico", escribir(tmp_path, "glofas_historico.nc", b"historico 1"))
+    publicador.agregar("historico", escribir(tmp_path, "viejo.nc", b"se quitara"))
+
+    # La rama no existe: se crea
+    primero = publicador.publicar("Histórico 1", reemplazar=True)
+    assert repositorio.ramas["historico"] == primero
+    assert repositorio.contar("POST", "git/refs") == 1
+
+    # Cada publicación reemplaza la rama con force por un commit sin padres con solo estos archivos:
+    # viejo.nc, que ya no se publica, desaparece
+    publicador.agregar("historico", escribir(tmp_path, "glofas_historico.nc", b"historico 2"))
+    segundo = publicador.publicar("Histórico 2", reemplazar=True)
+    assert repositorio.ramas["historico"] == segundo
+    assert repositorio.commits[segundo]["padres"] == []
+    assert repositorio.archivos("historico") == ["historico/glofas_historico.nc"]
+    assert repositorio.contenido("historico/glofas_historico.nc", segundo) == b"historico 2"
+    assert repositorio.contar("PATCH", "git/refs") == 1
+
+    # Sin cambios no se publica
+    publicador.agregar("historico", str(tmp_path / "glofas_historico.nc"))
+    assert publicador.publicar("Histórico 2", reemplazar=True) is None
+    assert repositorio.ramas["historico"] == segundo
+    # La rama principal no se toca
+    assert repositorio.cabeza == principal
+
+
+def test_descargar_de_otra_rama(servidor, tmp_path):
+    repositorio = servidor.repositorio
+    publicador = nuevo_publicador(servidor, rama="historico")
+    destino = str(tmp_path / "historico" / "glofas_historico.nc")
+
+    # Sin la rama, o sin el archivo en ella, no hay nada que descargar
+    assert publicador.descargar("historico/glofas_historico.nc", destino) is False
+    publicador.agregar("historico", escribir(tmp_path, "glofas_historico.nc", b"historico"))
+    publicador.publicar("Histórico", reemplazar=True)
+    assert publicador.descargar("historico/otro.nc", destino) is False
+
+    assert publicador.descargar("historico/glofas_historico.nc", destino) is True
+    with open(destino, "rb") as archivo:
+        assert archivo.read() == b"historico"
+    # Se lee de la rama del publicador, no de la principal
+    assert nuevo_publicador(servidor).descargar("historico/glofas_historico.nc", destino) is False
+
+    repositorio.fallas = {("GET", "contents/"): [401]}
+    with pytest.raises(ErrorPublicacion):
+        publicador.descargar("historico/glofas_historico.nc", destino)
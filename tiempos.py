@@ -0,0 +1,51 @@
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+
+class Cronometro:
+    """Acumula la duración de cada etapa de un proceso (también desde varios hilos)"""
+
+    def __init__(self):
+        self.etapas = {}
+        self._lock = threading.Lock()
+        self.inicio = datetime.now(timezone.utc)
+        self._inicio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                total, veces = self.etapas.get(nombre, (0.0, 0))
+                self.etapas[nombre] = (total + duracion, veces + 1)
+
+    def resumen(self):
+        with self._lock:
+            return {
+                nombre: {"total_s": round(total, 4), "veces": veces}
+                for nombre, (total, veces) in self.etapas.items()
+            }
+
+    def guardar(self, ruta, **datos):
+        """Escribe un reporte JSON con la duración total y la de cada etapa, más los datos indicados"""
+        reporte = {
+            **datos,
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "duracion_total_s": round(time.perf_counter() - self._inicio, 4),
+            "etapas": self.resumen(),
+        }
+        with open(ruta, "w") as archivo:
+            json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+        print(f"Reporte de tiempos: {ruta}")
+        return ruta
+
+    def imprimir(self):
+        print("Tiempos por etapa:")
+        for nombre, datos in self.resumen().items():
+            print(f"  {nombre:<24} {datos['total_s']:>9.3f} s  ({datos['veces']} veces)")